@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from config import *
+
+_FILENAME = re.compile(r"^([0-9a-f]{32})\.docx$")
+
+# 访问时间的最小更新间隔, 避免每次下载都写库
+_TOUCH_INTERVAL = 60
+
+
+class ArtifactStore:
+    """
+    Word文档存储: 以渲染内容的哈希命名, 相同文档只存一份, 按哈希前缀分两级子目录存放
+    """
+
+    def __init__(self, root: str, db_path: str = artifact_db_path, ttl: float = artifact_ttl,
+                 max_bytes: int = artifact_max_bytes):
+        self.root = root
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None or self._conn_pid != os.getpid():
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=5.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS artifacts (
+                    hash TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_artifacts_last_access ON artifacts (last_access)")
+            conn.commit()
+            self._conn = conn
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    @staticmethod
+    def content_hash(original_text: str, translation: str, vocabulary: list) -> str:
+        payload = json.dumps([original_text, translation, vocabulary], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+    @staticmethod
+    def filename(digest: str) -> str:
+        return f"{digest}.docx"
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4], self.filename(digest))
+
+    def lookup(self, digest: str):
+        """
+        返回(路径, os.stat结果), 记录不存在或文件已丢失时返回None
+        """
+        with self._lock:
+            row = self._db().execute(
+                "SELECT last_access FROM artifacts WHERE hash = ?", (digest,)
+            ).fetchone()
+            if row is None:
+                return None
+            path = self.path(digest)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                self._db().execute("DELETE FROM artifacts WHERE hash = ?", (digest,))
+                self._db().commit()
+                return None
+            now = time.time()
+            if now - row[0] > _TOUCH_INTERVAL:
+                self._db().execute("UPDATE artifacts SET last_access = ? WHERE hash = ?", (now, digest))
+                self._db().commit()
+            return path, stat
+
+    def resolve(self, filename: str):
+        match = _FILENAME.match(filename)
+        return self.lookup(match.group(1)) if match else None
+
+    def staging_path(self, digest: str) -> str:
+        """
+        渲染用的临时文件路径, 写完后由commit原子地改名为正式路径
+        """
+        path = self.path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+    def commit(self, digest: str, staging_path: str):
+        path = self.path(digest)
+        os.replace(staging_path, path)
+        now = time.time()
+        with self._lock:
+            self._db().execute(
+                "INSERT OR REPLACE INTO artifacts (hash, size, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (digest, os.path.getsize(path), now, now)
+            )
+            self._db().commit()
+
+    def sweep(self, ttl: float = None, max_bytes: int = None, batch: int = 500) -> dict:
+        """
+        清理过期文档, 再按最近访问时间淘汰直到总大小不超过配额
+
+        每批只在选出并删除记录时持锁, 删除文件在锁外进行, 大量淘汰时不阻塞下载和渲染;
+        记录删除后、文件删除前被重新渲染的文档, 下次lookup发现文件丢失会删除记录并重新渲染
+        """
+        ttl = self.ttl if ttl is None else ttl
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        cutoff = time.time() - ttl
+        removed, freed = 0, 0
+        while True:
+            with self._lock:
+                conn = self._db()
+                victims = conn.execute(
+                    "SELECT hash, size FROM artifacts WHERE last_access < ? LIMIT ?", (cutoff, batch)
+                ).fetchall()
+                if not victims:
+                    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM artifacts").fetchone()[0]
+                    if total > max_bytes:
+                        for digest, size in conn.execute(
+                            "SELECT hash, size FROM artifacts ORDER BY last_access LIMIT ?", (batch,)
+                        ):
+                            if total <= max_bytes:
+                                break
+                            victims.append((digest, size))
+                            total -= size
+                if not victims:
+                    break
+                conn.executemany("DELETE FROM artifacts WHERE hash = ?", [(digest,) for digest, _ in victims])
+                conn.commit()
+
+            for digest, size in victims:
+                try:
+                    os.remove(self.path(digest))
+                except FileNotFoundError:
+                    pass
+                removed += 1
+                freed += size
+        return {"removed": removed, "freed_bytes": freed}
+
+    def close(self):
+        """
+        关闭本进程的数据库连接(fork前调用), 内存中的数据保留, 下次访问时重新连接
+        """
+        if self._conn is not None and self._conn_pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+        self._conn_pid = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, total = self._db().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM artifacts"
+            ).fetchone()
+        return {"documents": count, "total_bytes": total, "max_bytes": self.max_bytes, "ttl": self.ttl}
@@ -0,0 +1,81 @@
+import json
+
+from config import *
+from segmenter import estimate_tokens
+
+
+def pack_items(items: list, item_tokens: int = batch_pack_item_tokens, pack_tokens: int = batch_pack_tokens,
+               max_items: int = batch_pack_max_items):
+    """
+    把短文本拼成若干组共享一个prompt, items为[(下标, 原文)]
+
+    返回(拼接组列表, 需要单独翻译的条目列表)
+    """
+    groups, singles = [], []
+    current, current_tokens = [], 0
+    for item in items:
+        tokens = estimate_tokens(item[1])
+        if tokens > item_tokens:
+            singles.append(item)
+            continue
+        if current and (current_tokens + tokens > pack_tokens or len(current) >= max_items):
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(item)
+        current_tokens += tokens
+    if len(current) == 1:
+        # 只剩一条时没必要用批量格式
+        singles.extend(current)
+    elif current:
+        groups.append(current)
+    return groups, singles
+
+
+def build_batch_prompt(texts: list) -> str:
+    items = "\n".join(json.dumps({"id": i, "text": text}, ensure_ascii=False) for i, text in enumerate(texts))
+    return f"""
+        请将以下多段英文文本分别翻译成中文，并分别提取每段中重要的专业词汇。
+        每行是一段，id为段落编号：
+{items}
+
+        请严格按照以下JSON格式返回，"items"中每段一项，id与输入一致：
+        {{
+            "items": [
+                {{
+                    "id": 0,
+                    "translation": "中文翻译内容",
+                    "vocabulary": [
+                        {{
+                            "english": "专业词汇1",
+                            "chinese": "中文翻译1",
+                            "explanation": "详细解释1"
+                        }}
+                    ]
+                }}
+            ]
+        }}
+        """
+
+
+def parse_batch_translation(response: str, count: int) -> dict:
+    """
+    解析拼接prompt的响应, 返回{id: {"translation", "vocabulary"}}; 缺失或格式不对的条目不返回
+    """
+    try:
+        items = json.loads(response).get("items", [])
+    except Exception:
+        return {}
+    if not isinstance(items, list):
+        return {}
+
+    results = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        index = item.get("id")
+        if isinstance(index, int) and 0 <= index < count and isinstance(item.get("translation"), str):
+            results[index] = {
+                "translation": item["translation"],
+                "vocabulary": item.get("vocabulary", [])
+            }
+    return results
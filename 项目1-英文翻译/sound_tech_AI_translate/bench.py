@@ -0,0 +1,345 @@
+# bench.py
+"""
+翻译接口压测: 按并发数、请求组合和时长压测/api/v1/translate, 输出RPS和p50/p95/p99延迟,
+结果写成JSON便于不同版本之间对比
+
+    # 连接已在运行的服务
+    python bench.py --url http://localhost:8000 --concurrency 32 --duration 30
+
+    # 离线: 自动启动DeepSeek桩服务和一个使用桩服务的翻译服务(独立临时目录, 缓存为空)
+    python bench.py --launch --llm-latency 0.5 --llm-jitter 0.1 --seed 1 --output results.json
+
+    # 与上次结果对比
+    python bench.py --launch --compare results.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+SHORT_TEXT = ("The sound engineer adjusted the equalizer to reduce feedback "
+              "and improve the clarity of the vocal track.")
+LONG_PARAGRAPH = ("A dynamic microphone converts sound into an electrical signal through electromagnetic "
+                  "induction. Its diaphragm is attached to a coil positioned in the field of a permanent "
+                  "magnet, and the movement of the coil generates a small voltage. Compared with condenser "
+                  "microphones, dynamic models tolerate high sound pressure levels and need no phantom power. ")
+LONG_TEXT = "\n\n".join(LONG_PARAGRAPH * 3 for _ in range(12))
+
+# 非--repeat模式按这些词随机造句: 每句都不同, 整段和分段都不会命中缓存, 与历史句对的相似度也远低于复用/参考阈值
+NOUNS = ("microphone", "preamp", "compressor", "equalizer", "fader", "monitor", "cable", "mixer", "reverb",
+         "delay unit", "gain stage", "signal path", "speaker", "channel strip", "vocal track", "drum kit",
+         "guitar amp", "stage box", "limiter", "phase switch", "diaphragm", "console", "subwoofer",
+         "headphone feed", "noise gate", "patch bay", "converter", "talkback", "crossover", "di box")
+VERBS = ("adjusts", "reduces", "boosts", "routes", "measures", "replaces", "mutes", "records", "filters",
+         "balances", "monitors", "calibrates", "isolates", "doubles", "softens")
+UNIQUE_SHORT_SENTENCES = 1  # 与SHORT_TEXT长度相当
+UNIQUE_LONG_PARAGRAPHS = 12
+UNIQUE_LONG_SENTENCES = 12  # 每段句数, 总长度与LONG_TEXT相当
+
+DEFAULT_MIX = "json_short=6,word_short=2,json_long=1,word_long=1"
+
+
+def parse_mix(mix: str) -> dict:
+    """
+    "json_short=6,word_long=1" -> {"json_short": 6.0, "word_long": 1.0}
+    """
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.strip().partition("=")
+        fmt, _, size = name.partition("_")
+        if fmt not in ("json", "word") or size not in ("short", "long"):
+            raise ValueError(f"未知的请求类型: {name}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return None
+    # 最近秩法
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(samples: list, elapsed: float) -> dict:
+    """
+    samples: [(延迟秒, 是否成功)]
+    """
+    latencies = sorted(latency for latency, ok in samples if ok)
+    errors = sum(1 for _, ok in samples if not ok)
+    summary = {
+        "requests": len(samples),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+    }
+    for name, pct in (("p50", 50), ("p95", 95), ("p99", 99)):
+        value = percentile(latencies, pct)
+        summary[name] = round(value, 4) if value is not None else None
+    summary["mean"] = round(sum(latencies) / len(latencies), 4) if latencies else None
+    summary["max"] = round(latencies[-1], 4) if latencies else None
+    return summary
+
+
+class Benchmark:
+    def __init__(self, url: str, concurrency: int, duration: float, warmup: float, mix: dict,
+                 unique: bool, seed: int, timeout: float):
+        self.url = url.rstrip("/")
+        self.concurrency = concurrency
+        self.duration = duration
+        self.warmup = warmup
+        self.mix = mix
+        self.unique = unique
+        self.rng = random.Random(seed)
+        self.timeout = timeout
+        self.counter = 0
+        self.samples = {name: [] for name in mix}
+        self.error_messages = {}
+
+    def sentence(self) -> str:
+        rng = self.rng
+        subject, target, place = rng.sample(NOUNS, 3)
+        return (f"Take {self.counter}: the {subject} {rng.choice(VERBS)} the {target} by "
+                f"{rng.randint(1, 48)} dB near the {place} at {rng.randint(20, 20000)} Hz.")
+
+    def unique_text(self, size: str) -> str:
+        """
+        每个请求(长文本的每一句)都随机生成, 避免测到的是缓存或翻译记忆命中
+        """
+        if size == "short":
+            return " ".join(self.sentence() for _ in range(UNIQUE_SHORT_SENTENCES))
+        return "\n\n".join(" ".join(self.sentence() for _ in range(UNIQUE_LONG_SENTENCES))
+                            for _ in range(UNIQUE_LONG_PARAGRAPHS))
+
+    def next_request(self) -> tuple:
+        kind = self.rng.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        fmt, _, size = kind.partition("_")
+        self.counter += 1
+        if self.unique:
+            text = self.unique_text(size)
+        else:
+            text = SHORT_TEXT if size == "short" else LONG_TEXT
+        return kind, {"text": text, "output_format": fmt, "include_vocabulary": True}
+
+    async def worker(self, client: httpx.AsyncClient, record_after: float, stop_at: float):
+        while time.perf_counter() < stop_at:
+            kind, payload = self.next_request()
+            start = time.perf_counter()
+            try:
+                response = await client.post(self.url + "/api/v1/translate", json=payload)
+                ok = response.status_code == 200 and response.json().get("success", False)
+                if not ok:
+                    reason = f"HTTP {response.status_code}"
+                else:
+                    reason = None
+            except Exception as e:
+                ok, reason = False, type(e).__name__
+            end = time.perf_counter()
+            if start >= record_after:
+                self.samples[kind].append((end - start, ok))
+                if reason:
+                    self.error_messages[reason] = self.error_messages.get(reason, 0) + 1
+
+    async def run(self) -> dict:
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        async with httpx.AsyncClient(limits=limits, timeout=self.timeout) as client:
+            start = time.perf_counter()
+            record_after = start + self.warmup
+            stop_at = record_after + self.duration
+            await asyncio.gather(*(self.worker(client, record_after, stop_at)
+                                   for _ in range(self.concurrency)))
+            # 最后一批请求在stop_at之后才返回, 按实际结束时间计算
+            elapsed = time.perf_counter() - record_after
+
+        all_samples = [sample for samples in self.samples.values() for sample in samples]
+        return {
+            "overall": summarize(all_samples, elapsed),
+            "by_kind": {kind: summarize(samples, elapsed) for kind, samples in self.samples.items()},
+            "errors": self.error_messages,
+            "elapsed": round(elapsed, 3)
+        }
+
+
+def wait_ready(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"服务未在{timeout}秒内就绪: {url}")
+
+
+def launch(args) -> tuple:
+    """
+    启动桩服务和翻译服务子进程, 返回(进程列表, 工作目录)
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    stub_cmd = [sys.executable, os.path.join(here, "stub_server.py"),
+                "--port", str(args.llm_port), "--latency", str(args.llm_latency),
+                "--jitter", str(args.llm_jitter), "--tail-rate", str(args.llm_tail_rate),
+                "--tail-latency", str(args.llm_tail_latency), "--error-rate", str(args.llm_error_rate)]
+    if args.seed is not None:
+        stub_cmd += ["--seed", str(args.seed)]
+    app_cmd = [sys.executable, os.path.abspath(__file__), "--serve", "--port", str(args.port),
+               "--llm-port", str(args.llm_port), "--workdir", workdir]
+    processes = [subprocess.Popen(stub_cmd, cwd=here)]
+    processes.append(subprocess.Popen(app_cmd, cwd=here))
+    wait_ready(f"http://127.0.0.1:{args.llm_port}/docs")
+    wait_ready(f"http://127.0.0.1:{args.port}/api/v1/cache/stats")
+    print(f"已启动桩服务(:{args.llm_port})和翻译服务(:{args.port}), 工作目录 {workdir}")
+    return processes, workdir
+
+
+def serve(args):
+    """
+    在独立工作目录中运行翻译服务, 上游指向本地桩服务
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, here)
+    os.chdir(args.workdir)
+
+    # 必须在导入llm_client/translate之前修改, 它们在导入时读取配置
+    import config
+    config.llm_backend = "deepseek"
+    config.api_key = "bench"
+    config.deepseek_base_url = f"http://127.0.0.1:{args.llm_port}"
+
+    import uvicorn
+    import translate
+    uvicorn.run(translate.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+def compare(current: dict, baseline: dict):
+    print(f"\n与 {baseline.get('label') or '基线'} 对比:")
+    print(f"{'':<12}{'指标':<8}{'基线':>10}{'本次':>10}{'变化':>10}")
+    kinds = ["overall"] + sorted(current["by_kind"])
+    for kind in kinds:
+        now = current["overall"] if kind == "overall" else current["by_kind"].get(kind)
+        before = baseline["results"]["overall"] if kind == "overall" else baseline["results"]["by_kind"].get(kind)
+        if not now or not before:
+            continue
+        for metric in ("rps", "p50", "p95", "p99"):
+            a, b = before.get(metric), now.get(metric)
+            if a is None or b is None:
+                continue
+            change = f"{(b - a) / a * 100:+.1f}%" if a else "-"
+            print(f"{kind:<12}{metric:<8}{a:>10}{b:>10}{change:>10}")
+
+
+def print_report(results: dict):
+    print(f"\n{'类型':<12}{'请求':>8}{'错误':>6}{'RPS':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    rows = [("overall", results["overall"])] + sorted(results["by_kind"].items())
+    for kind, summary in rows:
+        values = [summary.get(name) for name in ("p50", "p95", "p99", "max")]
+        print(f"{kind:<12}{summary['requests']:>8}{summary['errors']:>6}{summary['rps']:>9}"
+              + "".join(f"{value if value is not None else '-':>9}" for value in values))
+    if results["errors"]:
+        print("错误:", json.dumps(results["errors"], ensure_ascii=False))
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="翻译接口压测")
+    parser.add_argument("--url", default=None, help="被测服务地址, 默认config.base_url; --launch时忽略")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30.0, help="计入统计的压测时长(秒)")
+    parser.add_argument("--warmup", type=float, default=3.0, help="预热时长(秒), 不计入统计")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="请求组合权重, json|word _ short|long")
+    parser.add_argument("--repeat", action="store_true", help="重复使用相同原文(测缓存命中路径)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="单个请求超时(秒)")
+    parser.add_argument("--seed", type=int, default=1, help="请求序列和桩服务延迟的随机种子")
+    parser.add_argument("--output", help="结果写入JSON文件")
+    parser.add_argument("--label", help="写入结果的版本标记")
+    parser.add_argument("--compare", help="与之前的JSON结果对比")
+    # 离线模式
+    parser.add_argument("--launch", action="store_true", help="启动本地桩服务和翻译服务")
+    parser.add_argument("--port", type=int, default=8100, help="--launch时翻译服务端口")
+    parser.add_argument("--llm-port", type=int, default=9001, help="--launch时桩服务端口")
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--llm-jitter", type=float, default=0.1)
+    parser.add_argument("--llm-tail-rate", type=float, default=0.0)
+    parser.add_argument("--llm-tail-latency", type=float, default=0.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    processes, workdir = [], None
+    if args.launch:
+        processes, workdir = launch(args)
+        url = f"http://127.0.0.1:{args.port}"
+    else:
+        url = args.url
+        if url is None:
+            from config import base_url
+            url = base_url
+
+    try:
+        benchmark = Benchmark(url, args.concurrency, args.duration, args.warmup, parse_mix(args.mix),
+                              unique=not args.repeat, seed=args.seed, timeout=args.timeout)
+        print(f"压测 {url}: 并发{args.concurrency}, 预热{args.warmup}s, 时长{args.duration}s, 组合 {args.mix}")
+        results = asyncio.run(benchmark.run())
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(results)
+    report = {
+        "label": args.label,
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "settings": {
+            "url": url,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "mix": args.mix,
+            "repeat": args.repeat,
+            "seed": args.seed,
+            "stub": {
+                "latency": args.llm_latency, "jitter": args.llm_jitter, "tail_rate": args.llm_tail_rate,
+                "tail_latency": args.llm_tail_latency, "error_rate": args.llm_error_rate
+            } if args.launch else None
+        },
+        "results": results
+    }
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(results, json.load(f))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
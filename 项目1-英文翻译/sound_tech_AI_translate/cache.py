@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from config import *
+
+
+def normalize_text(text: str) -> str:
+    """
+    归一化原文: 统一Unicode形式和换行, 折叠行内多余空白
+    """
+    text = unicodedata.normalize("NFC", text).replace("\r\n", "\n").replace("\r", "\n")
+    lines = [re.sub(r"[ \t\u00a0]+", " ", line).strip() for line in text.split("\n")]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+
+class TranslationCache:
+    """
+    翻译结果缓存: 进程内LRU + SQLite持久层, 以归一化原文和include_vocabulary的哈希为键
+    """
+
+    # 每写入多少条检查一次持久层的过期和容量
+    PRUNE_EVERY = 256
+
+    def __init__(self, db_path: str = cache_db_path, memory_entries: int = cache_memory_entries,
+                 disk_entries: int = cache_disk_entries, ttl: float = cache_ttl):
+        self.db_path = db_path
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()  # 内存层, 只在短时间内持有, 事件循环中的peek不会等待数据库
+        self._db_lock = threading.Lock()  # 数据库连接
+        self._conn = None
+        self._conn_pid = None
+        self._writes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(text: str, include_vocabulary: bool) -> str:
+        raw = f"{int(include_vocabulary)}\x00{normalize_text(text)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _db(self) -> sqlite3.Connection:
+        # fork出的worker各自建立连接, 不共享父进程的句柄
+        if self._conn is None or self._conn_pid != os.getpid():
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=5.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS translations (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_translations_created ON translations (created_at)")
+            conn.commit()
+            self._conn = conn
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def peek(self, key: str):
+        """
+        只查内存层, 不访问SQLite, 可以直接在事件循环中调用; 未命中时不计入misses(随后会调用get)
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None or now - entry[1] >= self.ttl:
+                return None
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return entry[0]
+
+    def put_memory(self, key: str, value: dict):
+        """
+        只写内存层, 立即对本进程可见; 持久层由set在后台线程写入
+        """
+        with self._lock:
+            self._remember(key, value, time.time())
+
+    def get(self, key: str):
+        """
+        先查内存层再查SQLite, 会访问磁盘, 在事件循环中应放到线程池执行
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if now - created_at < self.ttl:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return value
+                del self._memory[key]
+
+        with self._db_lock:
+            row = self._db().execute(
+                "SELECT value, created_at FROM translations WHERE key = ?", (key,)
+            ).fetchone()
+        with self._lock:
+            if row is not None and now - row[1] < self.ttl:
+                value = json.loads(row[0])
+                self._remember(key, value, row[1])
+                self.disk_hits += 1
+                return value
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: dict):
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+        with self._db_lock:
+            conn = self._db()
+            conn.execute(
+                "INSERT OR REPLACE INTO translations (key, value, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now)
+            )
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                self._prune(conn, now)
+            conn.commit()
+
+    def _remember(self, key, value, created_at):
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _prune(self, conn, now):
+        conn.execute("DELETE FROM translations WHERE created_at < ?", (now - self.ttl,))
+        conn.execute('''
+            DELETE FROM translations WHERE key IN (
+                SELECT key FROM translations ORDER BY created_at DESC LIMIT -1 OFFSET ?
+            )
+        ''', (self.disk_entries,))
+
+    def warm(self, limit: int = None) -> int:
+        """
+        从持久层载入最近写入的条目到内存层, 返回载入条数
+        """
+        limit = self.memory_entries if limit is None else min(limit, self.memory_entries)
+        now = time.time()
+        with self._db_lock:
+            rows = self._db().execute(
+                "SELECT key, value, created_at FROM translations WHERE created_at >= ? "
+                "ORDER BY created_at DESC LIMIT ?", (now - self.ttl, limit)
+            ).fetchall()
+        with self._lock:
+            # 按时间从旧到新放入, 最新的在LRU末尾
+            for key, value, created_at in reversed(rows):
+                if key not in self._memory:
+                    self._remember(key, json.loads(value), created_at)
+        return len(rows)
+
+    def close(self):
+        """
+        关闭本进程的数据库连接(fork前调用), 内存中的数据保留, 下次访问时重新连接
+        """
+        if self._conn is not None and self._conn_pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+        self._conn_pid = None
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_entries": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+        }
@@ -1,6 +1,7 @@
 # test_translation.py
 import requests
 import json
+import time
 
 # 测试翻译API
 def test_translation(text,style='json'):
@@ -15,6 +16,12 @@ def test_translation(text,style='json'):
     
     try:
         response = requests.post(url, json=test_data)
+        if style == 'word_inline' and response.status_code == 200:
+            # 响应体就是Word文档, 不需要再请求下载链接
+            with open("test_translation.docx", "wb") as f:
+                f.write(response.content)
+            print("Word文档已保存: test_translation.docx")
+            return
         result = response.json()
         
         print("API响应:")
@@ -33,12 +40,73 @@ def test_translation(text,style='json'):
     except Exception as e:
         print(f"测试失败: {e}")
 
+# 流式消费SSE, 返回(首字节耗时, 首段译文耗时, 总耗时)
+def test_translation_stream(text, style='json', verbose=True, bypass_cache=False):
+    url = "http://localhost:8000/api/v1/translate/stream"
+
+    test_data = {
+        "text": text,
+        "output_format": style,
+        "include_vocabulary": True,
+        "bypass_cache": bypass_cache
+    }
+
+    start = time.perf_counter()
+    ttfb = first_delta = None
+    event = None
+    try:
+        with requests.post(url, json=test_data, stream=True) as response:
+            for line in response.iter_lines(decode_unicode=True):
+                if ttfb is None:
+                    ttfb = time.perf_counter() - start
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    data = json.loads(line[5:])
+                    if event == "translation":
+                        if first_delta is None:
+                            first_delta = time.perf_counter() - start
+                        if verbose:
+                            print(data["delta"], end="", flush=True)
+                    elif verbose:
+                        print(f"\n[{event}] " + json.dumps(data, ensure_ascii=False))
+    except Exception as e:
+        print(f"测试失败: {e}")
+
+    total = time.perf_counter() - start
+    return ttfb, first_delta, total
+
+# 对比阻塞接口和流式接口的首字节耗时; 两次请求都跳过缓存读取, 否则第二次测到的是缓存命中
+def compare_ttfb(text):
+    start = time.perf_counter()
+    requests.post("http://localhost:8000/api/v1/translate",
+                  json={"text": text, "output_format": "json", "include_vocabulary": True, "bypass_cache": True})
+    blocking = time.perf_counter() - start
+
+    ttfb, first_delta, total = test_translation_stream(text, verbose=False, bypass_cache=True)
+
+    print(f"阻塞接口: 首字节 {blocking:.3f}s")
+    if first_delta is not None:
+        print(f"流式接口: 首字节 {ttfb:.3f}s, 首段译文 {first_delta:.3f}s, 总耗时 {total:.3f}s")
+    else:
+        print(f"流式接口: 未收到译文, 总耗时 {total:.3f}s")
+
 if __name__ == "__main__":
     while True:
         text = input("请输入要翻译的文本（输入'exit'退出）：")
-        style = input("需要Word文档或json输出（输入'word or json'）：")
-        style = 'word' if style.lower() == 'word' else 'json' 
+        style = input("需要Word文档、json或流式输出（输入'word or inline or json or stream'，输入'ttfb'对比首字节耗时）：")
         if text.lower() == 'exit':
             break
+        if style.lower() == 'stream':
+            ttfb, first_delta, total = test_translation_stream(text=text)
+            print(f"\n首字节 {ttfb}s, 首段译文 {first_delta}s, 总耗时 {total:.3f}s")
+            continue
+        if style.lower() == 'ttfb':
+            compare_ttfb(text)
+            continue
+        if style.lower() == 'inline':
+            test_translation(text=text, style='word_inline')
+            continue
+        style = 'word' if style.lower() == 'word' else 'json' 
         test_translation(text=text,style=style)
     
\ No newline at end of file
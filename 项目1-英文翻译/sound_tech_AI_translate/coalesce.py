@@ -0,0 +1,43 @@
+import asyncio
+
+
+class SingleFlight:
+    """
+    合并同键的并发调用: 同一键在途时, 后来者等待同一个结果, 只产生一次上游调用
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def inflight(self, key) -> bool:
+        return key in self._inflight
+
+    async def do(self, key, fn):
+        """
+        执行fn()(返回协程)并共享结果; 某个等待者被取消不会取消共享的调用
+        """
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._finish(key, f))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(future)
+
+    def _finish(self, key, future):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        # 所有等待者都已取消时, 避免"exception was never retrieved"告警
+        if not future.cancelled():
+            future.exception()
+
+    def stats(self) -> dict:
+        return {
+            "inflight": len(self._inflight),
+            "calls": self.calls,
+            "coalesced": self.coalesced
+        }
@@ -7,4 +7,101 @@ translate_url="/api/v1/translate"
 
 #服务器
 host="0.0.0.0"
-port=8000
\ No newline at end of file
+port=8000
+
+#大模型上游
+llm_backend="deepseek"  # "deepseek"(异步连接池) / "sdk"(旧版同步SDK, 放到线程池执行) / "stub"(离线桩) / "router"(多后端路由)
+llm_model="deepseek-chat"
+deepseek_base_url="https://api.deepseek.com"
+llm_pool_size=200  # 每个worker的最大连接数, 即同时在途的上游请求数
+llm_keepalive_connections=50  # 保持长连接的空闲连接数
+llm_keepalive_expiry=30.0  # 空闲连接保留秒数
+llm_connect_timeout=5.0
+llm_read_timeout=120.0
+llm_pool_timeout=30.0  # 等待连接池空位的最长秒数
+
+#多后端路由(llm_backend="router"时使用), 每项一个API key/接入点; base_url可指向stub_server.py
+llm_backends=[
+    {"name": "deepseek-1", "api_key": api_key, "base_url": deepseek_base_url},
+]
+llm_hedge=True  # 主后端超过其p95延迟仍未返回时, 向次优后端再发一次, 取先返回的结果
+llm_hedge_min_delay=0.5  # 对冲等待的下限(秒)
+llm_hedge_budget=0.1  # 对冲请求最多占总请求的比例, 避免过载时放大流量
+llm_ewma_alpha=0.2  # 后端延迟/错误率EWMA的平滑系数
+llm_explore_rate=0.05  # 随机发给非最优后端的比例, 用于重新探测其延迟
+
+#离线桩(llm_backend="stub"时使用, 用于离线压测吞吐)
+stub_latency=1.0  # 模拟上游耗时(秒)
+
+#翻译结果缓存
+cache_enabled=True
+cache_db_path="cache/translation_cache.db"  # SQLite持久层, 多个uvicorn worker共享
+cache_memory_entries=2048  # 进程内LRU条数上限
+cache_disk_entries=100000  # 持久层条数上限, 超出后淘汰最旧的
+cache_ttl=7 * 24 * 3600  # 过期秒数
+
+#长文档模式
+long_text_threshold_tokens=1500  # 估算token超过该值时自动分段翻译
+long_text_segment_tokens=800  # 每段的token预算
+long_text_concurrency=4  # 单个文档同时在途的分段数
+
+#批量翻译
+batch_max_items=200  # 单次批量请求的最大条数
+batch_concurrency=8  # 单次批量请求同时在途的上游调用数
+batch_pack_item_tokens=60  # 不超过该估算token数的短文本可以拼进同一个prompt
+batch_pack_tokens=800  # 拼接后单个prompt的原文token预算
+batch_pack_max_items=20  # 单个prompt最多拼接的条数
+
+#Word文档渲染
+docx_executor="process"  # "process"(进程池, 不占用事件循环所在进程的GIL) / "thread"(线程池)
+docx_workers=2
+
+#异步导出任务队列
+job_workers=4  # 同时处理的任务数
+job_queue_depth=100  # 排队任务上限, 超出返回429
+job_retention=3600  # 已完成任务保留秒数, 过期后查询返回404
+job_max_wait=60  # 长轮询最多等待秒数
+job_db_path="cache/jobs.db"  # 任务状态, 多个worker共享, 轮询可以落到任意worker
+job_poll_interval=0.5  # 长轮询其他worker的任务时查询数据库的间隔(秒)
+
+#翻译记忆(模糊匹配复用历史句对)
+tm_enabled=True
+tm_db_path="cache/translation_memory.db"
+tm_reference_threshold=0.7  # 相似度不低于该值时把历史句对作为参考放进prompt; 只有归一化后原文完全相同才直接复用译文
+tm_ngram=4  # 字符n-gram长度
+tm_num_perm=32  # MinHash签名长度
+tm_bands=8  # LSH分桶数(每桶tm_num_perm/tm_bands行)
+tm_refresh_interval=5.0  # 多少秒同步一次其他worker写入的句对
+
+#术语表(本地匹配已知专业词汇, 只让模型补充新词)
+glossary_enabled=True
+glossary_db_path="cache/glossary.db"
+glossary_learn=True  # 把模型返回的词汇自动加入术语表
+glossary_refresh_interval=30.0  # 多少秒同步一次其他worker写入的术语
+glossary_rebuild_delay=1.0  # 学到新术语后延迟多少秒在后台重建自动机, 期间的写入合并成一次重建
+
+#下载文件管理
+artifact_db_path="cache/artifacts.db"
+artifact_ttl=7 * 24 * 3600  # 超过该秒数未被访问的文档会被清理
+artifact_max_bytes=2 * 1024 ** 3  # downloads目录总大小上限, 超出后按最近访问时间淘汰
+artifact_sweep_interval=600  # 后台清理间隔(秒)
+artifact_cache_max_age=86400  # 下载响应的Cache-Control max-age
+
+#自适应并发限制(大模型调用前的准入控制)
+limiter_enabled=True
+limiter_algorithm="gradient"  # "gradient"(按延迟梯度调整) / "aimd"(超过目标延迟乘性减, 否则加性增)
+limiter_initial_limit=20
+limiter_min_limit=2
+limiter_max_limit=llm_pool_size
+limiter_max_queue=200  # 等待队列上限, 超出返回429
+limiter_tolerance=1.5  # gradient: 短期延迟超过长期基线的该倍数才开始收缩
+limiter_smoothing=0.2  # gradient: 每次调整的平滑系数
+limiter_latency_target=30.0  # aimd: 目标延迟(秒)
+limiter_backoff=0.9  # 出错或超过目标延迟时的收缩系数
+limiter_initial_rtt=5.0  # 还没有延迟样本时使用的估计值(秒)
+request_timeout=60.0  # 请求默认截止时间(秒), 可用X-Request-Timeout请求头覆盖
+
+#多进程启动(serve.py)
+serve_workers=0  # worker进程数, 0表示CPU核数
+serve_backlog=2048  # 监听队列长度
+serve_preload_cache=True  # fork前把最近的缓存条目载入内存层, 各worker共享
@@ -0,0 +1,167 @@
+import asyncio
+import copy
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from config import *
+
+TABLE_STYLE = 'Light Grid Accent 1'
+
+# 文档用到的样式, 其余样式和latentStyles从模板中删掉以减小每次复制的开销
+_USED_STYLES = {'Normal', 'Title', 'Heading 1', TABLE_STYLE}
+
+# 每个worker进程加载一次的基础模板
+_template = None
+_executor = None
+
+
+def build_template():
+    """
+    加载默认模板并裁剪成只含所需样式的精简模板
+    """
+    # python-docx只在渲染进程中需要, 延迟导入以缩短主进程启动时间
+    from docx import Document
+    from docx.oxml.ns import qn
+
+    doc = Document()
+
+    styles = doc.styles.element
+    by_id = {style.get(qn('w:styleId')): style for style in styles.findall(qn('w:style'))}
+    keep = set()
+
+    def keep_style(style):
+        style_id = style.get(qn('w:styleId'))
+        if style_id in keep:
+            return
+        keep.add(style_id)
+        for tag in ('w:basedOn', 'w:link', 'w:next'):
+            ref = style.find(qn(tag))
+            if ref is not None and ref.get(qn('w:val')) in by_id:
+                keep_style(by_id[ref.get(qn('w:val'))])
+
+    for style in by_id.values():
+        name = style.find(qn('w:name'))
+        if style.get(qn('w:default')) == '1' or (name is not None and name.get(qn('w:val')).lower() in
+                                                 {s.lower() for s in _USED_STYLES}):
+            keep_style(style)
+    for style_id, style in by_id.items():
+        if style_id not in keep:
+            styles.remove(style)
+    latent = styles.find(qn('w:latentStyles'))
+    if latent is not None:
+        styles.remove(latent)
+
+    # stylesWithEffects(约430KB)和缩略图与内容无关, 去掉后保存时不必重复压缩
+    for rel_id, rel in list(doc.part.rels.items()):
+        if rel.reltype.endswith('/stylesWithEffects'):
+            doc.part.drop_rel(rel_id)
+    package_rels = doc.part.package.rels
+    for rel_id, rel in list(package_rels.items()):
+        if rel.reltype.endswith('/metadata/thumbnail'):
+            package_rels.pop(rel_id)
+
+    # 提前解析表格样式, 模板缺样式时在启动阶段就报错
+    doc.styles[TABLE_STYLE]
+    return doc
+
+
+def _init_worker():
+    global _template
+    _template = build_template()
+
+
+def preload_template():
+    """
+    线程池模式下在fork前构建模板, 各worker共享; 进程池模式由子进程自行构建
+    """
+    if docx_executor != "process":
+        _get_template()
+
+
+def _get_template():
+    if _template is None:
+        _init_worker()
+    return _template
+
+
+def render_document(original_text: str, translation: str, vocabulary: list) -> bytes:
+    """
+    基于预加载的模板渲染翻译结果, 返回.docx字节
+    """
+    doc = copy.deepcopy(_get_template())
+
+    # 标题
+    title = doc.add_heading('智能翻译结果', 0)
+    title.alignment = 1  # 居中
+
+    # 添加分割线
+    doc.add_paragraph("=" * 50)
+
+    # 原文部分
+    doc.add_heading('英文原文', level=1)
+    doc.add_paragraph(original_text)
+
+    # 翻译部分
+    doc.add_heading('中文翻译', level=1)
+    doc.add_paragraph(translation)
+
+    # 专业词汇表
+    if vocabulary:
+        doc.add_heading('专业词汇表', level=1)
+
+        rows = [('英文词汇', '中文翻译', '解释')]
+        for vocab in vocabulary:
+            if isinstance(vocab, dict):
+                rows.append((vocab.get('english', ''), vocab.get('chinese', ''), vocab.get('explanation', '')))
+            else:
+                rows.append((str(vocab), '', ''))
+
+        # 一次性创建全部行, 再按行优先顺序填充单元格
+        table = doc.add_table(rows=len(rows), cols=3)
+        table.style = TABLE_STYLE
+        cells = table._cells
+        for i, row in enumerate(rows):
+            for j, value in enumerate(row):
+                cells[i * 3 + j].text = value
+
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def render_to_file(original_text: str, translation: str, vocabulary: list, file_path: str) -> str:
+    """
+    在worker中渲染并写盘, 避免把文档字节传回主进程
+    """
+    data = render_document(original_text, translation, vocabulary)
+    with open(file_path, 'wb') as f:
+        f.write(data)
+    return file_path
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        if docx_executor == "process":
+            # spawn启动, 不fork正在运行事件循环的进程
+            _executor = ProcessPoolExecutor(
+                max_workers=docx_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker
+            )
+        else:
+            _init_worker()
+            _executor = ThreadPoolExecutor(max_workers=docx_workers, thread_name_prefix="docx")
+    return _executor
+
+
+async def run_in_pool(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(get_executor(), fn, *args)
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
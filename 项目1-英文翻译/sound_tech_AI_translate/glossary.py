@@ -0,0 +1,272 @@
+import csv
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+
+from config import *
+
+
+def normalize_term(term: str) -> str:
+    return " ".join(str(term).lower().split())
+
+
+class AhoCorasick:
+    """
+    多模式串匹配自动机, 一次扫描找出文本中出现的全部术语
+    """
+
+    def __init__(self, patterns: list):
+        self.patterns = patterns
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for index, pattern in enumerate(patterns):
+            state = 0
+            for ch in pattern:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = nxt
+            self._out[state].append(index)
+
+        # 按BFS顺序计算失配指针, 并把失配状态的输出并入当前状态
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def search(self, text: str):
+        """
+        产出(起始下标, 结束下标, 模式串序号)
+        """
+        goto, fail, out, patterns = self._goto, self._fail, self._out, self.patterns
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for index in out[state]:
+                yield i - len(patterns[index]) + 1, i + 1, index
+
+
+def _is_boundary(text: str, pos: int) -> bool:
+    return pos < 0 or pos >= len(text) or not text[pos].isalnum()
+
+
+class Glossary:
+    """
+    持久化术语表: 人工导入(curated)的术语优先, 模型返回的词汇作为learned补充
+
+    自动机在后台线程中重建, 建好后整体替换, match()不会等待重建;
+    学到的新术语先落库, 在rebuild_delay秒内的多次写入合并成一次重建
+    """
+
+    def __init__(self, db_path: str = glossary_db_path, refresh_interval: float = glossary_refresh_interval,
+                 rebuild_delay: float = glossary_rebuild_delay):
+        self.db_path = db_path
+        self.refresh_interval = refresh_interval
+        self.rebuild_delay = rebuild_delay
+        self._index = ({}, None)  # (归一化术语 -> 词汇条目, 自动机), 整体替换
+        self._version = None
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()  # 串行化数据库访问和重建
+        self._schedule_lock = threading.Lock()
+        self._pending = None  # 已安排的后台刷新
+        self._pending_force = False
+        self._conn = None
+        self._conn_pid = None
+        self.matched = 0
+        self.learned = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None or self._conn_pid != os.getpid():
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=5.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS terms (
+                    term TEXT PRIMARY KEY,
+                    english TEXT NOT NULL,
+                    chinese TEXT NOT NULL,
+                    explanation TEXT NOT NULL DEFAULT '',
+                    source TEXT NOT NULL DEFAULT 'learned',
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            conn.commit()
+            self._conn = conn
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def refresh(self, force: bool = False):
+        """
+        术语表有变化(包括其他worker写入)时重新载入并重建自动机; 同步执行, 在线程中或fork前调用
+        """
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._last_refresh < self.refresh_interval:
+                return
+            self._last_refresh = now
+            conn = self._db()
+            version = conn.execute("SELECT COUNT(*), MAX(updated_at) FROM terms").fetchone()
+            if not force and version == self._version:
+                return
+            self._version = version
+            terms = {
+                term: {"english": english, "chinese": chinese, "explanation": explanation}
+                for term, english, chinese, explanation in conn.execute(
+                    "SELECT term, english, chinese, explanation FROM terms"
+                )
+            }
+            self._index = (terms, AhoCorasick(list(terms)) if terms else None)
+
+    def _schedule_refresh(self, force: bool, delay: float):
+        """
+        安排一次后台刷新; 已有待执行的刷新时合并进去
+        """
+        with self._schedule_lock:
+            self._pending_force = self._pending_force or force
+            if self._pending is not None:
+                return
+            self._pending = threading.Timer(delay, self._run_scheduled)
+            self._pending.daemon = True
+            self._pending.start()
+
+    def _run_scheduled(self):
+        with self._schedule_lock:
+            force = self._pending_force
+            self._pending = None
+            self._pending_force = False
+        try:
+            self.refresh(force)
+        except Exception as e:
+            print(f"术语表刷新失败: {e}")
+
+    def _maybe_refresh(self):
+        if time.monotonic() - self._last_refresh >= self.refresh_interval:
+            self._schedule_refresh(False, 0)
+
+    def match(self, text: str) -> list:
+        """
+        找出文本中出现的已知术语(整词匹配, 重叠时取最左最长), 按出现顺序返回词汇条目
+        """
+        self._maybe_refresh()
+        terms, matcher = self._index
+        if matcher is None:
+            return []
+
+        lowered = " ".join(text.lower().split())
+        found = []
+        for start, end, index in matcher.search(lowered):
+            if _is_boundary(lowered, start - 1) and _is_boundary(lowered, end):
+                found.append((start, -(end - start), index))
+        found.sort()
+
+        vocabulary, seen, covered = [], set(), -1
+        for start, neg_length, index in found:
+            if start < covered:
+                continue
+            covered = start - neg_length
+            term = matcher.patterns[index]
+            if term not in seen:
+                seen.add(term)
+                vocabulary.append(dict(terms[term]))
+        self.matched += len(vocabulary)
+        return vocabulary
+
+    def _upsert(self, entries: list, source: str, overwrite: bool) -> int:
+        with self._lock:
+            return self._write_terms(entries, source, overwrite)
+
+    def _write_terms(self, entries: list, source: str, overwrite: bool) -> int:
+        conn = self._db()
+        now = time.time()
+        count = 0
+        for entry in entries:
+            if not isinstance(entry, dict):
+                continue
+            english = str(entry.get("english", "")).strip()
+            chinese = str(entry.get("chinese", "")).strip()
+            if not english or not chinese:
+                continue
+            values = (normalize_term(english), english, chinese, str(entry.get("explanation", "")).strip(), source, now)
+            if overwrite:
+                cursor = conn.execute(
+                    '''INSERT OR REPLACE INTO terms (term, english, chinese, explanation, source, updated_at)
+                       VALUES (?, ?, ?, ?, ?, ?)''', values
+                )
+            else:
+                cursor = conn.execute(
+                    '''INSERT OR IGNORE INTO terms (term, english, chinese, explanation, source, updated_at)
+                       VALUES (?, ?, ?, ?, ?, ?)''', values
+                )
+            count += cursor.rowcount
+        conn.commit()
+        return count
+
+    def learn(self, vocabulary: list) -> int:
+        """
+        收录模型返回的新词汇, 已有术语(尤其是人工导入的)不会被覆盖; 自动机延迟到后台重建
+        """
+        count = self._upsert(vocabulary, "learned", overwrite=False)
+        if count:
+            self.learned += count
+            self._schedule_refresh(True, self.rebuild_delay)
+        return count
+
+    def import_terms(self, entries: list, overwrite: bool = True) -> int:
+        """
+        导入人工整理的术语, 默认覆盖同名术语; 返回前重建自动机
+        """
+        count = self._upsert(entries, "curated", overwrite)
+        if count:
+            self.refresh(force=True)
+        return count
+
+    def import_csv(self, path: str, overwrite: bool = True) -> int:
+        """
+        从CSV导入术语, 表头需包含english和chinese, explanation可选
+        """
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            return self.import_terms(list(csv.DictReader(f)), overwrite)
+
+    def close(self):
+        """
+        关闭本进程的数据库连接(fork前调用), 内存中的数据保留, 下次访问时重新连接
+        """
+        if self._conn is not None and self._conn_pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+        self._conn_pid = None
+
+    def stats(self) -> dict:
+        self._maybe_refresh()
+        return {
+            "terms": len(self._index[0]),
+            "matched": self.matched,
+            "learned": self.learned
+        }
+
+
+if __name__ == "__main__":
+    # python glossary.py terms.csv [terms2.csv ...]
+    glossary = Glossary()
+    for path in sys.argv[1:]:
+        print(f"{path}: 导入{glossary.import_csv(path)}条术语")
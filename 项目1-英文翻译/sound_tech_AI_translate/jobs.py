@@ -0,0 +1,325 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from config import *
+
+
+class QueueFullError(Exception):
+    """任务队列已满"""
+
+
+class Job:
+    def __init__(self, payload):
+        self.id = uuid.uuid4().hex
+        self.payload = payload
+        self.status = "queued"  # queued / running / succeeded / failed
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.finished = asyncio.Event()
+
+    def to_dict(self) -> dict:
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+        if self.status == "succeeded":
+            data["result"] = self.result
+        elif self.status == "failed":
+            data["error"] = self.error
+        return data
+
+
+class JobStore:
+    """
+    任务状态持久层: 多进程部署时任务可能由其他worker执行, 查询统一读SQLite
+    """
+
+    def __init__(self, db_path: str = job_db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None or self._conn_pid != os.getpid():
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=5.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_finished_at ON jobs (finished_at)")
+            conn.commit()
+            self._conn = conn
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def create(self, job: Job, expired_before: float):
+        """
+        写入新任务, 顺便删除expired_before之前结束的任务
+        """
+        with self._lock:
+            conn = self._db()
+            conn.execute("DELETE FROM jobs WHERE finished_at < ?", (expired_before,))
+            conn.execute(
+                "INSERT INTO jobs (id, status, created_at) VALUES (?, ?, ?)",
+                (job.id, job.status, job.created_at)
+            )
+            conn.commit()
+
+    def save(self, job: Job):
+        result = json.dumps(job.result, ensure_ascii=False) if job.result is not None else None
+        with self._lock:
+            conn = self._db()
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, started_at = ?, finished_at = ? WHERE id = ?",
+                (job.status, result, job.error, job.started_at, job.finished_at, job.id)
+            )
+            conn.commit()
+
+    def load(self, job_id: str, expired_before: float):
+        """
+        返回任务的to_dict()格式, 不存在或已过期时返回None
+        """
+        with self._lock:
+            row = self._db().execute(
+                '''SELECT status, result, error, created_at, started_at, finished_at FROM jobs
+                   WHERE id = ? AND (finished_at IS NULL OR finished_at >= ?)''',
+                (job_id, expired_before)
+            ).fetchone()
+        if row is None:
+            return None
+        status, result, error, created_at, started_at, finished_at = row
+        data = {
+            "job_id": job_id,
+            "status": status,
+            "created_at": created_at,
+            "started_at": started_at,
+            "finished_at": finished_at
+        }
+        if status == "succeeded":
+            data["result"] = json.loads(result)
+        elif status == "failed":
+            data["error"] = error
+        return data
+
+    def close(self):
+        """
+        关闭本进程的数据库连接(fork前调用)
+        """
+        if self._conn is not None and self._conn_pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+        self._conn_pid = None
+
+
+class _Samples:
+    """
+    最近N个耗时样本, 用于输出均值和分位数
+    """
+
+    def __init__(self, size: int = 1000):
+        self._values = deque(maxlen=size)
+        self.count = 0
+
+    def add(self, value: float):
+        self._values.append(value)
+        self.count += 1
+
+    def summary(self) -> dict:
+        values = sorted(self._values)
+        if not values:
+            return {"count": self.count, "avg": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+
+        def pct(p):
+            return values[min(len(values) - 1, int(p * len(values)))]
+
+        return {
+            "count": self.count,
+            "avg": sum(values) / len(values),
+            "p50": pct(0.50),
+            "p95": pct(0.95),
+            "max": values[-1]
+        }
+
+
+class JobQueue:
+    """
+    有界任务队列: 固定数量的worker协程消费, 队列满时拒绝新任务
+
+    队列和执行都在本进程内; 任务状态同时写入JobStore, 轮询请求落到其他worker进程时从数据库读取.
+    状态写入经单线程执行器按提交顺序落盘, 不阻塞事件循环
+    """
+
+    def __init__(self, handler, store: JobStore = None, workers: int = job_workers,
+                 max_depth: int = job_queue_depth, retention: float = job_retention,
+                 poll_interval: float = job_poll_interval):
+        self.handler = handler
+        self.store = store
+        self.workers = workers
+        self.max_depth = max_depth
+        self.retention = retention
+        self.poll_interval = poll_interval
+        self._queue = None
+        self._tasks = []
+        self._jobs = {}
+        self._writer = None
+        self.running = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.queue_wait = _Samples()
+        self.service_time = _Samples()
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_depth)
+        if self.store is not None:
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-store")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._writer is not None:
+            await asyncio.to_thread(self._writer.shutdown, True)
+            self._writer = None
+
+    def _write(self, name: str, *args):
+        """
+        把JobStore的写操作排入单线程执行器; 未配置store时返回已完成的future
+        """
+        loop = asyncio.get_running_loop()
+        if self._writer is None:
+            future = loop.create_future()
+            future.set_result(None)
+            return future
+        return loop.run_in_executor(self._writer, getattr(self.store, name), *args)
+
+    async def submit(self, payload) -> Job:
+        self._purge()
+        if self._queue.full():
+            self.rejected += 1
+            raise QueueFullError(f"任务队列已满({self.max_depth})")
+        job = Job(payload)
+        # 先排入写入, 再入队: 单线程执行器保证建档先于worker的状态更新落盘
+        created = self._write("create", job, time.time() - self.retention)
+        self._queue.put_nowait(job)
+        self._jobs[job.id] = job
+        self.submitted += 1
+        await created
+        return job
+
+    async def status(self, job_id: str, wait: float = 0):
+        """
+        返回任务的to_dict(), 不存在或已过期时返回None; wait>0时长轮询到任务结束或超时.
+        本进程的任务等待事件, 其他worker的任务按poll_interval轮询数据库
+        """
+        job = self._jobs.get(job_id)
+        if job is not None:
+            await self.wait(job, wait)
+            return job.to_dict()
+        if self.store is None:
+            return None
+        deadline = time.monotonic() + wait
+        while True:
+            data = await asyncio.to_thread(self.store.load, job_id, time.time() - self.retention)
+            remaining = deadline - time.monotonic()
+            if data is None or data["status"] in ("succeeded", "failed") or remaining <= 0:
+                return data
+            await asyncio.sleep(min(self.poll_interval, remaining))
+
+    async def wait(self, job: Job, timeout: float):
+        """
+        长轮询: 等到任务结束或超时
+        """
+        if timeout > 0 and not job.finished.is_set():
+            try:
+                await asyncio.wait_for(job.finished.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return job
+
+    def retry_after(self) -> int:
+        """
+        按当前服务耗时估算队列腾出空位所需秒数
+        """
+        avg = self.service_time.summary()["avg"] or 1.0
+        return max(1, int(avg * self._queue.qsize() / max(1, self.workers)))
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            job.started_at = time.time()
+            job.status = "running"
+            self.running += 1
+            self.queue_wait.add(job.started_at - job.created_at)
+            try:
+                await self._write("save", job)
+                job.result = await self.handler(job.payload)
+                job.status = "succeeded"
+                self.succeeded += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                job.error = str(e)
+                job.status = "failed"
+                self.failed += 1
+            finally:
+                job.finished_at = time.time()
+                self.running -= 1
+                self.service_time.add(job.finished_at - job.started_at)
+                # 结果落盘后再通知, 此时其他worker也能查到最终状态
+                try:
+                    await self._write("save", job)
+                except Exception as e:
+                    print(f"任务状态写入失败: {e}")
+                job.finished.set()
+                self._queue.task_done()
+
+    def _purge(self):
+        deadline = time.time() - self.retention
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and job.finished_at < deadline]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_depth": self.max_depth,
+            "running": self.running,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "queue_wait_seconds": self.queue_wait.summary(),
+            "service_time_seconds": self.service_time.summary()
+        }
@@ -0,0 +1,165 @@
+import asyncio
+import contextvars
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from config import *
+from llm_client import is_overload
+
+# 当前请求的截止时间(time.monotonic()), 由接口层设置
+request_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+
+class OverloadError(Exception):
+    """过载拒绝, 接口层转换为429/503和Retry-After"""
+
+    def __init__(self, message: str, status_code: int, retry_after: float):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class AdaptiveLimiter:
+    """
+    自适应并发限制: 根据上游延迟动态调整同时在途的调用数,
+    超出限制的请求进入有界等待队列, 预计赶不上截止时间的请求直接拒绝
+    """
+
+    def __init__(self, algorithm: str = limiter_algorithm, initial_limit: int = limiter_initial_limit,
+                 min_limit: int = limiter_min_limit, max_limit: int = limiter_max_limit,
+                 max_queue: int = limiter_max_queue):
+        if algorithm not in ("gradient", "aimd"):
+            raise ValueError(f"未知的limiter_algorithm: {algorithm}")
+        self.algorithm = algorithm
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.inflight = 0
+        self._waiters = deque()
+        self.rtt_short = None  # 近期延迟EWMA
+        self.rtt_long = None  # 长期延迟基线EWMA
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_deadline = 0
+        self.queue_timeouts = 0
+        self.errors = 0
+
+    def _rtt(self) -> float:
+        return self.rtt_short if self.rtt_short is not None else limiter_initial_rtt
+
+    def _capacity(self) -> int:
+        return max(1, int(self.limit))
+
+    async def acquire(self, deadline: float = None):
+        if self.inflight < self._capacity() and not self._waiters:
+            self.inflight += 1
+            self.admitted += 1
+            return
+
+        rtt = self._rtt()
+        # 按当前吞吐(limit/rtt)估算排到自己所需时间
+        expected_wait = (len(self._waiters) + 1) * rtt / self._capacity()
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise OverloadError("上游繁忙, 等待队列已满", 429, expected_wait)
+        now = time.monotonic()
+        if deadline is not None and now + expected_wait + rtt > deadline:
+            self.rejected_deadline += 1
+            raise OverloadError("上游繁忙, 预计无法在截止时间前完成", 503, expected_wait)
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            timeout = None if deadline is None else max(0.0, deadline - now - rtt)
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.queue_timeouts += 1
+            raise OverloadError("上游繁忙, 排队超时", 503, rtt)
+        except asyncio.CancelledError:
+            # 已被放行但调用方取消了, 归还名额
+            if future.done() and not future.cancelled():
+                self.release(None, True)
+            raise
+        finally:
+            try:
+                self._waiters.remove(future)
+            except ValueError:
+                pass
+
+    def release(self, latency: float = None, ok: bool = True):
+        self.inflight -= 1
+        if not ok:
+            self.errors += 1
+            self.limit = max(self.min_limit, self.limit * limiter_backoff)
+        elif latency is not None:
+            self._update(latency)
+        self._drain()
+
+    def _update(self, latency: float):
+        if self.rtt_short is None:
+            self.rtt_short = self.rtt_long = latency
+        else:
+            self.rtt_short += 0.2 * (latency - self.rtt_short)
+            self.rtt_long += 0.01 * (latency - self.rtt_long)
+            # 延迟长期回落时让基线尽快跟上
+            if self.rtt_long > 2 * self.rtt_short:
+                self.rtt_long *= 0.95
+
+        if self.algorithm == "aimd":
+            if latency > limiter_latency_target:
+                limit = self.limit * limiter_backoff
+            elif self.inflight * 2 >= self.limit:
+                limit = self.limit + 1
+            else:
+                limit = self.limit
+        else:
+            gradient = max(0.5, min(1.0, limiter_tolerance * self.rtt_long / self.rtt_short))
+            new_limit = self.limit * gradient + math.sqrt(self.limit)
+            limit = self.limit * (1 - limiter_smoothing) + new_limit * limiter_smoothing
+        self.limit = min(self.max_limit, max(self.min_limit, limit))
+
+    def _drain(self):
+        while self._waiters and self.inflight < self._capacity():
+            future = self._waiters.popleft()
+            if not future.done():
+                self.inflight += 1
+                self.admitted += 1
+                future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, deadline: float = None):
+        """
+        占用一个名额执行上游调用, 成功时用耗时调整限制;
+        超时、429和5xx视为过载信号收缩限制, 其他异常(4xx、解析失败等)只归还名额
+        """
+        await self.acquire(deadline)
+        start = time.monotonic()
+        latency, ok = None, True
+        try:
+            yield
+            latency = time.monotonic() - start
+        except Exception as e:
+            ok = not is_overload(e)
+            raise
+        finally:
+            # 取消或流式响应被客户端断开时只归还名额, 不计入延迟样本
+            self.release(latency, ok)
+
+    def stats(self) -> dict:
+        return {
+            "algorithm": self.algorithm,
+            "limit": round(self.limit, 2),
+            "inflight": self.inflight,
+            "queue_depth": len(self._waiters),
+            "max_queue": self.max_queue,
+            "rtt_short": self.rtt_short,
+            "rtt_long": self.rtt_long,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_deadline": self.rejected_deadline,
+            "queue_timeouts": self.queue_timeouts,
+            "errors": self.errors
+        }
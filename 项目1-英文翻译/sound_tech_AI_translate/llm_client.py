@@ -0,0 +1,176 @@
+import asyncio
+import json
+import re
+
+import httpx
+
+from config import *
+
+
+class LLMError(Exception):
+    """上游大模型调用失败; overload表示上游过载(超时、429、5xx), 并发限制据此收缩"""
+
+    def __init__(self, message: str, overload: bool = False):
+        super().__init__(message)
+        self.overload = overload
+
+
+def is_overload(error: BaseException) -> bool:
+    """
+    超时、429和5xx视为上游过载; 4xx、响应格式错误等是请求本身的问题, 不是过载信号
+    """
+    if isinstance(error, LLMError):
+        return error.overload
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, httpx.TimeoutException)):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return False
+
+
+class DeepSeekAsyncClient:
+    """
+    异步DeepSeek客户端: 复用keep-alive长连接, 调用期间不阻塞事件循环
+    """
+
+    def __init__(self, api_key: str, base_url: str = deepseek_base_url, model: str = llm_model):
+        self.model = model
+        self._http = httpx.AsyncClient(
+            base_url=base_url,
+            headers={"Authorization": f"Bearer {api_key}"},
+            limits=httpx.Limits(
+                max_connections=llm_pool_size,
+                max_keepalive_connections=llm_keepalive_connections,
+                keepalive_expiry=llm_keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(
+                connect=llm_connect_timeout,
+                read=llm_read_timeout,
+                write=llm_connect_timeout,
+                pool=llm_pool_timeout,
+            ),
+        )
+
+    async def chat_completion(self, messages: list, model: str = None) -> str:
+        try:
+            response = await self._http.post(
+                "/chat/completions",
+                json={"model": model or self.model, "messages": messages},
+            )
+            response.raise_for_status()
+            return response.json()["choices"][0]["message"]["content"]
+        except (httpx.HTTPError, KeyError, IndexError, ValueError) as e:
+            raise LLMError(f"DeepSeek调用失败: {e}", is_overload(e)) from e
+
+    async def stream_chat_completion(self, messages: list, model: str = None):
+        """
+        流式调用, 逐段产出模型生成的内容
+        """
+        try:
+            async with self._http.stream(
+                "POST",
+                "/chat/completions",
+                json={"model": model or self.model, "messages": messages, "stream": True},
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    payload = line[5:].strip()
+                    if payload == "[DONE]":
+                        break
+                    delta = json.loads(payload)["choices"][0]["delta"].get("content")
+                    if delta:
+                        yield delta
+        except (httpx.HTTPError, KeyError, IndexError, ValueError) as e:
+            raise LLMError(f"DeepSeek调用失败: {e}", is_overload(e)) from e
+
+    async def aclose(self):
+        await self._http.aclose()
+
+
+class SyncSDKClient:
+    """
+    旧版同步DeepSeek SDK, 放到线程池执行以免阻塞事件循环
+    """
+
+    def __init__(self, api_key: str, model: str = llm_model):
+        from deepseek import DeepSeekAPI
+
+        self.model = model
+        self._sdk = DeepSeekAPI(api_key=api_key)
+
+    async def chat_completion(self, messages: list, model: str = None) -> str:
+        return await asyncio.to_thread(
+            self._sdk.chat_completion, model=model or self.model, messages=messages
+        )
+
+    async def stream_chat_completion(self, messages: list, model: str = None):
+        # 旧SDK不支持流式, 整段返回
+        yield await self.chat_completion(messages, model)
+
+    async def aclose(self):
+        pass
+
+
+def stub_response(messages: list) -> str:
+    """
+    离线桩的固定回复: 普通prompt返回单条结果, 批量拼接的prompt按输入id逐条返回
+    """
+    content = messages[-1]["content"]
+    vocabulary = [{"english": "stub", "chinese": "桩", "explanation": "离线测试返回的占位词汇"}]
+    if '"items"' in content:
+        ids = sorted({int(i) for i in re.findall(r'\{"id": (\d+), "text"', content)})
+        return json.dumps({"items": [
+            {"id": i, "translation": f"[stub] {i}", "vocabulary": vocabulary} for i in ids
+        ]}, ensure_ascii=False)
+    return json.dumps({"translation": f"[stub] {len(content)}", "vocabulary": vocabulary}, ensure_ascii=False)
+
+
+class StubLLMClient:
+    """
+    离线桩: 固定延迟后返回合法的翻译JSON, 用于无网络环境下压测吞吐
+    """
+
+    # 流式输出时切成多少段
+    STREAM_CHUNKS = 10
+
+    def __init__(self, latency: float = stub_latency, model: str = "stub"):
+        self.model = model
+        self.latency = latency
+
+    async def chat_completion(self, messages: list, model: str = None) -> str:
+        await asyncio.sleep(self.latency)
+        return stub_response(messages)
+
+    async def stream_chat_completion(self, messages: list, model: str = None):
+        content = stub_response(messages)
+        size = max(1, -(-len(content) // self.STREAM_CHUNKS))
+        for start in range(0, len(content), size):
+            await asyncio.sleep(self.latency / self.STREAM_CHUNKS)
+            yield content[start:start + size]
+
+    async def aclose(self):
+        pass
+
+
+def create_llm_client(backend: str = llm_backend):
+    """
+    按配置创建上游客户端
+    """
+    if backend == "deepseek":
+        return DeepSeekAsyncClient(api_key=api_key)
+    if backend == "sdk":
+        return SyncSDKClient(api_key=api_key)
+    if backend == "stub":
+        return StubLLMClient()
+    if backend == "router":
+        from llm_router import RouterClient
+
+        return RouterClient([
+            DeepSeekAsyncClient(api_key=item["api_key"], base_url=item.get("base_url", deepseek_base_url),
+                                model=item.get("model", llm_model))
+            for item in llm_backends
+        ], names=[item.get("name", f"backend-{i}") for i, item in enumerate(llm_backends)])
+    raise ValueError(f"未知的llm_backend: {backend}")
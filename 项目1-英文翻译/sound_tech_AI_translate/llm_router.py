@@ -0,0 +1,190 @@
+import asyncio
+import random
+import time
+from collections import deque
+
+from config import *
+from llm_client import LLMError, is_overload
+
+
+class Backend:
+    """
+    单个上游后端及其延迟/错误率统计
+    """
+
+    # 计算p95用的最近样本数
+    WINDOW = 200
+    # 错误率折算成的延迟惩罚(秒)
+    ERROR_PENALTY = 10.0
+
+    def __init__(self, name: str, client):
+        self.name = name
+        self.client = client
+        self.latency = None  # 延迟EWMA(秒)
+        self.error_rate = 0.0  # 错误率EWMA
+        self.inflight = 0
+        self.requests = 0
+        self.errors = 0
+        self._samples = deque(maxlen=self.WINDOW)
+
+    def record(self, latency: float = None, ok: bool = True):
+        self.requests += 1
+        self.error_rate += llm_ewma_alpha * ((0.0 if ok else 1.0) - self.error_rate)
+        if not ok:
+            self.errors += 1
+            return
+        self._samples.append(latency)
+        self.latency = latency if self.latency is None else self.latency + llm_ewma_alpha * (latency - self.latency)
+
+    def score(self) -> float:
+        """
+        越小越好: 预计延迟按在途数放大, 再加上错误率惩罚; 还没有延迟样本的后端优先试探
+        """
+        return (self.latency or 0.0) * (1 + self.inflight) + self.error_rate * self.ERROR_PENALTY
+
+    def p95(self):
+        if len(self._samples) < 20:
+            return None
+        samples = sorted(self._samples)
+        return samples[int(0.95 * (len(samples) - 1))]
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "latency_ewma": self.latency,
+            "latency_p95": self.p95(),
+            "error_rate_ewma": round(self.error_rate, 4),
+            "inflight": self.inflight,
+            "requests": self.requests,
+            "errors": self.errors
+        }
+
+
+class RouterClient:
+    """
+    多后端路由: 每次选评分最优的后端; 开启对冲时, 主后端超过其p95仍未返回就向次优后端再发一次,
+    取先成功的结果并取消另一个; 主后端失败时切换到下一个后端
+    """
+
+    def __init__(self, clients: list, names: list = None, hedge: bool = llm_hedge,
+                 hedge_min_delay: float = llm_hedge_min_delay, hedge_budget: float = llm_hedge_budget):
+        if not clients:
+            raise ValueError("llm_backends不能为空")
+        names = names or [f"backend-{i}" for i in range(len(clients))]
+        self.backends = [Backend(name, client) for name, client in zip(names, clients)]
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_budget = hedge_budget
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+
+    def _ranked(self) -> list:
+        ranked = sorted(self.backends, key=Backend.score)
+        # 少量请求随机发给其他后端, 让偶发变慢的后端恢复后有机会重新被选中
+        if len(ranked) > 1 and random.random() < llm_explore_rate:
+            ranked.insert(0, ranked.pop(random.randrange(1, len(ranked))))
+        return ranked
+
+    async def _call(self, backend: Backend, messages: list, model: str):
+        backend.inflight += 1
+        start = time.monotonic()
+        try:
+            result = await backend.client.chat_completion(messages, model)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            backend.record(ok=False)
+            raise
+        else:
+            backend.record(time.monotonic() - start)
+            return result
+        finally:
+            backend.inflight -= 1
+
+    def _hedge_delay(self, backend: Backend):
+        if not self.hedge or len(self.backends) < 2:
+            return None
+        # 对冲预算: 对冲数不超过总请求数的一定比例(留少量余量供冷启动)
+        if self.hedged >= self.hedge_budget * self.requests + 1:
+            return None
+        p95 = backend.p95()
+        return None if p95 is None else max(self.hedge_min_delay, p95)
+
+    async def chat_completion(self, messages: list, model: str = None) -> str:
+        self.requests += 1
+        ranked = self._ranked()
+        primary = ranked[0]
+        pending = {asyncio.ensure_future(self._call(primary, messages, model))}
+        hedge = None
+
+        delay = self._hedge_delay(primary)
+        if delay is not None:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if not done:
+                self.hedged += 1
+                hedge = asyncio.ensure_future(self._call(ranked[1], messages, model))
+                pending.add(hedge)
+
+        # 等到任意一个成功; 全部失败时按顺序切换到剩余后端
+        error = None
+        tried = {primary} | ({ranked[1]} if hedge is not None else set())
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+                if not pending:
+                    fallback = next((b for b in ranked if b not in tried), None)
+                    if fallback is not None:
+                        self.failovers += 1
+                        tried.add(fallback)
+                        pending = {asyncio.ensure_future(self._call(fallback, messages, model))}
+        finally:
+            for task in pending:
+                task.cancel()
+        raise error if isinstance(error, LLMError) else LLMError(f"所有后端调用失败: {error}", is_overload(error))
+
+    async def stream_chat_completion(self, messages: list, model: str = None):
+        """
+        流式调用不做对冲; 在收到第一段输出之前失败时切换到下一个后端
+        """
+        self.requests += 1
+        error = None
+        for index, backend in enumerate(self._ranked()):
+            if index:
+                self.failovers += 1
+            backend.inflight += 1
+            start = time.monotonic()
+            started = False
+            try:
+                async for chunk in backend.client.stream_chat_completion(messages, model):
+                    started = True
+                    yield chunk
+                backend.record(time.monotonic() - start)
+                return
+            except LLMError as e:
+                backend.record(ok=False)
+                if started:
+                    raise
+                error = e
+            finally:
+                backend.inflight -= 1
+        raise error
+
+    async def aclose(self):
+        await asyncio.gather(*(backend.client.aclose() for backend in self.backends))
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "failovers": self.failovers,
+            "backends": [backend.stats() for backend in self.backends]
+        }
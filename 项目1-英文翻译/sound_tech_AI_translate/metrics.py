@@ -0,0 +1,193 @@
+import contextvars
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from urllib.parse import parse_qs
+
+# 当前请求的阶段耗时列表, 只有请求要求Server-Timing时才非None
+_timings = contextvars.ContextVar("server_timings", default=None)
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+def _format_labels(names, values, extra=None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    body = ",".join(f'{name}="{str(value)}"'.replace("\n", " ") for name, value in pairs)
+    return "{" + body + "}"
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    固定桶直方图, observe只做一次二分查找和两次累加
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [各桶计数..., +Inf计数, 总和]
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, ('le', bound))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {series[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """
+        collector()在抓取时调用, 返回[(指标名, 类型, 说明, {标签元组: 值})],
+        用于导出各组件已有的计数器, 热路径上不产生额外开销
+        """
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, kind, documentation, labelnames, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples.items():
+                    if value is not None:
+                        lines.append(f"{name}{_format_labels(labelnames, labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "translate_stage_seconds", "各处理阶段耗时(秒)", ["stage"]
+))
+PROMPT_BYTES = REGISTRY.register(Histogram(
+    "translate_prompt_bytes", "发送给大模型的prompt大小(字节)", buckets=SIZE_BUCKETS
+))
+RESPONSE_BYTES = REGISTRY.register(Histogram(
+    "translate_response_bytes", "大模型返回内容大小(字节)", buckets=SIZE_BUCKETS
+))
+PARSE_FAILURES = REGISTRY.register(Counter(
+    "translate_parse_failures_total", "大模型返回内容解析失败次数"
+))
+REQUESTS = REGISTRY.register(Counter(
+    "translate_http_requests_total", "HTTP请求数", ["path", "status"]
+))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "translate_http_request_seconds", "HTTP请求耗时(秒), 从收到请求到响应体发送完毕", ["path"]
+))
+
+
+def record_span(stage: str, elapsed: float):
+    STAGE_SECONDS.observe(elapsed, stage)
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((stage, elapsed))
+
+
+@contextmanager
+def span(stage: str):
+    """
+    记录一个处理阶段的耗时
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(stage, time.perf_counter() - start)
+
+
+def start_server_timing() -> list:
+    timings = []
+    _timings.set(timings)
+    return timings
+
+
+def server_timing_header(timings: list) -> str:
+    return ", ".join(f"{stage};dur={elapsed * 1000:.2f}" for stage, elapsed in timings)
+
+
+class RequestMetricsMiddleware:
+    """
+    纯ASGI中间件: 按路由统计请求数和耗时(包含响应体传输);
+    请求头带X-Server-Timing或查询参数server_timing时, 在响应头附带各阶段耗时.
+    流式响应(text/event-stream)发送响应头时处理才刚开始, 不附带Server-Timing
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = None
+        if any(name == b"x-server-timing" for name, _ in scope["headers"]) or \
+                "server_timing" in parse_qs(scope["query_string"].decode("latin-1"), keep_blank_values=True):
+            timings = start_server_timing()
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = message.get("headers", [])
+                streaming = any(name.lower() == b"content-type" and value.startswith(b"text/event-stream")
+                                for name, value in headers)
+                if timings and not streaming:
+                    header = server_timing_header(timings).encode("latin-1")
+                    message = {**message, "headers": list(headers) + [(b"server-timing", header)]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            REQUESTS.inc(path, status)
+            REQUEST_SECONDS.observe(time.perf_counter() - start, path)
@@ -0,0 +1,106 @@
+import re
+
+from config import *
+
+# 句末标点后跟空白, 且下一句以大写字母/数字/引号/括号开头
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?;:])[\"')\]]*\s+(?=[A-Z0-9\"'(\[])")
+_PARAGRAPH_BOUNDARY = re.compile(r"\n\s*\n")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算英文token数(约4个字符一个token), 只用于切分预算, 不要求精确
+    """
+    return len(text) // 4 + 1
+
+
+def split_sentences(paragraph: str) -> list:
+    sentences = []
+    start = 0
+    for match in _SENTENCE_BOUNDARY.finditer(paragraph):
+        end = match.start() + len(match.group(0).rstrip())
+        sentences.append(paragraph[start:end].strip())
+        start = match.end()
+    sentences.append(paragraph[start:].strip())
+    return [s for s in sentences if s]
+
+
+def _split_words(sentence: str, max_tokens: int) -> list:
+    # 单句超出预算时退化为按单词硬切
+    pieces, current = [], []
+    for word in sentence.split():
+        if current and estimate_tokens(" ".join(current + [word])) > max_tokens:
+            pieces.append(" ".join(current))
+            current = []
+        current.append(word)
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def split_segments(text: str, max_tokens: int = long_text_segment_tokens) -> list:
+    """
+    按段落/句子边界把长文本切成不超过max_tokens的分段
+
+    返回[(分段原文, 译文拼接时跟在后面的分隔符)], 段落结束处分隔符为"\\n\\n", 段内为""
+    """
+    segments = []
+    paragraphs = [p.strip() for p in _PARAGRAPH_BOUNDARY.split(text.strip()) if p.strip()]
+
+    pending = []  # 待合并的完整短段落
+    for paragraph in paragraphs:
+        if estimate_tokens(paragraph) <= max_tokens:
+            if pending and estimate_tokens("\n\n".join(pending + [paragraph])) > max_tokens:
+                segments.append(("\n\n".join(pending), "\n\n"))
+                pending = []
+            pending.append(paragraph)
+            continue
+
+        if pending:
+            segments.append(("\n\n".join(pending), "\n\n"))
+            pending = []
+
+        # 超长段落: 在句子边界处打包
+        units = []
+        for sentence in split_sentences(paragraph):
+            if estimate_tokens(sentence) > max_tokens:
+                units.extend(_split_words(sentence, max_tokens))
+            else:
+                units.append(sentence)
+        current = []
+        for unit in units:
+            if current and estimate_tokens(" ".join(current + [unit])) > max_tokens:
+                segments.append((" ".join(current), ""))
+                current = []
+            current.append(unit)
+        if current:
+            segments.append((" ".join(current), "\n\n"))
+
+    if pending:
+        segments.append(("\n\n".join(pending), "\n\n"))
+    return segments
+
+
+def merge_translations(parts: list) -> str:
+    """
+    按原顺序拼接各分段译文, parts为[(译文, 分隔符)]
+    """
+    return "".join(translation.strip() + sep for translation, sep in parts).strip()
+
+
+def merge_vocabulary(vocabulary_lists: list) -> list:
+    """
+    合并多个词汇表, 按英文词汇(忽略大小写)去重, 保留首次出现的条目
+    """
+    merged, seen = [], set()
+    for vocabulary in vocabulary_lists:
+        for vocab in vocabulary or []:
+            if isinstance(vocab, dict):
+                key = str(vocab.get("english", "")).strip().lower()
+            else:
+                key = str(vocab).strip().lower()
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            merged.append(vocab)
+    return merged
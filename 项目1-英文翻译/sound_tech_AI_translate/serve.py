@@ -0,0 +1,183 @@
+# serve.py
+"""
+生产环境启动器: 主进程绑定端口并预加载只读状态(术语表自动机、翻译记忆索引、缓存内存层、文档模板),
+然后fork出多个worker共享同一个监听socket, 各自运行uvicorn
+
+    python serve.py --workers 4
+    python serve.py --workers 4 --report startup.json  # 保存启动耗时明细
+"""
+import time
+
+_started = time.perf_counter()
+
+import argparse
+import json
+import os
+import signal
+import socket
+import sys
+
+
+class StartupTimer:
+    """
+    记录启动各阶段耗时(毫秒)
+    """
+
+    def __init__(self):
+        self.stages = []
+        self._last = _started
+
+    def mark(self, stage: str):
+        now = time.perf_counter()
+        self.stages.append((stage, (now - self._last) * 1000))
+        self._last = now
+
+    def total(self) -> float:
+        return (self._last - _started) * 1000
+
+    def report(self) -> dict:
+        return {
+            "stages_ms": {stage: round(ms, 2) for stage, ms in self.stages},
+            "total_ms": round(self.total(), 2)
+        }
+
+
+def bind_socket(host: str, port: int, backlog: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def preload(translate, timer: StartupTimer, warm_cache: bool):
+    """
+    fork前载入只读状态, 之后关闭数据库连接(worker各自重新连接)
+    """
+    if translate.glossary is not None:
+        translate.glossary.refresh(force=True)
+        timer.mark("preload_glossary")
+    if translate.memory is not None:
+        translate.memory.refresh()
+        timer.mark("preload_translation_memory")
+    if translate.cache is not None and warm_cache:
+        translate.cache.warm()
+        timer.mark("warm_cache")
+    translate.preload_template()
+    timer.mark("preload_template")
+
+    for store in (translate.cache, translate.memory, translate.glossary, translate.artifacts, translate.job_store):
+        if store is not None:
+            store.close()
+
+
+def run_worker(app, sock: socket.socket, args, forked_at: float):
+    import uvicorn
+
+    async def report_ready():
+        print(f"worker {os.getpid()} 就绪, 用时 {(time.perf_counter() - forked_at) * 1000:.1f}ms", flush=True)
+
+    app.router.on_startup.append(report_ready)
+    config = uvicorn.Config(app, log_level=args.log_level, backlog=args.backlog)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def spawn(app, sock, args) -> int:
+    forked_at = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        # 子进程: 恢复默认信号处理, 由uvicorn安装自己的处理函数
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        code = 0
+        try:
+            run_worker(app, sock, args, forked_at)
+        except BaseException as e:
+            print(f"worker {os.getpid()} 异常退出: {e}", file=sys.stderr, flush=True)
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def supervise(app, sock, args):
+    """
+    维持worker数量, 收到SIGTERM/SIGINT后通知所有worker退出并等待
+    """
+    children = {spawn(app, sock, args) for _ in range(args.workers)}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    restarts = []
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if stopping:
+            continue
+        # 意外退出的worker重新拉起, 一分钟内重启过多则放弃
+        now = time.monotonic()
+        restarts = [t for t in restarts if now - t < 60] + [now]
+        if len(restarts) > args.workers * 5:
+            print("worker频繁退出, 停止服务", file=sys.stderr)
+            stop(None, None)
+            continue
+        print(f"worker {pid} 退出(状态{status}), 重新启动", file=sys.stderr)
+        children.add(spawn(app, sock, args))
+
+
+def main():
+    timer = StartupTimer()
+    from config import host, port, serve_workers, serve_backlog, serve_preload_cache
+    parser = argparse.ArgumentParser(description="多进程启动翻译服务")
+    parser.add_argument("--host", default=host)
+    parser.add_argument("--port", type=int, default=port)
+    parser.add_argument("--workers", type=int, default=serve_workers or os.cpu_count() or 1)
+    parser.add_argument("--backlog", type=int, default=serve_backlog)
+    parser.add_argument("--log-level", default="warning")
+    parser.add_argument("--no-warm-cache", action="store_true", help="不预热缓存内存层")
+    parser.add_argument("--report", help="启动耗时明细写入JSON文件")
+    args = parser.parse_args()
+    timer.mark("parse_args")
+
+    import uvicorn  # noqa: F401
+    timer.mark("import_uvicorn")
+    import translate
+    timer.mark("import_translate")
+
+    preload(translate, timer, serve_preload_cache and not args.no_warm_cache)
+    sock = bind_socket(args.host, args.port, args.backlog)
+    timer.mark("bind_socket")
+
+    report = {"pid": os.getpid(), "workers": args.workers, **timer.report()}
+    print("启动耗时(ms): " + ", ".join(f"{stage}={ms}" for stage, ms in report["stages_ms"].items())
+          + f", 合计 {report['total_ms']}", flush=True)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    print(f"监听 {args.host}:{args.port}, {args.workers} 个worker", flush=True)
+
+    if args.workers == 1:
+        run_worker(translate.app, sock, args, time.perf_counter())
+    else:
+        supervise(translate.app, sock, args)
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import json
+import re
+
+_TRANSLATION_KEY = re.compile(r'"translation"\s*:\s*"')
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+def sse_event(event: str, data) -> str:
+    """
+    编码一条Server-Sent Event
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class TranslationFieldExtractor:
+    """
+    从模型流式输出的JSON片段中增量取出"translation"字段的字符串值,
+    使译文在整段JSON生成完之前就能转发给客户端
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._started = False
+        self.done = False
+
+    def feed(self, chunk: str) -> str:
+        """
+        追加一段模型输出, 返回新解码出的译文(可能为空串)
+        """
+        if self.done:
+            return ""
+        self._buffer += chunk
+
+        if not self._started:
+            match = _TRANSLATION_KEY.search(self._buffer)
+            if match is None:
+                return ""
+            self._started = True
+            self._pos = match.end()
+
+        out = []
+        buffer, pos = self._buffer, self._pos
+        while pos < len(buffer):
+            ch = buffer[pos]
+            if ch == '"':
+                self.done = True
+                pos += 1
+                break
+            if ch != "\\":
+                out.append(ch)
+                pos += 1
+                continue
+            # 转义序列不完整时等待下一段
+            if pos + 1 >= len(buffer):
+                break
+            esc = buffer[pos + 1]
+            if esc == "u":
+                if pos + 6 > len(buffer):
+                    break
+                code = int(buffer[pos + 2:pos + 6], 16)
+                # UTF-16代理对需要凑齐两个\\uXXXX
+                if 0xD800 <= code < 0xDC00:
+                    if pos + 12 > len(buffer):
+                        break
+                    low = int(buffer[pos + 8:pos + 12], 16)
+                    out.append(chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)))
+                    pos += 12
+                else:
+                    out.append(chr(code))
+                    pos += 6
+            else:
+                out.append(_ESCAPES.get(esc, esc))
+                pos += 2
+
+        self._pos = pos
+        return "".join(out)
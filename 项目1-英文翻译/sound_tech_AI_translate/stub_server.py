@@ -0,0 +1,95 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from llm_client import stub_response
+
+# 流式输出时切成多少段
+STREAM_CHUNKS = 10
+
+
+def create_app(latency: float = 1.0, jitter: float = 0.0, tail_rate: float = 0.0, tail_latency: float = 0.0,
+               error_rate: float = 0.0, seed: int = None) -> FastAPI:
+    """
+    本地DeepSeek桩服务, 兼容/chat/completions(含stream), 用于替代真实后端做路由测试和压测
+
+    延迟 = latency + 高斯抖动(标准差jitter); 按tail_rate的概率改为tail_latency以模拟长尾;
+    按error_rate的概率返回503。指定seed时延迟和错误序列可复现
+    """
+    app = FastAPI()
+    rng = random.Random(seed)
+    app.state.requests = 0
+
+    def sample_delay() -> float:
+        if tail_rate and rng.random() < tail_rate:
+            return tail_latency
+        return max(0.0, rng.gauss(latency, jitter)) if jitter else latency
+
+    async def chat_completions(request: Request):
+        app.state.requests += 1
+        body = await request.json()
+        delay = sample_delay()
+        if error_rate and rng.random() < error_rate:
+            await asyncio.sleep(delay / 2)
+            raise HTTPException(status_code=503, detail="stub overloaded")
+
+        content = stub_response(body["messages"])
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        model = body.get("model", "stub")
+
+        if body.get("stream"):
+            async def events():
+                size = max(1, -(-len(content) // STREAM_CHUNKS))
+                for start in range(0, len(content), size):
+                    await asyncio.sleep(delay / STREAM_CHUNKS)
+                    chunk = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "model": model,
+                        "choices": [{"index": 0, "delta": {"content": content[start:start + size]}}]
+                    }
+                    yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        await asyncio.sleep(delay)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }]
+        }
+
+    app.add_api_route("/chat/completions", chat_completions, methods=["POST"])
+    app.add_api_route("/v1/chat/completions", chat_completions, methods=["POST"])
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地DeepSeek桩服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--latency", type=float, default=1.0, help="平均延迟(秒)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延迟抖动标准差(秒)")
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="长尾请求比例")
+    parser.add_argument("--tail-latency", type=float, default=0.0, help="长尾请求延迟(秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回503的比例")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    uvicorn.run(
+        create_app(args.latency, args.jitter, args.tail_rate, args.tail_latency, args.error_rate, args.seed),
+        host=args.host, port=args.port, log_level="warning"
+    )
@@ -0,0 +1,81 @@
+import json
+import os
+import re
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from batching import build_batch_prompt, pack_items, parse_batch_translation
+
+
+class TestPackItems(unittest.TestCase):
+
+    def test_long_items_single(self):
+        """测试超过单条预算的长文本单独翻译, 其余按顺序拼接"""
+        items = [(0, "a"), (1, "b" * 400), (2, "c"), (3, "d")]
+        groups, singles = pack_items(items, item_tokens=60, pack_tokens=800, max_items=20)
+        self.assertEqual(groups, [[(0, "a"), (2, "c"), (3, "d")]])
+        self.assertEqual(singles, [(1, "b" * 400)])
+
+    def test_group_limits(self):
+        """测试按条数和token预算分组, 最后只剩一条时单独翻译"""
+        items = [(i, "word " * 10) for i in range(7)]
+        groups, singles = pack_items(items, item_tokens=60, pack_tokens=800, max_items=3)
+        self.assertEqual([[i for i, _ in group] for group in groups], [[0, 1, 2], [3, 4, 5]])
+        self.assertEqual(singles, [(6, "word " * 10)])
+
+        groups, singles = pack_items(items, item_tokens=60, pack_tokens=30, max_items=20)
+        self.assertEqual([[i for i, _ in group] for group in groups], [[0, 1], [2, 3], [4, 5]])
+        self.assertEqual([i for i, _ in singles], [6])
+
+    def test_empty(self):
+        self.assertEqual(pack_items([]), ([], []))
+
+
+class TestBatchPrompt(unittest.TestCase):
+
+    def test_items_encoded(self):
+        """测试每段原文按id编码为一行JSON, 引号和换行被转义"""
+        prompt = build_batch_prompt(['say "hi"', "two\nlines"])
+        lines = re.findall(r'^\{"id": .*$', prompt, re.M)
+        self.assertEqual([json.loads(line) for line in lines], [
+            {"id": 0, "text": 'say "hi"'}, {"id": 1, "text": "two\nlines"}
+        ])
+
+
+class TestParseBatchTranslation(unittest.TestCase):
+
+    def test_valid(self):
+        response = json.dumps({"items": [
+            {"id": 1, "translation": "二", "vocabulary": [{"english": "two"}]},
+            {"id": 0, "translation": "一"},
+        ]})
+        self.assertEqual(parse_batch_translation(response, 2), {
+            0: {"translation": "一", "vocabulary": []},
+            1: {"translation": "二", "vocabulary": [{"english": "two"}]},
+        })
+
+    def test_malformed_items_dropped(self):
+        """测试id越界、重复、类型不对和缺少译文的条目不返回"""
+        response = json.dumps({"items": [
+            {"id": 0, "translation": "一"},
+            {"id": 2, "translation": "越界"},
+            {"id": -1, "translation": "负数"},
+            {"id": "1", "translation": "字符串id"},
+            {"id": 1},
+            {"id": 1, "translation": None},
+            "not an item",
+            None,
+        ]})
+        self.assertEqual(parse_batch_translation(response, 2), {0: {"translation": "一", "vocabulary": []}})
+
+    def test_malformed_response(self):
+        """测试响应不是合法JSON或结构不对时返回空结果"""
+        for response in ('', 'not json', '{"items": [', '[1, 2]', '"text"', '{"translation": "一"}',
+                         '{"items": 5}', '{"items": null}'):
+            self.assertEqual(parse_batch_translation(response, 2), {}, response)
+
+
+if __name__ == '__main__':
+    unittest.main()
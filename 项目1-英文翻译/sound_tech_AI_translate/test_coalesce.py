@@ -0,0 +1,77 @@
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from coalesce import SingleFlight
+
+
+class TestSingleFlight(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.flight = SingleFlight()
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def call(self, result=None, error=None):
+        self.calls += 1
+        await self.release.wait()
+        if error is not None:
+            raise error
+        return result
+
+    async def test_coalesced(self):
+        """测试同键并发调用只执行一次, 所有调用方拿到同一结果"""
+        tasks = [asyncio.ensure_future(self.flight.do("k", lambda: self.call("ok"))) for _ in range(5)]
+        other = asyncio.ensure_future(self.flight.do("other", lambda: self.call("other")))
+        await asyncio.sleep(0)
+        self.assertTrue(self.flight.inflight("k"))
+        self.release.set()
+        self.assertEqual(await asyncio.gather(*tasks), ["ok"] * 5)
+        self.assertEqual(await other, "other")
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(self.flight.stats(), {"inflight": 0, "calls": 2, "coalesced": 4})
+
+    async def test_error_propagation(self):
+        """测试异常传给所有等待者, 之后同键重新调用"""
+        tasks = [
+            asyncio.ensure_future(self.flight.do("k", lambda: self.call(error=ValueError("bad"))))
+            for _ in range(3)
+        ]
+        await asyncio.sleep(0)
+        self.release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        self.assertEqual([type(r) for r in results], [ValueError] * 3)
+        self.assertFalse(self.flight.inflight("k"))
+
+        self.assertEqual(await self.flight.do("k", lambda: self.call("retry")), "retry")
+        self.assertEqual(self.calls, 2)
+
+    async def test_waiter_cancelled(self):
+        """测试取消一个等待者不取消共享的调用"""
+        first = asyncio.ensure_future(self.flight.do("k", lambda: self.call("ok")))
+        second = asyncio.ensure_future(self.flight.do("k", lambda: self.call("ok")))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        self.assertTrue(self.flight.inflight("k"))
+        self.release.set()
+        self.assertEqual(await second, "ok")
+        with self.assertRaises(asyncio.CancelledError):
+            await first
+
+    async def test_all_waiters_cancelled(self):
+        """测试所有等待者都取消后调用仍完成并从在途表中移除"""
+        task = asyncio.ensure_future(self.flight.do("k", lambda: self.call(error=ValueError("bad"))))
+        await asyncio.sleep(0)
+        task.cancel()
+        self.release.set()
+        for _ in range(5):
+            await asyncio.sleep(0)
+        self.assertFalse(self.flight.inflight("k"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from glossary import AhoCorasick, Glossary, normalize_term
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+class TestAhoCorasick(unittest.TestCase):
+
+    def test_overlapping(self):
+        """测试重叠、嵌套的模式串全部找出"""
+        patterns = ["he", "she", "his", "hers"]
+        matches = sorted(AhoCorasick(patterns).search("ushers"))
+        self.assertEqual([(start, end, patterns[i]) for start, end, i in matches],
+                         [(1, 4, "she"), (2, 4, "he"), (2, 6, "hers")])
+
+    def test_matches_brute_force(self):
+        """测试与逐个查找的结果一致"""
+        patterns = ["a", "ab", "bab", "bc", "bca", "c", "caa", "abcab"]
+        text = "abccabcabbcaabcab"
+        expected = sorted(
+            (i, i + len(p), index) for index, p in enumerate(patterns)
+            for i in range(len(text)) if text.startswith(p, i)
+        )
+        self.assertEqual(sorted(AhoCorasick(patterns).search(text)), expected)
+
+    def test_no_match(self):
+        self.assertEqual(list(AhoCorasick(["xyz"]).search("abc")), [])
+
+
+class TestGlossary(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.glossary = Glossary(os.path.join(self.tmp, 'glossary.db'), refresh_interval=3600, rebuild_delay=0)
+        self.glossary.import_terms([
+            {"english": "machine learning", "chinese": "机器学习"},
+            {"english": "Learning Rate", "chinese": "学习率"},
+            {"english": "machine", "chinese": "机器"},
+            {"english": "rate", "chinese": "速率"},
+        ])
+
+    def tearDown(self):
+        self.glossary.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def english(self, text):
+        return [entry["english"] for entry in self.glossary.match(text)]
+
+    def test_leftmost_longest(self):
+        """测试重叠术语取最左最长, 被覆盖的术语不返回"""
+        self.assertEqual(self.english("Machine  Learning rate"), ["machine learning", "rate"])
+        self.assertEqual(self.english("the learning rate of a machine"), ["Learning Rate", "machine"])
+
+    def test_word_boundary(self):
+        """测试只匹配整词, 同一术语只返回一次"""
+        self.assertEqual(self.english("machines and accelerate"), [])
+        self.assertEqual(self.english("machine, machine-made (rate)"), ["machine", "rate"])
+
+    def test_learn_keeps_curated(self):
+        """测试学到的词汇不覆盖人工导入的术语, 新术语在后台重建后生效"""
+        learned = self.glossary.learn([
+            {"english": "machine", "chinese": "机械"},
+            {"english": "Gradient Descent", "chinese": "梯度下降"},
+            {"english": "", "chinese": "空"},
+            "not a dict",
+        ])
+        self.assertEqual(learned, 1)
+        self.assertTrue(wait_until(lambda: "gradient descent" in self.glossary._index[0]))
+        self.assertEqual(self.glossary.match("gradient  descent on a machine"), [
+            {"english": "Gradient Descent", "chinese": "梯度下降", "explanation": ""},
+            {"english": "machine", "chinese": "机器", "explanation": ""},
+        ])
+
+    def test_import_overwrite(self):
+        """测试导入默认覆盖同名术语, overwrite=False时保留原有的"""
+        self.glossary.import_terms([{"english": "MACHINE", "chinese": "机械"}], overwrite=False)
+        self.assertEqual(self.glossary.match("machine")[0]["chinese"], "机器")
+        self.glossary.import_terms([{"english": "MACHINE", "chinese": "机械"}])
+        self.assertEqual(self.glossary.match("machine")[0]["chinese"], "机械")
+        self.assertEqual(self.glossary.stats()["terms"], 4)
+
+    def test_normalize_term(self):
+        self.assertEqual(normalize_term("  Machine\tLearning "), "machine learning")
+
+
+if __name__ == '__main__':
+    unittest.main()
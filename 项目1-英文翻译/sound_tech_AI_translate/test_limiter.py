@@ -0,0 +1,143 @@
+import asyncio
+import os
+import sys
+import time
+import unittest
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from limiter import AdaptiveLimiter, OverloadError
+from llm_client import LLMError, is_overload
+
+
+def status_error(status_code):
+    request = httpx.Request("POST", "https://api.example.com/chat/completions")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(status_code, request=request))
+
+
+def limiter(algorithm="gradient", **kwargs):
+    options = {"initial_limit": 10, "min_limit": 2, "max_limit": 50, "max_queue": 2}
+    options.update(kwargs)
+    return AdaptiveLimiter(algorithm, **options)
+
+
+class TestLimitUpdates(unittest.TestCase):
+
+    def test_gradient_stable_latency_grows(self):
+        """测试gradient: 延迟稳定时限制逐步增大, 不超过上限"""
+        lim = limiter()
+        for _ in range(200):
+            lim.inflight += 1
+            lim.release(1.0)
+        self.assertEqual(lim.limit, 50)
+
+    def test_gradient_latency_spike_shrinks(self):
+        """测试gradient: 短期延迟远高于长期基线时限制收缩, 不低于下限"""
+        lim = limiter()
+        for _ in range(50):
+            lim.inflight += 1
+            lim.release(1.0)
+        grown = lim.limit
+        for _ in range(10):
+            lim.inflight += 1
+            lim.release(20.0)
+        self.assertLess(lim.limit, grown)
+        for _ in range(200):
+            lim.inflight += 1
+            lim.release(1000.0)
+        self.assertGreaterEqual(lim.limit, 2)
+
+    def test_aimd(self):
+        """测试aimd: 超过目标延迟乘性减, 在途数达到一半限制时加性增, 否则不变"""
+        lim = limiter("aimd")
+        lim.inflight = 6
+        lim.release(1.0)
+        self.assertEqual(lim.limit, 11)
+        lim.inflight = 2
+        lim.release(1.0)
+        self.assertEqual(lim.limit, 11)
+        lim.inflight = 1
+        lim.release(1000.0)
+        self.assertAlmostEqual(lim.limit, 9.9)
+
+    def test_unknown_algorithm(self):
+        with self.assertRaises(ValueError):
+            AdaptiveLimiter("fifo")
+
+
+class TestOverloadClassification(unittest.TestCase):
+
+    def test_is_overload(self):
+        """测试只有超时、429和5xx算作过载"""
+        for error in (status_error(429), status_error(500), status_error(503), httpx.ReadTimeout("timeout"),
+                      httpx.PoolTimeout("pool"), asyncio.TimeoutError(), LLMError("x", overload=True)):
+            self.assertTrue(is_overload(error), error)
+        for error in (status_error(400), status_error(401), status_error(404), ValueError("bad json"),
+                      KeyError("choices"), httpx.ConnectError("refused"), LLMError("x")):
+            self.assertFalse(is_overload(error), error)
+
+
+class TestAdmission(unittest.IsolatedAsyncioTestCase):
+
+    async def fail_in_slot(self, lim, error):
+        with self.assertRaises(type(error)):
+            async with lim.slot():
+                raise error
+
+    async def test_errors_in_slot(self):
+        """测试请求本身的错误只归还名额, 过载错误才收缩限制"""
+        lim = limiter("aimd")
+        await self.fail_in_slot(lim, ValueError("parse failed"))
+        await self.fail_in_slot(lim, LLMError("400", is_overload(status_error(400))))
+        self.assertEqual((lim.limit, lim.inflight, lim.errors), (10, 0, 0))
+        await self.fail_in_slot(lim, LLMError("429", is_overload(status_error(429))))
+        self.assertEqual((lim.limit, lim.inflight, lim.errors), (9, 0, 1))
+
+    async def test_queue_and_drain(self):
+        """测试超出限制的请求排队, 名额归还后按顺序放行; 队列满时返回429"""
+        lim = limiter(initial_limit=2, min_limit=1)
+        await lim.acquire()
+        await lim.acquire()
+        waiters = [asyncio.ensure_future(lim.acquire()) for _ in range(2)]
+        await asyncio.sleep(0)
+        self.assertEqual(lim.stats()["queue_depth"], 2)
+        with self.assertRaises(OverloadError) as ctx:
+            await lim.acquire()
+        self.assertEqual(ctx.exception.status_code, 429)
+
+        lim.release()
+        await asyncio.sleep(0)
+        self.assertTrue(waiters[0].done())
+        self.assertFalse(waiters[1].done())
+        lim.release()
+        await asyncio.gather(*waiters)
+        self.assertEqual(lim.inflight, 2)
+
+    async def test_deadline(self):
+        """测试预计赶不上截止时间的请求直接返回503"""
+        lim = limiter(initial_limit=2, min_limit=1)
+        await lim.acquire()
+        await lim.acquire()
+        with self.assertRaises(OverloadError) as ctx:
+            await lim.acquire(deadline=time.monotonic() + 0.1)
+        self.assertEqual(ctx.exception.status_code, 503)
+        self.assertGreaterEqual(ctx.exception.retry_after, 1)
+        self.assertEqual(lim.stats()["rejected_deadline"], 1)
+
+    async def test_cancelled_waiter(self):
+        """测试排队中被取消的请求不占用名额"""
+        lim = limiter(initial_limit=2, min_limit=1)
+        await lim.acquire()
+        await lim.acquire()
+        waiter = asyncio.ensure_future(lim.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.sleep(0)
+        lim.release()
+        self.assertEqual((lim.inflight, lim.stats()["queue_depth"]), (1, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
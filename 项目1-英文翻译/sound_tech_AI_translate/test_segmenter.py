@@ -0,0 +1,80 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from segmenter import estimate_tokens, merge_translations, merge_vocabulary, split_segments, split_sentences
+
+DOCUMENT = "\n\n".join(
+    " ".join(f"Paragraph {p} sentence {s} talks about signal processing and audio mixing." for s in range(12))
+    for p in range(6)
+)
+
+
+class TestSplitSentences(unittest.TestCase):
+
+    def test_boundaries(self):
+        """测试句末标点、引号和括号处断句"""
+        text = 'First sentence here. Second one (with parens)! "Quoted" third? 4th item; done.'
+        self.assertEqual(split_sentences(text), [
+            'First sentence here.', 'Second one (with parens)!', '"Quoted" third?', '4th item; done.'
+        ])
+
+    def test_no_boundary(self):
+        """测试小写开头、缩写和小数不断句"""
+        self.assertEqual(split_sentences('Use e.g. this one. version 2.5 is out'), ['Use e.g. this one. version 2.5 is out'])
+        self.assertEqual(split_sentences('   '), [])
+
+
+class TestSplitSegments(unittest.TestCase):
+
+    def test_budget(self):
+        """测试每个分段都不超过token预算"""
+        for budget in (20, 50, 200, 800):
+            for segment, _ in split_segments(DOCUMENT, budget):
+                self.assertLessEqual(estimate_tokens(segment), budget, budget)
+
+    def test_reassembly(self):
+        """测试各分段按分隔符拼回后段落结构和内容不变(段内分隔符为空, 只差句间空格)"""
+        def paragraphs(text):
+            return [paragraph.replace(' ', '') for paragraph in text.split('\n\n')]
+
+        for budget in (20, 50, 200, 800, 10000):
+            segments = split_segments(DOCUMENT, budget)
+            self.assertEqual(paragraphs(merge_translations(segments)), paragraphs(DOCUMENT), budget)
+        self.assertEqual(merge_translations(split_segments(DOCUMENT, 10000)), DOCUMENT)
+
+    def test_short_paragraphs_merged(self):
+        """测试短段落合并到同一分段, 段落之间保留空行"""
+        segments = split_segments('One.\n\nTwo.\n\n\n\nThree.', 800)
+        self.assertEqual(segments, [('One.\n\nTwo.\n\nThree.', '\n\n')])
+
+    def test_long_sentence_split_by_words(self):
+        """测试单句超出预算时按单词切分"""
+        segments = split_segments('word ' * 100, 10)
+        self.assertGreater(len(segments), 1)
+        self.assertEqual(' '.join(segment for segment, _ in segments).split(), ['word'] * 100)
+        self.assertEqual([sep for _, sep in segments][-1], '\n\n')
+        self.assertTrue(all(sep == '' for _, sep in segments[:-1]))
+
+
+class TestMerge(unittest.TestCase):
+
+    def test_merge_translations(self):
+        """测试译文拼接时去掉首尾空白并使用分段的分隔符"""
+        parts = [(' 第一句。', ''), ('第二句。\n', '\n\n'), ('第三段。 ', '\n\n')]
+        self.assertEqual(merge_translations(parts), '第一句。第二句。\n\n第三段。')
+
+    def test_merge_vocabulary(self):
+        """测试词汇表按英文(忽略大小写)去重, 保留首次出现的条目"""
+        merged = merge_vocabulary([
+            [{'english': 'Mixer', 'chinese': '调音台'}, {'english': ''}],
+            None,
+            [{'english': ' mixer ', 'chinese': '混音器'}, 'Gain', 'gain', {'english': 'Fader', 'chinese': '推子'}]
+        ])
+        self.assertEqual(merged, [{'english': 'Mixer', 'chinese': '调音台'}, 'Gain', {'english': 'Fader', 'chinese': '推子'}])
+
+
+if __name__ == '__main__':
+    unittest.main()
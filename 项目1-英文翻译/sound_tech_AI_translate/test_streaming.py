@@ -0,0 +1,65 @@
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from streaming import TranslationFieldExtractor, sse_event
+
+RESPONSE = json.dumps({
+    "translation": '第一行\n"引号" \\反斜杠\t制表 😀 end',
+    "vocabulary": [{"english": "x", "chinese": "y", "translation": "not this"}]
+})
+
+
+def extract(chunks):
+    extractor = TranslationFieldExtractor()
+    return "".join(extractor.feed(chunk) for chunk in chunks), extractor
+
+
+class TestTranslationFieldExtractor(unittest.TestCase):
+
+    def test_every_split_point(self):
+        """测试在任意位置切开(包括转义序列和\\u代理对中间)都能完整取出译文"""
+        expected = json.loads(RESPONSE)["translation"]
+        for i in range(len(RESPONSE) + 1):
+            text, extractor = extract([RESPONSE[:i], RESPONSE[i:]])
+            self.assertEqual(text, expected, i)
+            self.assertTrue(extractor.done)
+
+    def test_single_characters(self):
+        """测试逐字符输入, 以及ASCII转义之外的原样输出"""
+        response = json.dumps({"translation": "你好😀\\/"}, ensure_ascii=False)
+        text, _ = extract(list(response))
+        self.assertEqual(text, "你好😀\\/")
+        text, _ = extract(list(json.dumps({"translation": "你好😀"})))
+        self.assertEqual(text, "你好😀")
+
+    def test_incremental(self):
+        """测试译文在JSON结束之前就逐段产出, 结束后忽略后续内容"""
+        extractor = TranslationFieldExtractor()
+        self.assertEqual(extractor.feed('{"vocab'), "")
+        self.assertEqual(extractor.feed('ulary": [], "translation" : "前半'), "前半")
+        self.assertEqual(extractor.feed('后半\\'), "后半")
+        self.assertEqual(extractor.feed('n", "translation": "again"}'), "\n")
+        self.assertTrue(extractor.done)
+        self.assertEqual(extractor.feed('"more"'), "")
+
+    def test_missing_field(self):
+        """测试没有translation字段时不产出内容"""
+        text, extractor = extract(['{"items": [', '{"id": 0}]}'])
+        self.assertEqual(text, "")
+        self.assertFalse(extractor.done)
+
+
+class TestSseEvent(unittest.TestCase):
+
+    def test_format(self):
+        """测试事件格式, 数据中的换行被JSON转义"""
+        self.assertEqual(sse_event("translation", {"delta": "一\n二"}),
+                         'event: translation\ndata: {"delta": "一\\n二"}\n\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import tm_reference_threshold
+from translation_memory import TranslationMemory
+
+SOURCE = "The learning rate controls how far each gradient step moves the model weights."
+
+
+class TestTranslationMemory(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp, 'tm.db')
+        self.memory = TranslationMemory(self.db_path, refresh_interval=3600)
+
+    def tearDown(self):
+        self.memory.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def count(self):
+        return self.memory._db().execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+
+    def test_dedup_normalized(self):
+        """测试只差大小写和空白的原文只保存一条, 保留最早的译文"""
+        self.memory.add_many([
+            (SOURCE, "学习率控制每一步梯度更新移动模型权重的幅度。", []),
+            (SOURCE.upper(), "另一个译文", []),
+            ("  " + SOURCE.replace(" ", "\t "), "又一个译文", []),
+            ("", "空原文", []),
+            ("no translation", "", []),
+        ])
+        self.memory.add_many([(SOURCE.lower(), "再一个译文", [])])
+        self.assertEqual(self.count(), 1)
+        self.assertEqual(self.memory.lookup(SOURCE).translation, "学习率控制每一步梯度更新移动模型权重的幅度。")
+
+    def test_exact_match(self):
+        """测试归一化后原文相同时相似度为1并可直接复用"""
+        self.memory.add_many([(SOURCE, "译文", [{"english": "learning rate", "chinese": "学习率"}])])
+        match = self.memory.lookup("  " + SOURCE.upper())
+        self.assertEqual(match.similarity, 1.0)
+        self.assertTrue(self.memory.same_source(SOURCE.upper(), match))
+        self.assertEqual(match.vocabulary, [{"english": "learning rate", "chinese": "学习率"}])
+
+    def test_near_match_reference_only(self):
+        """测试只差一个词的原文相似度超过参考阈值, 但不能直接复用译文"""
+        self.memory.add_many([(SOURCE, "译文", [])])
+        text = SOURCE.replace("controls", "limits")
+        match = self.memory.lookup(text)
+        self.assertIsNotNone(match)
+        self.assertGreaterEqual(match.similarity, tm_reference_threshold)
+        self.assertLess(match.similarity, 1.0)
+        self.assertFalse(self.memory.same_source(text, match))
+
+    def test_unrelated(self):
+        """测试无关原文没有候选或相似度低于参考阈值"""
+        self.memory.add_many([(SOURCE, "译文", [])])
+        match = self.memory.lookup("Bananas are rich in potassium and are often eaten at breakfast.")
+        self.assertTrue(match is None or match.similarity < tm_reference_threshold)
+        self.assertIsNone(self.memory.lookup("   "))
+
+    def test_add_result_sentences(self):
+        """测试句子数能对齐时额外保存逐句句对"""
+        self.memory.add_result("First sentence here. Second sentence here.",
+                               {"translation": "第一句。第二句。", "vocabulary": []})
+        self.assertEqual(self.count(), 3)
+        self.assertEqual(self.memory.lookup("second sentence here.").translation, "第二句。")
+
+    def test_migrate_old_db(self):
+        """测试旧库补充normalized列, 回填时删除只差大小写和空白的重复句对"""
+        signature = sqlite3.Binary(bytes(8 * self.memory.num_perm))
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('''
+            CREATE TABLE segments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                source_hash INTEGER NOT NULL,
+                source TEXT NOT NULL,
+                translation TEXT NOT NULL,
+                vocabulary TEXT NOT NULL,
+                signature BLOB NOT NULL,
+                created_at REAL NOT NULL
+            )
+        ''')
+        conn.executemany(
+            "INSERT INTO segments (source_hash, source, translation, vocabulary, signature, created_at) "
+            "VALUES (0, ?, ?, '[]', ?, 0)",
+            [(SOURCE, "最早", signature), (SOURCE.upper(), "重复", signature), ("Other text.", "其他", signature)]
+        )
+        conn.commit()
+        conn.close()
+
+        memory = TranslationMemory(self.db_path, refresh_interval=3600)
+        try:
+            rows = memory._db().execute("SELECT translation, normalized FROM segments ORDER BY id").fetchall()
+            self.assertEqual([row[0] for row in rows], ["最早", "其他"])
+            self.assertTrue(all(row[1] for row in rows))
+            memory.add_many([(SOURCE.lower(), "新译文", [])])
+            self.assertEqual(memory._db().execute("SELECT COUNT(*) FROM segments").fetchone()[0], 2)
+        finally:
+            memory.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,14 +1,30 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Header
 from pydantic import BaseModel
-from deepseek import DeepSeekAPI
+from llm_client import create_llm_client
+from cache import TranslationCache
+from segmenter import estimate_tokens, split_segments, merge_translations, merge_vocabulary
+from streaming import TranslationFieldExtractor, sse_event
+from coalesce import SingleFlight
+from batching import pack_items, build_batch_prompt, parse_batch_translation
+from jobs import JobQueue, JobStore, QueueFullError
+from translation_memory import TranslationMemory
+from glossary import Glossary
+from artifacts import ArtifactStore
+from limiter import AdaptiveLimiter, OverloadError, request_deadline
+import metrics
+from metrics import span, record_span, PROMPT_BYTES, RESPONSE_BYTES, PARSE_FAILURES
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+import time
+import asyncio
 import os
 import json
+import uuid
 from config import *
 import uvicorn
-from docx import Document
-from docx.shared import Inches
-import uuid
-from fastapi.responses import FileResponse
+from docx_render import render_document, render_to_file, run_in_pool, shutdown_executor, preload_template
+from fastapi.responses import FileResponse, StreamingResponse, Response, PlainTextResponse
+from email.utils import formatdate, parsedate_to_datetime
 import os
 
 app = FastAPI()
@@ -18,76 +34,184 @@ DOWNLOAD_DIR = "downloads"
 if not os.path.exists(DOWNLOAD_DIR):
     os.makedirs(DOWNLOAD_DIR)
 
-# 使用正确的类名
-# client = DeepSeekAPI(api_key=os.getenv("DEEPSEEK_API_KEY"))
-client = DeepSeekAPI(api_key=api_key)
+DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+# 直接在响应中返回Word文档的输出格式
+INLINE_FORMATS = ("word_inline", "word_multipart")
+
+# 下载文件存储(内容寻址、分目录存放)和后台清理
+artifacts = ArtifactStore(DOWNLOAD_DIR)
+renders = SingleFlight()
+
+async def sweep_artifacts():
+    while True:
+        await asyncio.sleep(artifact_sweep_interval)
+        try:
+            await asyncio.to_thread(artifacts.sweep)
+        except Exception as e:
+            print(f"清理下载文件失败: {e}")
+
+# 异步上游客户端(连接池复用长连接), 后端由config.llm_backend决定
+client = create_llm_client()
+
+# 翻译结果缓存(LRU内存层 + SQLite持久层)
+cache = TranslationCache() if cache_enabled else None
+
+# 翻译记忆, 近似匹配历史句对
+memory = TranslationMemory() if tm_enabled else None
+
+# 术语表, 已知词汇在本地填充
+glossary = Glossary() if glossary_enabled else None
+
+# 大模型调用的自适应并发限制
+limiter = AdaptiveLimiter() if limiter_enabled else None
+
+# 相同原文的在途上游调用只发一次
+inflight = SingleFlight()
+
+# 缓存、翻译记忆和术语表的SQLite写入由单独的线程串行执行, 请求不等待提交, 也不阻塞事件循环
+db_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+
+def _run_write(fn, *args):
+    try:
+        fn(*args)
+    except Exception as e:
+        print(f"后台写入失败: {e}")
+
+def submit_write(fn, *args):
+    db_writer.submit(_run_write, fn, *args)
+
+async def cache_lookup(key: str):
+    """
+    先查内存层, 未命中再在线程池中查SQLite持久层
+    """
+    cached = cache.peek(key)
+    if cached is not None:
+        return cached
+    return await asyncio.to_thread(cache.get, key)
+
+# 异步导出任务队列, worker在启动时创建; 任务状态存在SQLite中, 各worker都能查询
+job_store = JobStore()
+job_queue = JobQueue(lambda request: handle_translation(request), job_store)
+
+@app.on_event("startup")
+async def start_background_tasks():
+    if glossary is not None:
+        # match()不在请求中同步加载术语表, 启动时先载入一次
+        await asyncio.to_thread(glossary.refresh)
+    await job_queue.start()
+    app.state.sweeper = asyncio.create_task(sweep_artifacts())
+
+@app.on_event("shutdown")
+async def shutdown_services():
+    app.state.sweeper.cancel()
+    await job_queue.stop()
+    await client.aclose()
+    shutdown_executor()
+    # 等待排队中的缓存/翻译记忆写入完成
+    await asyncio.to_thread(db_writer.shutdown, True)
+
+# 请求计数、耗时和Server-Timing
+app.add_middleware(metrics.RequestMetricsMiddleware)
 
 class TranslationRequest(BaseModel):
     text: str
-    output_format: str = "json"  # "json" or "word"
+    output_format: str = "json"  # "json" / "word"(返回下载链接) / "word_inline"(响应体即docx) / "word_multipart"(JSON+docx)
     include_vocabulary: bool = True
+    bypass_cache: bool = False  # 跳过缓存读取, 强制重新翻译
+    long_text: bool = False  # 长文档模式: 分段并行翻译; 超过long_text_threshold_tokens时自动开启
 
-def create_word_document(original_text: str, translation: str, vocabulary: list, filename: str):
-    """
-    创建Word文档
-    """
-    doc = Document()
-    
-    # 标题
-    title = doc.add_heading('智能翻译结果', 0)
-    title.alignment = 1  # 居中
-    
-    # 添加分割线
-    doc.add_paragraph("=" * 50)
-    
-    # 原文部分
-    doc.add_heading('英文原文', level=1)
-    doc.add_paragraph(original_text)
-    
-    # 翻译部分
-    doc.add_heading('中文翻译', level=1)
-    doc.add_paragraph(translation)
-    
-    # 专业词汇表
-    if vocabulary:
-        doc.add_heading('专业词汇表', level=1)
-        
-        # 创建表格：英文 | 中文 | 解释
-        table = doc.add_table(rows=1, cols=3)
-        table.style = 'Light Grid Accent 1'
-        
-        # 表头
-        hdr_cells = table.rows[0].cells
-        hdr_cells[0].text = '英文词汇'
-        hdr_cells[1].text = '中文翻译'
-        hdr_cells[2].text = '解释'
-        
-        # 添加词汇行
-        for vocab in vocabulary:
-            if isinstance(vocab, dict):
-                row_cells = table.add_row().cells
-                row_cells[0].text = vocab.get('english', '')
-                row_cells[1].text = vocab.get('chinese', '')
-                row_cells[2].text = vocab.get('explanation', '')
-            else:
-                row_cells = table.add_row().cells
-                row_cells[0].text = str(vocab)
-                row_cells[1].text = ""
-                row_cells[2].text = ""
-    
-    # 保存文档
-    file_path = os.path.join(DOWNLOAD_DIR, filename)
-    doc.save(file_path)
-    return file_path
+class GlossaryImportRequest(BaseModel):
+    terms: list[dict]  # [{"english": ..., "chinese": ..., "explanation": ...}]
+    overwrite: bool = True
 
-@app.post(translate_url)
-async def translate_text(request: TranslationRequest):
-    try:
-        prompt = f"""
-        请将以下英文文本翻译成中文，并提取重要的专业词汇：
+class CleanupRequest(BaseModel):
+    older_than: float = None  # 秒, 默认使用artifact_ttl
+    max_bytes: int = None  # 默认使用artifact_max_bytes
+
+class BatchTranslationRequest(BaseModel):
+    texts: list[str]
+    include_vocabulary: bool = True
+    bypass_cache: bool = False
+
+async def render_artifact(digest: str, original_text: str, translation: str, vocabulary: list):
+    staging_path = artifacts.staging_path(digest)
+    await run_in_pool(render_to_file, original_text, translation, vocabulary, staging_path)
+    await asyncio.to_thread(artifacts.commit, digest, staging_path)
+
+async def create_word_document(original_text: str, translation: str, vocabulary: list) -> str:
+    """
+    创建Word文档(在docx渲染池中执行, 不阻塞事件循环), 返回文件名; 内容相同的文档直接复用
+    """
+    digest = ArtifactStore.content_hash(original_text, translation, vocabulary)
+    if await asyncio.to_thread(artifacts.lookup, digest) is None:
+        with span("docx"):
+            await renders.do(digest, lambda: render_artifact(digest, original_text, translation, vocabulary))
+    return ArtifactStore.filename(digest)
+
+async def render_word_inline(original_text: str, translation: str, vocabulary: list) -> tuple:
+    """
+    在内存中渲染Word文档, 返回(内容哈希, docx字节), 不经过下载目录
+    """
+    digest = ArtifactStore.content_hash(original_text, translation, vocabulary)
+    with span("docx"):
+        data = await renders.do(
+            "inline:" + digest, lambda: run_in_pool(render_document, original_text, translation, vocabulary)
+        )
+    return digest, data
+
+def inline_word_response(output_format: str, response_data: dict) -> Response:
+    """
+    word_inline: 响应体直接是docx; word_multipart: multipart/mixed, 第一部分为JSON结果, 第二部分为docx
+    """
+    digest, data = response_data.pop("word_document")
+    filename = f"translation_{digest}.docx"
+    disposition = f'attachment; filename="{filename}"'
+    if output_format == "word_inline":
+        return Response(
+            content=data,
+            media_type=DOCX_MEDIA_TYPE,
+            headers={"Content-Disposition": disposition, "ETag": f'"{digest}"', "Cache-Control": "no-store"}
+        )
+
+    boundary = uuid.uuid4().hex
+    metadata = json.dumps(response_data, ensure_ascii=False).encode("utf-8")
+    body = b"".join([
+        f"--{boundary}\r\nContent-Type: application/json; charset=utf-8\r\n\r\n".encode(),
+        metadata,
+        f"\r\n--{boundary}\r\nContent-Type: {DOCX_MEDIA_TYPE}\r\n"
+        f"Content-Disposition: {disposition}\r\n\r\n".encode(),
+        data,
+        f"\r\n--{boundary}--\r\n".encode()
+    ])
+    return Response(content=body, media_type=f"multipart/mixed; boundary={boundary}",
+                    headers={"Cache-Control": "no-store"})
+
+class TranslationParseError(Exception):
+    """大模型返回的内容不是约定的JSON"""
 
-        英文原文：{request.text}
+    def __init__(self, message: str, raw_response: str):
+        super().__init__(message)
+        self.raw_response = raw_response
 
+def build_prompt(text: str, reference=None, known_terms=None) -> str:
+    known_block = ""
+    if known_terms:
+        known_block = f"""
+        以下专业词汇已有释义，vocabulary中无需再返回：{", ".join(vocab["english"] for vocab in known_terms)}
+"""
+    reference_block = ""
+    if reference is not None:
+        reference_block = f"""
+        参考译文（相似原文的已有翻译，请保持术语和表达一致）：
+        原文：{reference.source}
+        译文：{reference.translation}
+"""
+    return f"""
+        请将以下英文文本翻译成中文，并提取重要的专业词汇：
+
+        英文原文：{text}
+{reference_block}{known_block}
         请严格按照以下JSON格式返回：
         {{
             "translation": "中文翻译内容",
@@ -106,61 +230,596 @@ async def translate_text(request: TranslationRequest):
         }}
         """
 
-        response = client.chat_completion(
-            model="deepseek-chat",
-            messages=[{"role": "user", "content": prompt}]
-        )
-        
+def parse_translation(response: str) -> dict:
+    """
+    解析AI响应, 只保留translation和vocabulary
+    """
+    with span("parse"):
         try:
-            # 解析AI响应
             result = json.loads(response)
-            translation = result.get("translation", "")
-            vocabulary = result.get("vocabulary", [])
-            
-            # 生成响应
-            response_data = {
-                "success": True,
-                "translation": translation,
-                "vocabulary": vocabulary
-            }
-            
-            # 如果需要Word文档
-            if request.output_format == "word":
-                filename = f"translation_{uuid.uuid4().hex[:8]}.docx"
-                file_path = create_word_document(
-                    original_text=request.text,
-                    translation=translation,
-                    vocabulary=vocabulary,
-                    filename=filename
-                )
-                response_data["word_document_url"] = f"/downloads/{filename}"
-            
-            return response_data
-            
-        except Exception as e:
             return {
-                "success": False,
-                "error": f"解析AI响应失败: {str(e)}",
-                "raw_response": response
+                "translation": result.get("translation", ""),
+                "vocabulary": result.get("vocabulary", [])
             }
-            
+        except Exception as e:
+            PARSE_FAILURES.inc()
+            raise TranslationParseError(f"解析AI响应失败: {str(e)}", response)
+
+def llm_slot():
+    """
+    大模型调用的准入控制, 按当前请求的截止时间排队或拒绝
+    """
+    if limiter is None:
+        return nullcontext()
+    return limiter.slot(request_deadline.get())
+
+async def chat(prompt: str) -> str:
+    PROMPT_BYTES.observe(len(prompt.encode("utf-8")))
+    start = time.perf_counter()
+    async with llm_slot():
+        record_span("queue", time.perf_counter() - start)
+        with span("llm"):
+            response = await client.chat_completion(messages=[{"role": "user", "content": prompt}])
+    RESPONSE_BYTES.observe(len(response.encode("utf-8")))
+    return response
+
+def set_deadline(timeout: float = None) -> float:
+    deadline = time.monotonic() + (timeout or request_timeout)
+    request_deadline.set(deadline)
+    return deadline
+
+def overload_exception(e: OverloadError) -> HTTPException:
+    return HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+def apply_glossary(result: dict, known_terms: list) -> dict:
+    """
+    模型返回的新词汇交给后台线程收录进术语表, 再与本地匹配到的已知术语合并
+    """
+    if glossary is not None and glossary_learn and result["vocabulary"]:
+        submit_write(glossary.learn, list(result["vocabulary"]))
+    if known_terms:
+        result["vocabulary"] = merge_vocabulary([known_terms, result["vocabulary"]])
+    return result
+
+def remember(text: str, key: str, result: dict):
+    """
+    新的翻译结果立即放入内存缓存, SQLite持久层和翻译记忆由后台线程写入
+    """
+    if cache is not None:
+        cache.put_memory(key, result)
+        submit_write(cache.set, key, result)
+    if memory is not None:
+        submit_write(memory.add_result, text, result)
+
+async def call_translate(text: str, key: str, reference=None) -> dict:
+    """
+    调用大模型翻译一段文本并写回缓存; reference为翻译记忆中的相似句对, 作为参考放进prompt
+    """
+    with span("prompt"):
+        known_terms = glossary.match(text) if glossary is not None else []
+        prompt = build_prompt(text, reference, known_terms)
+    response = await chat(prompt)
+    result = apply_glossary(parse_translation(response), known_terms)
+    remember(text, key, result)
+    return result
+
+async def translate_one(text: str, include_vocabulary: bool = True, bypass_cache: bool = False) -> dict:
+    """
+    翻译一段文本: 先查缓存和翻译记忆, 未命中再调用大模型(相同原文的并发请求合并为一次调用);
+    bypass_cache只跳过读取, 新结果仍会写回缓存
+    """
+    key = TranslationCache.make_key(text, include_vocabulary)
+    if cache is not None and not bypass_cache:
+        with span("cache"):
+            cached = await cache_lookup(key)
+        if cached is not None:
+            return cached
+
+    reference = None
+    if memory is not None and not bypass_cache:
+        with span("memory"):
+            match = await asyncio.to_thread(memory.lookup, text)
+        if match is not None and memory.same_source(text, match):
+            memory.reused += 1
+            return {"translation": match.translation, "vocabulary": match.vocabulary}
+        if match is not None and match.similarity >= tm_reference_threshold:
+            memory.referenced += 1
+            reference = match
+
+    return await inflight.do(key, lambda: call_translate(text, key, reference))
+
+async def translate_packed(texts: list, keys: list) -> dict:
+    """
+    多段短文本拼进同一个prompt翻译, 返回{组内序号: 结果}, 解析出的条目写回缓存
+    """
+    response = await chat(build_batch_prompt(texts))
+    results = parse_batch_translation(response, len(texts))
+    for pos, result in results.items():
+        apply_glossary(result, glossary.match(texts[pos]) if glossary is not None else [])
+        remember(texts[pos], keys[pos], result)
+    return results
+
+async def translate_batch(texts: list, include_vocabulary: bool = True, bypass_cache: bool = False) -> list:
+    """
+    批量翻译: 命中缓存的直接返回, 批内重复和其他请求在途的原文合并, 短文本拼接成共享prompt,
+    其余单独翻译; 上游调用数受batch_concurrency限制。返回与texts等长的结果或异常列表
+    """
+    semaphore = asyncio.Semaphore(batch_concurrency)
+
+    async def limited(coro):
+        async with semaphore:
+            return await coro
+
+    keys = [TranslationCache.make_key(text, include_vocabulary) for text in texts]
+    outcomes = [None] * len(texts)
+    first_index = {}  # 键 -> 批内第一次出现的下标
+    for i, key in enumerate(keys):
+        if key not in first_index:
+            first_index[key] = i
+    if cache is not None and not bypass_cache:
+        misses = []
+        for key, i in first_index.items():
+            outcomes[i] = cache.peek(key)
+            if outcomes[i] is None:
+                misses.append(i)
+        # 内存层未命中的一次性在线程池中查持久层
+        if misses:
+            found = await asyncio.to_thread(lambda: [cache.get(keys[i]) for i in misses])
+            for i, cached in zip(misses, found):
+                outcomes[i] = cached
+
+    pending = [(i, texts[i]) for key, i in first_index.items() if outcomes[i] is None]
+    groups, singles = pack_items([item for item in pending if not inflight.inflight(keys[item[0]])])
+    singles += [item for item in pending if inflight.inflight(keys[item[0]])]
+
+    async def pick_packed(group_task, pos, index):
+        try:
+            results = await asyncio.shield(group_task)
+        except Exception:
+            results = {}
+        if pos in results:
+            return results[pos]
+        # 拼接响应里缺了这一条, 退回单独翻译
+        return await limited(call_translate(texts[index], keys[index]))
+
+    calls = {}
+    for group in groups:
+        group_task = asyncio.ensure_future(limited(translate_packed(
+            [text for _, text in group], [keys[index] for index, _ in group]
+        )))
+        for pos, (index, _) in enumerate(group):
+            calls[index] = inflight.do(
+                keys[index], lambda group_task=group_task, pos=pos, index=index: pick_packed(group_task, pos, index)
+            )
+    for index, text in singles:
+        calls[index] = inflight.do(
+            keys[index], lambda text=text, key=keys[index]: limited(call_translate(text, key))
+        )
+
+    results = await asyncio.gather(*calls.values(), return_exceptions=True)
+    for index, result in zip(calls.keys(), results):
+        outcomes[index] = result
+    for i, key in enumerate(keys):
+        if outcomes[i] is None:
+            outcomes[i] = outcomes[first_index[key]]
+    return outcomes
+
+async def iter_segment_results(segments: list, include_vocabulary: bool = True, bypass_cache: bool = False):
+    """
+    有限并发地翻译各分段, 按原顺序逐个产出(分段结果, 分隔符)
+    """
+    semaphore = asyncio.Semaphore(long_text_concurrency)
+
+    async def translate_segment(segment):
+        async with semaphore:
+            return await translate_one(segment, include_vocabulary, bypass_cache)
+
+    tasks = [asyncio.ensure_future(translate_segment(segment)) for segment, _ in segments]
+    try:
+        for task, (_, sep) in zip(tasks, segments):
+            yield await task, sep
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def translate_long(text: str, include_vocabulary: bool = True, bypass_cache: bool = False) -> dict:
+    """
+    长文档模式: 按段落/句子切分, 有限并发地翻译各分段, 再按原顺序拼接译文并合并词汇表
+    """
+    segments = split_segments(text, long_text_segment_tokens)
+    if len(segments) <= 1:
+        return await translate_one(text, include_vocabulary, bypass_cache)
+
+    parts = [item async for item in iter_segment_results(segments, include_vocabulary, bypass_cache)]
+    return {
+        "translation": merge_translations([(result["translation"], sep) for result, sep in parts]),
+        "vocabulary": merge_vocabulary([result["vocabulary"] for result, _ in parts])
+    }
+
+async def translate(text: str, include_vocabulary: bool = True, bypass_cache: bool = False,
+                    long_text: bool = False) -> dict:
+    """
+    翻译入口: 显式要求或文本超过阈值时走长文档模式
+    """
+    if long_text or estimate_tokens(text) > long_text_threshold_tokens:
+        return await translate_long(text, include_vocabulary, bypass_cache)
+    return await translate_one(text, include_vocabulary, bypass_cache)
+
+async def handle_translation(request: TranslationRequest) -> dict:
+    """
+    翻译并按需生成Word文档, 返回接口响应; 解析失败时返回success=False
+    """
+    try:
+        result = await translate(
+            request.text,
+            include_vocabulary=request.include_vocabulary,
+            bypass_cache=request.bypass_cache,
+            long_text=request.long_text
+        )
+    except TranslationParseError as e:
+        return {
+            "success": False,
+            "error": str(e),
+            "raw_response": e.raw_response
+        }
+
+    translation = result["translation"]
+    vocabulary = result["vocabulary"]
+
+    # 生成响应
+    response_data = {
+        "success": True,
+        "translation": translation,
+        "vocabulary": vocabulary
+    }
+
+    # 如果需要Word文档
+    if request.output_format == "word":
+        filename = await create_word_document(
+            original_text=request.text,
+            translation=translation,
+            vocabulary=vocabulary
+        )
+        response_data["word_document_url"] = f"/downloads/{filename}"
+    elif request.output_format in INLINE_FORMATS:
+        response_data["word_document"] = await render_word_inline(request.text, translation, vocabulary)
+
+    return response_data
+
+@app.post(translate_url)
+async def translate_text(request: TranslationRequest, x_request_timeout: float = Header(None)):
+    set_deadline(x_request_timeout)
+    try:
+        response_data = await handle_translation(request)
+        if "word_document" in response_data:
+            return inline_word_response(request.output_format, response_data)
+        return response_data
+    except OverloadError as e:
+        raise overload_exception(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/downloads/{filename}")
-async def download_file(filename: str):
+@app.post(translate_url + "/jobs", status_code=202)
+async def submit_translation_job(request: TranslationRequest):
     """
-    下载Word文档文件
+    提交异步翻译/导出任务, 立即返回任务ID; 队列满时返回429
     """
-    file_path = os.path.join(DOWNLOAD_DIR, filename)
-    if os.path.exists(file_path):
-        return FileResponse(
-            path=file_path,
-            filename=f"translation_{filename}",
-            media_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+    if request.output_format in INLINE_FORMATS:
+        raise HTTPException(status_code=400, detail="异步任务不支持内联Word文档, 请使用output_format=word")
+    try:
+        job = await job_queue.submit(request)
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(job_queue.retry_after())}
         )
-    else:
+    return {
+        "success": True,
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"{translate_url}/jobs/{job.id}"
+    }
+
+@app.get(translate_url + "/jobs/stats")
+async def translation_job_stats():
+    """
+    任务队列指标: 队列深度、排队等待和处理耗时
+    """
+    return job_queue.stats()
+
+@app.get(translate_url + "/jobs/{job_id}")
+async def get_translation_job(job_id: str, wait: float = 0):
+    """
+    查询任务状态; wait>0时长轮询, 最多等待job_max_wait秒
+    """
+    job = await job_queue.status(job_id, min(max(wait, 0), job_max_wait))
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    return {"success": True, **job}
+
+async def stream_translation(request: TranslationRequest, timeout: float = None):
+    """
+    生成SSE事件流: translation(增量译文) -> vocabulary -> done, 失败时发送error
+    """
+    set_deadline(timeout)
+    try:
+        text = request.text
+        segments = None
+        if request.long_text or estimate_tokens(text) > long_text_threshold_tokens:
+            segments = split_segments(text, long_text_segment_tokens)
+
+        if segments and len(segments) > 1:
+            # 长文档: 各分段并行翻译, 按顺序完成一段推送一段
+            translations, vocabularies = [], []
+            async for result, sep in iter_segment_results(segments, request.include_vocabulary, request.bypass_cache):
+                translations.append((result["translation"], sep))
+                vocabularies.append(result["vocabulary"])
+                if len(translations) == len(segments):
+                    sep = ""
+                yield sse_event("translation", {"delta": result["translation"].strip() + sep})
+            result = {
+                "translation": merge_translations(translations),
+                "vocabulary": merge_vocabulary(vocabularies)
+            }
+        else:
+            key = TranslationCache.make_key(text, request.include_vocabulary)
+            result = None
+            if cache is not None and not request.bypass_cache:
+                result = await cache_lookup(key)
+
+            if result is not None:
+                yield sse_event("translation", {"delta": result["translation"]})
+            else:
+                with span("prompt"):
+                    known_terms = glossary.match(text) if glossary is not None else []
+                    prompt = build_prompt(text, known_terms=known_terms)
+                PROMPT_BYTES.observe(len(prompt.encode("utf-8")))
+                extractor = TranslationFieldExtractor()
+                chunks, sent = [], []
+                async with llm_slot():
+                    # 包含向客户端推送的时间, 与非流式的llm阶段分开统计
+                    with span("llm_stream"):
+                        async for chunk in client.stream_chat_completion(
+                            messages=[{"role": "user", "content": prompt}]
+                        ):
+                            chunks.append(chunk)
+                            delta = extractor.feed(chunk)
+                            if delta:
+                                sent.append(delta)
+                                yield sse_event("translation", {"delta": delta})
+
+                response = "".join(chunks)
+                RESPONSE_BYTES.observe(len(response.encode("utf-8")))
+                result = apply_glossary(parse_translation(response), known_terms)
+                # 增量提取没拿全时(例如字段格式不规范), 补发剩余部分
+                sent_text = "".join(sent)
+                if result["translation"] != sent_text and result["translation"].startswith(sent_text):
+                    yield sse_event("translation", {"delta": result["translation"][len(sent_text):]})
+                remember(text, key, result)
+
+        yield sse_event("vocabulary", {"vocabulary": result["vocabulary"]})
+
+        done = {"success": True}
+        if request.output_format == "word":
+            filename = await create_word_document(
+                original_text=text,
+                translation=result["translation"],
+                vocabulary=result["vocabulary"]
+            )
+            done["word_document_url"] = f"/downloads/{filename}"
+        yield sse_event("done", done)
+
+    except TranslationParseError as e:
+        yield sse_event("error", {"success": False, "error": str(e), "raw_response": e.raw_response})
+    except OverloadError as e:
+        yield sse_event("error", {"success": False, "error": str(e), "retry_after": e.retry_after})
+    except Exception as e:
+        yield sse_event("error", {"success": False, "error": str(e)})
+
+@app.post(translate_url + "/stream")
+async def translate_text_stream(request: TranslationRequest,
+                                x_request_timeout: float = Header(None)):
+    """
+    流式翻译(Server-Sent Events), 译文随模型生成逐段推送
+    """
+    if request.output_format in INLINE_FORMATS:
+        raise HTTPException(status_code=400, detail="流式接口不支持内联Word文档, 请使用output_format=word")
+    return StreamingResponse(
+        stream_translation(request, x_request_timeout),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post(translate_url + "/batch")
+async def translate_text_batch(request: BatchTranslationRequest, x_request_timeout: float = Header(None)):
+    """
+    批量翻译, 每条单独返回结果或错误
+    """
+    set_deadline(x_request_timeout)
+    if len(request.texts) > batch_max_items:
+        raise HTTPException(status_code=400, detail=f"单次最多{batch_max_items}条")
+
+    outcomes = await translate_batch(
+        request.texts,
+        include_vocabulary=request.include_vocabulary,
+        bypass_cache=request.bypass_cache
+    )
+
+    results = []
+    for index, outcome in enumerate(outcomes):
+        if isinstance(outcome, TranslationParseError):
+            results.append({
+                "index": index,
+                "success": False,
+                "error": str(outcome),
+                "raw_response": outcome.raw_response
+            })
+        elif isinstance(outcome, Exception):
+            results.append({"index": index, "success": False, "error": str(outcome)})
+        else:
+            results.append({
+                "index": index,
+                "success": True,
+                "translation": outcome["translation"],
+                "vocabulary": outcome["vocabulary"]
+            })
+    return {"success": True, "results": results}
+
+@app.post("/api/v1/glossary/import")
+async def import_glossary(request: GlossaryImportRequest):
+    """
+    导入人工整理的术语
+    """
+    if glossary is None:
+        raise HTTPException(status_code=404, detail="术语表未启用")
+    imported = await asyncio.to_thread(glossary.import_terms, request.terms, request.overwrite)
+    return {"success": True, "imported": imported, **glossary.stats()}
+
+@app.get("/api/v1/glossary/stats")
+async def glossary_stats():
+    if glossary is None:
+        return {"enabled": False}
+    return {"enabled": True, **glossary.stats()}
+
+@app.get("/api/v1/limiter/stats")
+async def limiter_stats():
+    """
+    并发限制当前值、在途数和排队深度
+    """
+    if limiter is None:
+        return {"enabled": False}
+    return {"enabled": True, **limiter.stats()}
+
+@app.get("/api/v1/backends/stats")
+async def backend_stats():
+    """
+    多后端路由的延迟、错误率和对冲统计(llm_backend="router"时)
+    """
+    if not hasattr(client, "stats"):
+        return {"router": False}
+    return {"router": True, **client.stats()}
+
+@app.get("/api/v1/cache/stats")
+async def cache_stats():
+    """
+    缓存命中统计(当前worker进程)
+    """
+    stats = {"enabled": cache is not None, **(cache.stats() if cache is not None else {})}
+    stats["coalescing"] = inflight.stats()
+    if memory is not None:
+        stats["translation_memory"] = memory.stats()
+    return stats
+
+def collect_component_metrics() -> list:
+    """
+    抓取时读取各组件已有的计数器, 转成Prometheus指标
+    """
+    families = []
+    if cache is not None:
+        stats = cache.stats()
+        families.append(("translate_cache_lookups_total", "counter", "翻译缓存查询次数", ["result"], {
+            ("memory_hit",): stats["memory_hits"],
+            ("disk_hit",): stats["disk_hits"],
+            ("miss",): stats["misses"]
+        }))
+    stats = inflight.stats()
+    families.append(("translate_coalesce_calls_total", "counter", "合并后的上游调用数和被合并的请求数", ["kind"], {
+        ("call",): stats["calls"],
+        ("coalesced",): stats["coalesced"]
+    }))
+    if memory is not None:
+        stats = memory.stats()
+        families.append(("translate_memory_lookups_total", "counter", "翻译记忆查询结果", ["result"], {
+            ("reused",): stats["reused"],
+            ("referenced",): stats["referenced"],
+            ("miss",): stats["lookups"] - stats["reused"] - stats["referenced"]
+        }))
+    if limiter is not None:
+        stats = limiter.stats()
+        families.append(("translate_limiter", "gauge", "并发限制当前值、在途数和排队深度", ["field"], {
+            ("limit",): stats["limit"],
+            ("inflight",): stats["inflight"],
+            ("queue_depth",): stats["queue_depth"]
+        }))
+        families.append(("translate_limiter_rejected_total", "counter", "并发限制拒绝次数", ["reason"], {
+            ("queue_full",): stats["rejected_queue_full"],
+            ("deadline",): stats["rejected_deadline"],
+            ("queue_timeout",): stats["queue_timeouts"]
+        }))
+    stats = job_queue.stats()
+    families.append(("translate_jobs", "gauge", "导出任务队列深度和执行中任务数", ["field"], {
+        ("queue_depth",): stats["queue_depth"],
+        ("running",): stats["running"]
+    }))
+    return families
+
+metrics.REGISTRY.add_collector(collect_component_metrics)
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """
+    Prometheus文本格式的指标(当前worker进程)
+    """
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/api/v1/admin/downloads/cleanup")
+async def cleanup_downloads(request: CleanupRequest):
+    """
+    立即清理下载文件, 可临时指定更严格的过期时间和容量上限
+    """
+    result = await asyncio.to_thread(artifacts.sweep, request.older_than, request.max_bytes)
+    return {"success": True, **result, **artifacts.stats()}
+
+@app.get("/api/v1/admin/downloads/stats")
+async def download_stats():
+    return artifacts.stats()
+
+@app.get("/downloads/{filename}")
+async def download_file(filename: str, request: Request):
+    """
+    下载Word文档文件, 支持ETag/Last-Modified条件请求
+    """
+    media_type = DOCX_MEDIA_TYPE
+    # 文件传输耗时计入translate_http_request_seconds, 这里只统计查找
+    with span("download_resolve"):
+        found = await asyncio.to_thread(artifacts.resolve, filename)
+    if found is None:
+        # 兼容旧版平铺在downloads目录下的文件
+        file_path = os.path.join(DOWNLOAD_DIR, os.path.basename(filename))
+        if os.path.isfile(file_path):
+            return FileResponse(path=file_path, filename=f"translation_{filename}", media_type=media_type)
         raise HTTPException(status_code=404, detail="文件未找到")
 
+    file_path, stat = found
+    # 文件名就是内容哈希, 内容不会变化
+    headers = {
+        "ETag": f'"{filename[:-len(".docx")]}"',
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Cache-Control": f"public, max-age={artifact_cache_max_age}, immutable"
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        if "*" in tags or headers["ETag"] in tags:
+            return Response(status_code=304, headers=headers)
+    else:
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                since = None
+            if since is not None and int(stat.st_mtime) <= since:
+                return Response(status_code=304, headers=headers)
+
+    return FileResponse(
+        path=file_path,
+        filename=f"translation_{filename}",
+        media_type=media_type,
+        headers=headers,
+        stat_result=stat
+    )
+
 if __name__ == "__main__":
     uvicorn.run(app, host=host, port=port)
\ No newline at end of file
@@ -0,0 +1,299 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from array import array
+from collections import namedtuple
+
+from cache import normalize_text
+from config import *
+from segmenter import split_sentences
+
+TMMatch = namedtuple("TMMatch", "similarity source translation vocabulary")
+
+_EMPTY = (1 << 64) - 1
+_CHINESE_SENTENCE_END = re.compile(r"(?<=[。！？!?；;])\s*")
+
+# 精确校验的候选数
+_VERIFY_CANDIDATES = 3
+
+
+class TranslationMemory:
+    """
+    翻译记忆: 保存历史句对, 用字符n-gram的MinHash签名做LSH分桶, 近似匹配相似原文
+
+    签名采用单次哈希的分桶MinHash(one permutation hashing), 每个n-gram只哈希一次;
+    签名连续存放在array中, 分桶只存签名序号, 译文等内容按需从SQLite读取;
+    查询和写入都在线程池中执行, 由_lock串行化对索引和数据库连接的访问
+    """
+
+    def __init__(self, db_path: str = tm_db_path, ngram: int = tm_ngram, num_perm: int = tm_num_perm,
+                 bands: int = tm_bands, refresh_interval: float = tm_refresh_interval):
+        if num_perm % bands:
+            raise ValueError("tm_num_perm必须是tm_bands的整数倍")
+        self.db_path = db_path
+        self.ngram = ngram
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.refresh_interval = refresh_interval
+        self._buckets = [{} for _ in range(bands)]
+        self._signatures = array("Q")
+        self._ids = array("q")  # 签名序号 -> segments.id
+        self._last_id = 0
+        self._last_refresh = 0.0
+        self._conn = None
+        self._conn_pid = None
+        self._lock = threading.RLock()
+        self.lookups = 0
+        self.reused = 0
+        self.referenced = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None or self._conn_pid != os.getpid():
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=5.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS segments (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    source_hash INTEGER NOT NULL,
+                    source TEXT NOT NULL,
+                    translation TEXT NOT NULL,
+                    vocabulary TEXT NOT NULL,
+                    signature BLOB NOT NULL,
+                    created_at REAL NOT NULL,
+                    normalized TEXT
+                )
+            ''')
+            conn.commit()
+            self._migrate(conn)
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_segments_normalized ON segments (normalized)")
+            conn.commit()
+            self._conn = conn
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def _migrate(self, conn: sqlite3.Connection):
+        """
+        旧库补充normalized列(归一化后的原文, 唯一索引去重): 回填时只差大小写和空白的重复句对保留最早的一条
+        """
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(segments)")}
+        if "normalized" not in columns:
+            try:
+                conn.execute("ALTER TABLE segments ADD COLUMN normalized TEXT")
+            except sqlite3.OperationalError as e:
+                # 其他worker刚加上同一列
+                if "duplicate column" not in str(e):
+                    raise
+        if conn.execute("SELECT 1 FROM segments WHERE normalized IS NULL LIMIT 1").fetchone() is None:
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            seen = {row[0] for row in conn.execute("SELECT normalized FROM segments WHERE normalized IS NOT NULL")}
+            rows = conn.execute("SELECT id, source FROM segments WHERE normalized IS NULL ORDER BY id").fetchall()
+            for segment_id, source in rows:
+                normalized = self._normalize(source)
+                if normalized in seen:
+                    conn.execute("DELETE FROM segments WHERE id = ?", (segment_id,))
+                else:
+                    seen.add(normalized)
+                    conn.execute("UPDATE segments SET normalized = ? WHERE id = ?", (normalized, segment_id))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def _normalize(self, text: str) -> str:
+        return " ".join(normalize_text(text).lower().split())
+
+    def shingles(self, text: str) -> set:
+        text = self._normalize(text)
+        if len(text) < self.ngram:
+            return {text} if text else set()
+        return {text[i:i + self.ngram] for i in range(len(text) - self.ngram + 1)}
+
+    def signature(self, shingles: set) -> list:
+        # 哈希必须跨进程稳定(签名会落盘), 不能用内置hash()
+        n = self.num_perm
+        mins = [_EMPTY] * n
+        for shingle in shingles:
+            h = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+            slot, value = h % n, h // n
+            if value < mins[slot]:
+                mins[slot] = value
+        # 空槽用右侧最近的非空槽补齐(旋转加密), 加上距离偏移以区分来源
+        if _EMPTY in mins:
+            filled = list(mins)
+            for slot in range(n):
+                if filled[slot] != _EMPTY:
+                    continue
+                for distance in range(1, n):
+                    value = filled[(slot + distance) % n]
+                    if value != _EMPTY:
+                        mins[slot] = (value + distance * 0x9E3779B97F4A7C15) & (_EMPTY - 1)
+                        break
+        return mins
+
+    def _band_keys(self, signature):
+        rows = self.rows
+        return [hash(tuple(signature[i * rows:(i + 1) * rows])) for i in range(self.bands)]
+
+    def _index(self, segment_id: int, signature):
+        pos = len(self._ids)
+        self._ids.append(segment_id)
+        self._signatures.extend(signature)
+        for bucket, key in zip(self._buckets, self._band_keys(signature)):
+            entry = bucket.get(key)
+            # 大多数桶只有一个成员, 直接存序号以节省内存
+            if entry is None:
+                bucket[key] = pos
+            elif isinstance(entry, int):
+                bucket[key] = [entry, pos]
+            else:
+                entry.append(pos)
+
+    def refresh(self):
+        """
+        把数据库中尚未载入索引的句对(包括其他worker写入的)加入内存索引
+        """
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT id, signature FROM segments WHERE id > ? ORDER BY id", (self._last_id,)
+            )
+            for segment_id, blob in rows:
+                self._index(segment_id, array("Q", blob))
+                self._last_id = segment_id
+            self._last_refresh = time.monotonic()
+
+    def add_many(self, pairs: list):
+        """
+        保存句对, pairs为[(原文, 译文, 词汇表)]; 归一化后原文已存在的跳过
+        """
+        with self._lock:
+            self._add_many(pairs)
+            self.refresh()
+
+    def _add_many(self, pairs: list):
+        conn = self._db()
+        now = time.time()
+        for source, translation, vocabulary in pairs:
+            normalized = self._normalize(source)
+            if not normalized or not translation:
+                continue
+            if conn.execute("SELECT 1 FROM segments WHERE normalized = ?", (normalized,)).fetchone():
+                continue
+            signature = array("Q", self.signature(self.shingles(source)))
+            # normalized上有唯一索引, 其他worker同时写入相同原文时由数据库去重
+            conn.execute(
+                '''INSERT OR IGNORE INTO segments
+                   (source_hash, source, normalized, translation, vocabulary, signature, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                (zlib.crc32(normalized.encode("utf-8")), source, normalized, translation,
+                 json.dumps(vocabulary, ensure_ascii=False), signature.tobytes(), now)
+            )
+        conn.commit()
+
+    def add_result(self, text: str, result: dict):
+        """
+        保存一次翻译结果: 整段句对, 以及句子数能对齐时的逐句句对
+        """
+        translation = result.get("translation", "")
+        vocabulary = result.get("vocabulary", [])
+        pairs = [(text, translation, vocabulary)]
+
+        sources = [s for p in re.split(r"\n\s*\n", text) for s in split_sentences(p)]
+        targets = [t for t in _CHINESE_SENTENCE_END.split(translation) if t.strip()]
+        if len(sources) > 1 and len(sources) == len(targets):
+            for source, target in zip(sources, targets):
+                lowered = source.lower()
+                sentence_vocabulary = [
+                    vocab for vocab in vocabulary
+                    if isinstance(vocab, dict) and str(vocab.get("english", "")).lower() in lowered
+                ]
+                pairs.append((source, target.strip(), sentence_vocabulary))
+        self.add_many(pairs)
+
+    def same_source(self, text: str, match: TMMatch) -> bool:
+        """
+        归一化后原文是否完全相同(只差大小写和空白); 相似度再高也可能只差一个not或一个数字,
+        只有完全相同时才能直接复用译文
+        """
+        return self._normalize(text) == self._normalize(match.source)
+
+    def lookup(self, text: str):
+        """
+        返回最相似的历史句对TMMatch(相似度为字符n-gram的Jaccard系数), 没有候选时返回None
+        """
+        with self._lock:
+            return self._lookup(text)
+
+    def _lookup(self, text: str):
+        if time.monotonic() - self._last_refresh > self.refresh_interval:
+            self.refresh()
+        self.lookups += 1
+
+        shingles = self.shingles(text)
+        if not shingles:
+            return None
+        signature = self.signature(shingles)
+
+        hits = {}
+        for bucket, key in zip(self._buckets, self._band_keys(signature)):
+            entry = bucket.get(key)
+            if entry is None:
+                continue
+            for pos in ([entry] if isinstance(entry, int) else entry):
+                hits[pos] = hits.get(pos, 0) + 1
+        if not hits:
+            return None
+
+        n = self.num_perm
+        estimates = []
+        for pos in sorted(hits, key=hits.get, reverse=True)[:_VERIFY_CANDIDATES * 4]:
+            stored = self._signatures[pos * n:(pos + 1) * n]
+            agree = sum(1 for x, y in zip(signature, stored) if x == y)
+            estimates.append((agree, pos))
+        estimates.sort(reverse=True)
+
+        # 只精确校验估计值接近最优的少数候选
+        best = None
+        conn = self._db()
+        top = estimates[0][0]
+        for agree, pos in estimates[:_VERIFY_CANDIDATES]:
+            if agree < top - 2:
+                break
+            row = conn.execute(
+                "SELECT source, translation, vocabulary FROM segments WHERE id = ?", (self._ids[pos],)
+            ).fetchone()
+            if row is None:
+                continue
+            other = self.shingles(row[0])
+            similarity = len(shingles & other) / len(shingles | other)
+            if best is None or similarity > best.similarity:
+                best = TMMatch(similarity, row[0], row[1], json.loads(row[2]))
+        return best
+
+    def close(self):
+        """
+        关闭本进程的数据库连接(fork前调用), 内存中的数据保留, 下次访问时重新连接
+        """
+        if self._conn is not None and self._conn_pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+        self._conn_pid = None
+
+    def stats(self) -> dict:
+        return {
+            "segments": len(self._ids),
+            "lookups": self.lookups,
+            "reused": self.reused,
+            "referenced": self.referenced
+        }
@@ -1,12 +1,24 @@
 from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
-import sqlite3
+import base64
 import json
+import math
+import mimetypes
 import os
+import sqlite3
+import threading
 import uuid
 from datetime import datetime
 import requests
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import HTTPException
+from db import Database
+from reconciler import FileMetadataReconciler, stat_file
+from uploads import ChunkedUploads, UploadError, UploadCompleted
+from live_ingest import LiveIngest, IngestError
+from tokens import TokenCache, RoomCache
+from media_index import MediaIndexer
+from storage import BlobStore, RetentionSweeper
 
 app = Flask(__name__)
 CORS(app)
@@ -16,16 +28,93 @@ CONFIG = {
     'AGORA_APP_ID': '87e86c2155aa461fab6f68e7fa519498',
     'AGORA_APP_CERTIFICATE': '7726c35606cc41979e588e07de4f67ee',
     'UPLOAD_FOLDER': 'recordings',
-    'DATABASE': 'meeting.db'
+    'DATABASE': 'meeting.db',
+    'DB_POOL_SIZE': 16,  # 连接池保留的空闲连接数
+    'DB_BUSY_TIMEOUT': 5.0,  # 等待写锁的秒数
+    'DB_CACHE_SIZE_KB': 16384,  # 每个连接的页缓存
+    'DB_MMAP_SIZE': 256 * 1024 * 1024,  # 内存映射读取的字节数
+    'LIST_PAGE_SIZE': 50,  # 录制列表默认每页条数
+    'LIST_MAX_PAGE_SIZE': 500,
+    'RECONCILE_INTERVAL': 300,  # 后台同步文件大小/存在状态的间隔(秒), 0表示不启动
+    'RECONCILE_BATCH': 500,
+    'UPLOAD_CHUNK_SIZE': 8 * 1024 * 1024,  # 分片上传建议的分片大小
+    'MAX_UPLOAD_SIZE': 4 * 1024 ** 3,
+    'UPLOAD_EXPIRY': 24 * 3600,  # 未完成的分片上传保留时间(秒)
+    'UPLOAD_COMPLETE_WAIT': 30,  # 重复的完成请求等待正在进行的完成操作的秒数
+    'UPLOAD_WRITE_TIMEOUT': 600,  # 分片写入超过该秒数仍未结束时视为中断, 不再阻止完成上传
+    'LIVE_CHUNK_MAX_SIZE': 16 * 1024 * 1024,  # 录制中实时追加的单个分片上限
+    # 录制文件下载交给前端代理发送: None(由应用发送, gunicorn等支持wsgi.file_wrapper的服务器会用sendfile)
+    # / 'x-sendfile'(Apache、lighttpd) / 'x-accel'(nginx, 需配置internal location映射UPLOAD_FOLDER)
+    'DOWNLOAD_OFFLOAD': None,
+    'X_ACCEL_PREFIX': '/protected-recordings/',
+    'RECORDING_CACHE_MAX_AGE': 3600,  # 已结束录制的缓存时间(秒), 录制中的文件不缓存
+    'TOKEN_TTL': 3600,  # token有效期(秒)
+    'TOKEN_REFRESH_MARGIN': 300,  # 缓存的token剩余有效期不足该秒数时重新签发
+    'TOKEN_BATCH_MAX': 1000,  # 批量签发接口一次最多的用户数
+    'ROOM_CACHE_TTL': 60,  # 房间存在性缓存秒数, 其他worker关闭的房间最多这么久后不能再加入
+    'INDEX_WORKERS': 2,  # 解析录制文件头部(时长、编码、关键帧)的后台线程数, 0表示不启动
+    'INDEX_SCAN_INTERVAL': 60,  # 补齐未解析录制的扫描间隔(秒)
+    'STORAGE_FOLDER': os.path.join('recordings', 'objects'),  # 按内容寻址的录制文件, 需位于UPLOAD_FOLDER之下
+    'SWEEP_INTERVAL': 600,  # 后台执行保留策略和回收存储的间隔(秒), 0表示不启动; 删除录制后总会立即回收文件
+    'SWEEP_BATCH': 200,  # 每个事务最多处理的录制/文件数
+    'RETENTION_MAX_AGE_DAYS': 0,  # 录制保留天数, 0表示不限
+    'ROOM_QUOTA_BYTES': 0,  # 单个房间录制总大小上限, 超出时删除最早的录制, 0表示不限
+    'STORAGE_MAX_BYTES': 0,  # 全部录制文件总大小上限, 0表示不限
+    'BULK_MAX_ROWS': 10000  # 批量删除/修改状态一次请求最多处理的录制数
 }
 
+app.config['USE_X_SENDFILE'] = CONFIG['DOWNLOAD_OFFLOAD'] == 'x-sendfile'
+
+# 共享的数据库访问层(连接池 + WAL)
+db = Database(
+    CONFIG['DATABASE'],
+    pool_size=CONFIG['DB_POOL_SIZE'],
+    busy_timeout=CONFIG['DB_BUSY_TIMEOUT'],
+    cache_size_kb=CONFIG['DB_CACHE_SIZE_KB'],
+    mmap_size=CONFIG['DB_MMAP_SIZE']
+)
+
+# 文件信息存在recordings表中, 列表接口不再逐个stat文件
+reconciler = FileMetadataReconciler(db, CONFIG['RECONCILE_INTERVAL'], CONFIG['RECONCILE_BATCH'])
+
+# 可续传的分片上传
+chunked_uploads = ChunkedUploads(
+    db, CONFIG['UPLOAD_FOLDER'],
+    chunk_size=CONFIG['UPLOAD_CHUNK_SIZE'],
+    max_size=CONFIG['MAX_UPLOAD_SIZE'],
+    expiry=CONFIG['UPLOAD_EXPIRY'],
+    complete_wait=CONFIG['UPLOAD_COMPLETE_WAIT'],
+    write_timeout=CONFIG['UPLOAD_WRITE_TIMEOUT']
+)
+
+# 录制过程中实时追加分片
+live_ingest = LiveIngest(db, max_chunk_size=CONFIG['LIVE_CHUNK_MAX_SIZE'])
+
+# token和房间存在性缓存, 大量用户同时加入时不必每次签发token、查询数据库
+token_cache = TokenCache(
+    CONFIG['AGORA_APP_ID'], CONFIG['AGORA_APP_CERTIFICATE'],
+    ttl=CONFIG['TOKEN_TTL'], refresh_margin=CONFIG['TOKEN_REFRESH_MARGIN']
+)
+room_cache = RoomCache(db, positive_ttl=CONFIG['ROOM_CACHE_TTL'])
+
+# 按内容寻址存储录制文件, 删除录制只减少引用, 由后台线程按保留策略回收空间
+blob_store = BlobStore(db, CONFIG['STORAGE_FOLDER'])
+sweeper = RetentionSweeper(
+    db, blob_store,
+    interval=CONFIG['SWEEP_INTERVAL'],
+    batch=CONFIG['SWEEP_BATCH'],
+    max_age_days=CONFIG['RETENTION_MAX_AGE_DAYS'],
+    room_quota=CONFIG['ROOM_QUOTA_BYTES'],
+    max_bytes=CONFIG['STORAGE_MAX_BYTES']
+)
+
+# 录制文件的容器元数据和关键帧索引
+media_indexer = MediaIndexer(db, workers=CONFIG['INDEX_WORKERS'], interval=CONFIG['INDEX_SCAN_INTERVAL'])
+
 # 初始化数据库
 def init_db():
-    conn = sqlite3.connect(CONFIG['DATABASE'])
-    c = conn.cursor()
-    
     # 创建房间表
-    c.execute('''
+    db.executescript('''
         CREATE TABLE IF NOT EXISTS rooms (
             id TEXT PRIMARY KEY,
             room_name TEXT NOT NULL,
@@ -35,7 +124,7 @@ def init_db():
     ''')
     
     # 创建录制表
-    c.execute('''
+    db.executescript('''
         CREATE TABLE IF NOT EXISTS recordings (
             id TEXT PRIMARY KEY,
             room_id TEXT NOT NULL,
@@ -47,24 +136,71 @@ def init_db():
         )
     ''')
     
-    conn.commit()
-    conn.close()
-
-# Agora token 生成
-def generate_agora_token(channel_name, uid):
-    from agora_token_builder import RtcTokenBuilder
-    import time
+    # 旧库补充文件信息列
+    columns = {row[1] for row in db.query_all('PRAGMA table_info(recordings)')}
+    if 'file_size' not in columns:
+        db.execute('ALTER TABLE recordings ADD COLUMN file_size INTEGER')
+    if 'file_exists' not in columns:
+        db.execute('ALTER TABLE recordings ADD COLUMN file_exists INTEGER')
+    if 'chunk_seq' not in columns:
+        db.execute('ALTER TABLE recordings ADD COLUMN chunk_seq INTEGER')
     
-    app_id = CONFIG['AGORA_APP_ID']
-    app_certificate = CONFIG['AGORA_APP_CERTIFICATE']
-    channel_name = str(channel_name)
-    uid = uid or 0
-    role = 1  # 1: host, 2: audience
-    privilege_expired_ts = int(time.time()) + 3600  # 1小时过期
+    # 列表分页和筛选用的索引
+    db.executescript('''
+        CREATE INDEX IF NOT EXISTS idx_recordings_start ON recordings (start_time DESC, id DESC);
+        CREATE INDEX IF NOT EXISTS idx_recordings_room_start ON recordings (room_id, start_time DESC, id DESC);
+        CREATE INDEX IF NOT EXISTS idx_recordings_status_start ON recordings (status, start_time DESC, id DESC);
+    ''')
     
-    token = RtcTokenBuilder.buildTokenWithUid(
-        app_id, app_certificate, channel_name, uid, role, privilege_expired_ts
-    )
+    chunked_uploads.init_schema()
+    media_indexer.init_schema()
+    blob_store.init_schema()
+
+_init_lock = threading.Lock()
+_init_pid = None
+
+def init_app():
+    """
+    迁移表结构并启动本进程的后台线程, 每个进程只执行一次。
+    gunicorn等WSGI服务器不执行__main__, 由第一个请求触发; 每个worker进程各自启动后台线程
+    """
+    global _init_pid
+    if _init_pid == os.getpid():
+        return
+    with _init_lock:
+        if _init_pid == os.getpid():
+            return
+        for attempt in range(3):
+            try:
+                init_db()
+                break
+            except sqlite3.OperationalError as e:
+                # 多个worker同时迁移时其他进程可能刚加上同一列, 重新检查一遍即可
+                if 'duplicate column' not in str(e) or attempt == 2:
+                    raise
+        reconciler.start()
+        media_indexer.start()
+        sweeper.start()
+        _init_pid = os.getpid()
+
+@app.before_request
+def ensure_initialized():
+    init_app()
+
+def parse_user_id(value):
+    """Agora uid为32位无符号整数, 缺省为0; 非法时返回None"""
+    if isinstance(value, bool):
+        return None
+    try:
+        uid = int(value or 0)
+    except (TypeError, ValueError):
+        return None
+    return uid if 0 <= uid < 2 ** 32 else None
+
+# Agora token 生成(有效期内复用缓存的token)
+def generate_agora_token(channel_name, uid, role=1):
+    # role 1: host, 2: audience
+    token, _ = token_cache.get(channel_name, uid, role)
     return token
 
 # API路由
@@ -77,7 +213,12 @@ def create_room():
     try:
         data = request.get_json()
         room_name = data.get('room_name', f'room_{uuid.uuid4().hex[:8]}')
-        user_id = data.get('user_id', 0)
+        user_id = parse_user_id(data.get('user_id', 0))
+        if user_id is None:
+            return jsonify({
+                'success': False,
+                'error': 'user_id must be an integer'
+            }), 400
         
         room_id = str(uuid.uuid4())
         
@@ -85,14 +226,11 @@ def create_room():
         token = generate_agora_token(room_id, user_id)
         
         # 保存到数据库
-        conn = sqlite3.connect(CONFIG['DATABASE'])
-        c = conn.cursor()
-        c.execute(
+        db.execute(
             'INSERT INTO rooms (id, room_name) VALUES (?, ?)',
             (room_id, room_name)
         )
-        conn.commit()
-        conn.close()
+        room_cache.add(room_id)
         
         return jsonify({
             'success': True,
@@ -113,16 +251,15 @@ def join_room(room_id):
     """加入音视频房间"""
     try:
         data = request.get_json()
-        user_id = data.get('user_id', 0)
+        user_id = parse_user_id(data.get('user_id', 0))
+        if user_id is None:
+            return jsonify({
+                'success': False,
+                'error': 'user_id must be an integer'
+            }), 400
         
         # 检查房间是否存在
-        conn = sqlite3.connect(CONFIG['DATABASE'])
-        c = conn.cursor()
-        c.execute('SELECT * FROM rooms WHERE id = ?', (room_id,))
-        room = c.fetchone()
-        conn.close()
-        
-        if not room:
+        if not room_cache.exists(room_id):
             return jsonify({
                 'success': False,
                 'error': 'Room not found'
@@ -144,31 +281,126 @@ def join_room(room_id):
             'error': str(e)
         }), 500
 
+@app.route('/api/v1/rooms/<room_id>', methods=['DELETE'])
+def close_room(room_id):
+    """关闭房间, 之后不能再加入或签发token; 录制记录保留"""
+    try:
+        closed = db.execute(
+            "UPDATE rooms SET status = 'closed' WHERE id = ? AND status = 'active'",
+            (room_id,)
+        )
+        room_cache.invalidate(room_id)
+        if not closed:
+            return jsonify({
+                'success': False,
+                'error': 'Room not found'
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            'room_id': room_id,
+            'message': 'Room closed'
+        })
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/v1/rooms/<room_id>/tokens', methods=['POST'])
+def issue_room_tokens(room_id):
+    """批量签发token: 一次请求为多个用户生成同一房间的token"""
+    try:
+        data = request.get_json() or {}
+        user_ids = data.get('user_ids')
+        role = data.get('role', 1)
+        
+        if not isinstance(user_ids, list) or not user_ids:
+            return jsonify({
+                'success': False,
+                'error': 'user_ids is required'
+            }), 400
+        if len(user_ids) > CONFIG['TOKEN_BATCH_MAX']:
+            return jsonify({
+                'success': False,
+                'error': f"At most {CONFIG['TOKEN_BATCH_MAX']} user_ids per request"
+            }), 400
+        if role not in (1, 2):
+            return jsonify({
+                'success': False,
+                'error': 'role must be 1 (host) or 2 (audience)'
+            }), 400
+        uids = [parse_user_id(user_id) for user_id in user_ids]
+        if None in uids:
+            return jsonify({
+                'success': False,
+                'error': 'user_ids must be integers'
+            }), 400
+        
+        if not room_cache.exists(room_id):
+            return jsonify({
+                'success': False,
+                'error': 'Room not found'
+            }), 404
+        
+        tokens = {}
+        for user_id, uid in zip(user_ids, uids):
+            token, expires_at = token_cache.get(room_id, uid, role)
+            tokens[str(user_id)] = {'token': token, 'expires_at': expires_at}
+        
+        return jsonify({
+            'success': True,
+            'room_id': room_id,
+            'app_id': CONFIG['AGORA_APP_ID'],
+            'tokens': tokens
+        })
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/v1/tokens/stats', methods=['GET'])
+def token_stats():
+    """token缓存和房间缓存的命中统计(当前进程)"""
+    return jsonify({
+        'success': True,
+        'tokens': token_cache.stats(),
+        'rooms': room_cache.stats()
+    })
+
 @app.route('/api/v1/rooms/<room_id>/record/start', methods=['POST'])
 def start_recording(room_id):
     """开始录制"""
     try:
         # 在实际应用中，这里应该调用Agora云录制API
-        # 这里简化实现，只记录元数据
+        # 这里简化实现，只记录元数据; 浏览器录制的分片通过chunks接口实时追加到文件
+        data = request.get_json(silent=True) or {}
+        file_format = str(data.get('format', 'mp4')).lower()
+        if file_format not in ALLOWED_EXTENSIONS:
+            return jsonify({
+                'success': False,
+                'error': 'Invalid file type'
+            }), 400
         
         recording_id = str(uuid.uuid4())
-        file_path = os.path.join(CONFIG['UPLOAD_FOLDER'], f'{recording_id}.mp4')
+        file_path = os.path.join(CONFIG['UPLOAD_FOLDER'], f'{recording_id}.{file_format}')
         
         # 确保目录存在
         os.makedirs(CONFIG['UPLOAD_FOLDER'], exist_ok=True)
         
-        conn = sqlite3.connect(CONFIG['DATABASE'])
-        c = conn.cursor()
-        c.execute(
-            'INSERT INTO recordings (id, room_id, file_path, start_time, status) VALUES (?, ?, ?, ?, ?)',
+        db.execute(
+            '''INSERT INTO recordings (id, room_id, file_path, start_time, status, file_size, file_exists, chunk_seq)
+               VALUES (?, ?, ?, ?, ?, 0, 0, 0)''',
             (recording_id, room_id, file_path, datetime.now(), 'recording')
         )
-        conn.commit()
-        conn.close()
         
         return jsonify({
             'success': True,
             'recording_id': recording_id,
+            'chunk_url': f'/api/v1/rooms/{room_id}/record/{recording_id}/chunks/',
             'message': 'Recording started'
         })
     
@@ -191,35 +423,87 @@ def stop_recording(room_id):
                 'error': 'Recording ID is required'
             }), 400
         
-        conn = sqlite3.connect(CONFIG['DATABASE'])
-        c = conn.cursor()
-        c.execute(
-            'UPDATE recordings SET end_time = ?, status = ? WHERE id = ?',
-            (datetime.now(), 'stopped', recording_id)
-        )
-        conn.commit()
-        conn.close()
+        # 等正在追加的分片写完, 之后到达的分片会被拒绝
+        with live_ingest.locked(recording_id):
+            row = db.query_one('SELECT file_path, chunk_seq FROM recordings WHERE id = ?', (recording_id,))
+            file_exists, file_size = stat_file(row[0]) if row else (0, 0)
+            db.execute(
+                'UPDATE recordings SET end_time = ?, status = ?, file_exists = ?, file_size = ? WHERE id = ?',
+                (datetime.now(), 'stopped', file_exists, file_size, recording_id)
+            )
+        if row:
+            media_indexer.enqueue(recording_id)
         
+        response = {
+            'success': True,
+            'message': 'Recording stopped',
+            'file_size': file_size,
+            'chunks': (row[1] or 0) if row else 0
+        }
+        # 客户端告知最后一个分片序号时, 报告没有到达的分片
+        last_seq = data.get('last_seq')
+        if isinstance(last_seq, int) and row and last_seq > (row[1] or 0):
+            response['missing_chunks'] = last_seq - (row[1] or 0)
+        return jsonify(response)
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/v1/rooms/<room_id>/record/<recording_id>/chunks/<int:seq>', methods=['POST', 'PUT'])
+def append_recording_chunk(room_id, recording_id, seq):
+    """录制中追加一个MediaRecorder分片(请求体为原始字节), 序号从1开始依次递增"""
+    try:
+        file_size, chunk_seq, duplicate = live_ingest.append(
+            room_id, recording_id, seq, request.stream, request.content_length
+        )
         return jsonify({
             'success': True,
-            'message': 'Recording stopped'
+            'chunk_seq': chunk_seq,
+            'file_size': file_size,
+            'duplicate': duplicate
         })
     
+    except IngestError as e:
+        response = {
+            'success': False,
+            'error': str(e)
+        }
+        if e.expected_seq is not None:
+            response['expected_seq'] = e.expected_seq
+        return jsonify(response), e.status_code
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
+# 容器元数据列, 由media_indexer在后台填充
+MEDIA_COLUMNS = 'index_status, container, duration_ms, video_codec, audio_codec, width, height, bitrate'
+
+def media_info(values):
+    index_status, container, duration_ms, video_codec, audio_codec, width, height, bitrate = values
+    return {
+        'index_status': index_status or 'pending',
+        'container': container,
+        'duration': duration_ms / 1000.0 if duration_ms is not None else None,
+        'video_codec': video_codec,
+        'audio_codec': audio_codec,
+        'width': width,
+        'height': height,
+        'bitrate': bitrate
+    }
+
 @app.route('/api/v1/recordings/<recording_id>', methods=['GET'])
 def get_recording(recording_id):
     """获取录制文件信息"""
     try:
-        conn = sqlite3.connect(CONFIG['DATABASE'])
-        c = conn.cursor()
-        c.execute('SELECT * FROM recordings WHERE id = ?', (recording_id,))
-        recording = c.fetchone()
-        conn.close()
+        recording = db.query_one(f'''
+            SELECT id, room_id, file_path, start_time, end_time, status, {MEDIA_COLUMNS}
+            FROM recordings WHERE id = ?
+        ''', (recording_id,))
         
         if not recording:
             return jsonify({
@@ -236,7 +520,8 @@ def get_recording(recording_id):
                 'file_path': recording[2],
                 'start_time': recording[3],
                 'end_time': recording[4],
-                'status': recording[5]
+                'status': recording[5],
+                'media': media_info(recording[6:])
             }
         })
     
@@ -246,30 +531,129 @@ def get_recording(recording_id):
             'error': str(e)
         }), 500
 
+def serve_recording(recording_id, as_attachment):
+    """
+    发送录制文件: 支持Range分段(206)、ETag/If-None-Match和Last-Modified/If-Modified-Since(304);
+    配置了DOWNLOAD_OFFLOAD时只返回头部, 由前端代理直接发送文件
+    """
+    recording = db.query_one('SELECT file_path, status FROM recordings WHERE id = ?', (recording_id,))
+    if not recording:
+        return jsonify({
+            'success': False,
+            'error': 'Recording file not found'
+        }), 404
+    
+    file_path, status = recording
+    max_age = 0 if status == 'recording' else CONFIG['RECORDING_CACHE_MAX_AGE']
+    
+    if CONFIG['DOWNLOAD_OFFLOAD'] == 'x-accel':
+        if not os.path.isfile(file_path):
+            return jsonify({
+                'success': False,
+                'error': 'Recording file not found'
+            }), 404
+        # nginx按internal location读取文件, 自行处理Range和条件请求
+        relative_path = os.path.relpath(file_path, CONFIG['UPLOAD_FOLDER']).replace(os.sep, '/')
+        response = app.response_class(status=200)
+        response.headers['X-Accel-Redirect'] = CONFIG['X_ACCEL_PREFIX'] + relative_path
+        response.headers['Content-Type'] = mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+        disposition = 'attachment' if as_attachment else 'inline'
+        response.headers['Content-Disposition'] = f'{disposition}; filename="{os.path.basename(file_path)}"'
+        response.headers['Cache-Control'] = f'max-age={max_age}' if max_age else 'no-cache'
+        return response
+    
+    try:
+        # conditional=True时werkzeug处理Range、ETag和Last-Modified; USE_X_SENDFILE时只返回X-Sendfile头
+        # 相对路径按工作目录解析(send_file默认相对于应用目录)
+        response = send_file(
+            os.path.abspath(file_path),
+            as_attachment=as_attachment,
+            conditional=True,
+            etag=True,
+            max_age=max_age
+        )
+    except FileNotFoundError:
+        return jsonify({
+            'success': False,
+            'error': 'Recording file not found'
+        }), 404
+    if not max_age:
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @app.route('/api/v1/recordings/<recording_id>/download', methods=['GET'])
 def download_recording(recording_id):
     """下载录制文件"""
     try:
-        conn = sqlite3.connect(CONFIG['DATABASE'])
-        c = conn.cursor()
-        c.execute('SELECT file_path FROM recordings WHERE id = ?', (recording_id,))
-        recording = c.fetchone()
-        conn.close()
+        return serve_recording(recording_id, as_attachment=True)
+    
+    except HTTPException:
+        # 416 Range Not Satisfiable等由werkzeug生成的响应
+        raise
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/v1/recordings/<recording_id>/stream', methods=['GET'])
+def stream_recording(recording_id):
+    """在线播放录制文件(inline), 播放器通过Range请求拖动进度"""
+    try:
+        return serve_recording(recording_id, as_attachment=False)
+    
+    except HTTPException:
+        # 416 Range Not Satisfiable等由werkzeug生成的响应
+        raise
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/v1/recordings/<recording_id>/seek', methods=['GET'])
+def seek_recording(recording_id):
+    """查询t秒处之前最近的关键帧的字节偏移, 客户端可以直接从该位置发起Range请求"""
+    try:
+        t = request.args.get('t', type=float)
+        if t is None or not math.isfinite(t) or t < 0:
+            return jsonify({
+                'success': False,
+                'error': 'Parameter t (seconds) is required'
+            }), 400
         
-        if not recording or not os.path.exists(recording[0]):
+        recording = db.query_one('SELECT index_status, duration_ms FROM recordings WHERE id = ?', (recording_id,))
+        if not recording:
             return jsonify({
                 'success': False,
-                'error': 'Recording file not found'
+                'error': 'Recording not found'
             }), 404
         
-        return send_file(recording[0], as_attachment=True)
+        cue = db.query_one(
+            '''SELECT time_ms, byte_offset FROM recording_cues
+               WHERE recording_id = ? AND time_ms <= ? ORDER BY time_ms DESC LIMIT 1''',
+            (recording_id, min(int(t * 1000), 2 ** 63 - 1))
+        )
+        if not cue:
+            return jsonify({
+                'success': False,
+                'error': 'No seek index for this recording',
+                'index_status': recording[0] or 'pending'
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            'time': cue[0] / 1000.0,
+            'byte_offset': cue[1],
+            'duration': recording[1] / 1000.0 if recording[1] is not None else None
+        })
     
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
-    
+
 
 # 允许的文件扩展名
 ALLOWED_EXTENSIONS = {'webm', 'mp4', 'avi'}
@@ -278,6 +662,39 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def save_recording(room_id, staged, recording_id=None, upload_id=None):
+    """
+    把已计算哈希的上传内容放入存储并生成录制记录, 返回(recording_id, file_path, deduplicated);
+    来自分片上传时在同一事务中把上传标记为已完成
+    """
+    recording_id = recording_id or str(uuid.uuid4())
+    try:
+        with db.transaction() as conn:
+            file_path, deduplicated = blob_store.commit(conn, staged)
+            conn.execute(
+                '''INSERT INTO recordings 
+                   (id, room_id, file_path, start_time, end_time, status, file_size, file_exists, blob_sha256) 
+                   VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?)''',
+                (recording_id, room_id, file_path, 
+                 datetime.now(), datetime.now(), 'completed', staged.size, staged.sha256)
+            )
+            if upload_id is not None:
+                chunked_uploads.finish(conn, upload_id)
+    except Exception:
+        blob_store.discard(staged)
+        raise
+    
+    # 事务提交后再放置文件, 插入失败时不会留下没有记录的文件; 放置失败时撤销这条录制
+    try:
+        blob_store.place(staged, file_path)
+    except Exception:
+        with db.transaction() as conn:
+            blob_store.drop_recordings(conn, [recording_id])
+        blob_store.discard(staged)
+        raise
+    media_indexer.enqueue(recording_id)
+    return recording_id, file_path, deduplicated
+
 @app.route('/api/v1/recordings/upload', methods=['POST'])
 def upload_recording():
     """上传录制文件"""
@@ -299,40 +716,20 @@ def upload_recording():
             }), 400
         
         if file and allowed_file(file.filename):
-            # 生成唯一文件名
             filename = secure_filename(file.filename)
             file_extension = filename.rsplit('.', 1)[1].lower()
-            unique_filename = f"{uuid.uuid4().hex}.{file_extension}"
-            
-            # 确保录制目录存在
-            os.makedirs(CONFIG['UPLOAD_FOLDER'], exist_ok=True)
-            file_path = os.path.join(CONFIG['UPLOAD_FOLDER'], unique_filename)
-            
-            # 保存文件
-            file.save(file_path)
-            
-            # 记录到数据库
-            recording_id = str(uuid.uuid4())
-            conn = sqlite3.connect(CONFIG['DATABASE'])
-            c = conn.cursor()
-            c.execute(
-                '''INSERT INTO recordings 
-                   (id, room_id, file_path, start_time, end_time, status) 
-                   VALUES (?, ?, ?, ?, ?, ?)''',
-                (recording_id, room_id, file_path, 
-                 datetime.now(), datetime.now(), 'completed')
-            )
-            conn.commit()
-            conn.close()
             
-            # 获取文件大小
-            file_size = os.path.getsize(file_path)
+            # 边写临时文件边计算SHA-256, 内容相同的文件只保存一份
+            staged = blob_store.stage(file.stream, file_extension)
+            recording_id, file_path, deduplicated = save_recording(room_id, staged)
             
             return jsonify({
                 'success': True,
                 'recording_id': recording_id,
                 'file_path': file_path,
-                'file_size': file_size,
+                'file_size': staged.size,
+                'sha256': staged.sha256,
+                'deduplicated': deduplicated,
                 'message': 'Recording uploaded successfully'
             })
         else:
@@ -347,26 +744,236 @@ def upload_recording():
             'error': str(e)
         }), 500
 
+def upload_error(e):
+    return jsonify({
+        'success': False,
+        'error': str(e)
+    }), e.status_code
+
+def parse_chunk_range(total_size):
+    """从Content-Range(bytes start-end/total)或offset参数解析分片位置, 返回(offset, length)"""
+    content_range = request.headers.get('Content-Range')
+    if content_range:
+        unit, _, spec = content_range.partition(' ')
+        span, _, total = spec.partition('/')
+        start, _, end = span.partition('-')
+        if unit != 'bytes' or not start.isdigit() or not end.isdigit():
+            raise UploadError('Invalid Content-Range')
+        if total not in ('*', '') and not total.isdigit():
+            raise UploadError('Invalid Content-Range')
+        if total.isdigit() and int(total) != total_size:
+            raise UploadError('Content-Range total does not match upload size')
+        return int(start), int(end) - int(start) + 1
+    offset = request.args.get('offset', type=int)
+    if offset is None or request.content_length is None:
+        raise UploadError('Content-Range or offset and Content-Length are required')
+    return offset, request.content_length
+
+@app.route('/api/v1/recordings/uploads', methods=['POST'])
+def initiate_upload():
+    """创建分片上传, 返回upload_id和建议的分片大小"""
+    try:
+        data = request.get_json() or {}
+        filename = secure_filename(data.get('filename', ''))
+        if not allowed_file(filename):
+            return jsonify({
+                'success': False,
+                'error': 'Invalid file type'
+            }), 400
+        if not isinstance(data.get('size'), int):
+            return jsonify({
+                'success': False,
+                'error': 'File size is required'
+            }), 400
+        
+        upload = chunked_uploads.initiate(
+            filename.rsplit('.', 1)[1].lower(),
+            data['size'],
+            data.get('room_id', 'unknown'),
+            str(data.get('user_id', '0')),
+            data.get('sha256')
+        )
+        return jsonify({'success': True, **upload})
+    
+    except UploadError as e:
+        return upload_error(e)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/v1/recordings/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """上传一个分片(请求体为原始字节), 分片可以乱序、并行、重复发送"""
+    try:
+        size = chunked_uploads.status(upload_id)['size']
+        offset, length = parse_chunk_range(size)
+        if request.content_length is not None and request.content_length != length:
+            raise UploadError('Content-Length does not match the chunk range')
+        status = chunked_uploads.write_chunk(
+            upload_id, offset, length, request.stream, request.headers.get('X-Chunk-SHA256')
+        )
+        return jsonify({'success': True, **status})
+    
+    except UploadError as e:
+        return upload_error(e)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/v1/recordings/uploads/<upload_id>', methods=['GET'])
+def get_upload_status(upload_id):
+    """查询已收到和缺失的字节区间, 用于断点续传"""
+    try:
+        return jsonify({'success': True, **chunked_uploads.status(upload_id)})
+    except UploadError as e:
+        return upload_error(e)
+
+@app.route('/api/v1/recordings/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id):
+    """校验并完成分片上传, 生成录制记录"""
+    try:
+        data = request.get_json(silent=True) or {}
+        try:
+            upload = chunked_uploads.complete(upload_id, data.get('sha256'))
+        except UploadCompleted as e:
+            # 同一上传的另一个完成请求已经生成了录制, 返回同一个结果
+            row = db.query_one(
+                'SELECT file_path, file_size, blob_sha256 FROM recordings WHERE id = ?', (e.recording_id,)
+            )
+            if row is None:
+                return jsonify({
+                    'success': False,
+                    'error': 'Recording not found'
+                }), 404
+            return jsonify({
+                'success': True,
+                'recording_id': e.recording_id,
+                'file_path': row[0],
+                'file_size': row[1],
+                'sha256': row[2],
+                'deduplicated': False,
+                'message': 'Recording already uploaded'
+            })
+        
+        # complete()已经校验过SHA-256, 直接移入内容寻址存储
+        try:
+            staged = blob_store.stage_file(upload.file_path, upload.extension, upload.sha256)
+            recording_id, file_path, deduplicated = save_recording(
+                upload.room_id, staged, upload.recording_id, upload.upload_id
+            )
+        except Exception:
+            chunked_uploads.release(upload_id)
+            raise
+        
+        return jsonify({
+            'success': True,
+            'recording_id': recording_id,
+            'file_path': file_path,
+            'file_size': upload.size,
+            'sha256': upload.sha256,
+            'deduplicated': deduplicated,
+            'message': 'Recording uploaded successfully'
+        })
+    
+    except UploadError as e:
+        return upload_error(e)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/v1/recordings/uploads/<upload_id>', methods=['DELETE'])
+def abort_upload(upload_id):
+    """放弃分片上传并删除已写入的数据"""
+    try:
+        chunked_uploads.abort(upload_id)
+        return jsonify({'success': True, 'message': 'Upload aborted'})
+    except UploadError as e:
+        return upload_error(e)
+
+def encode_cursor(start_time, recording_id):
+    raw = json.dumps([start_time, recording_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    start_time, recording_id = json.loads(raw)
+    return start_time, recording_id
+
 @app.route('/api/v1/recordings/list', methods=['GET'])
 def list_recordings():
-    """获取录制文件列表"""
+    """获取录制文件列表(按开始时间倒序, 游标分页, 可按room_id/status筛选)"""
     try:
-        conn = sqlite3.connect(CONFIG['DATABASE'])
-        c = conn.cursor()
-        c.execute('''
+        try:
+            limit = int(request.args.get('limit', CONFIG['LIST_PAGE_SIZE']))
+            cursor = request.args.get('cursor')
+            after = decode_cursor(cursor) if cursor else None
+        except (ValueError, TypeError):
+            return jsonify({
+                'success': False,
+                'error': 'Invalid limit or cursor'
+            }), 400
+        limit = max(1, min(limit, CONFIG['LIST_MAX_PAGE_SIZE']))
+        
+        conditions, params = [], []
+        if request.args.get('room_id'):
+            conditions.append('r.room_id = ?')
+            params.append(request.args['room_id'])
+        if request.args.get('status'):
+            conditions.append('r.status = ?')
+            params.append(request.args['status'])
+        # 按容器元数据筛选(只用数据库中的列, 不读取文件)
+        for arg, column in (('container', 'r.container'), ('video_codec', 'r.video_codec'),
+                            ('audio_codec', 'r.audio_codec')):
+            if request.args.get(arg):
+                conditions.append(f'{column} = ?')
+                params.append(request.args[arg].lower())
+        try:
+            for arg, condition, scale in (('min_duration', 'r.duration_ms >= ?', 1000),
+                                          ('max_duration', 'r.duration_ms <= ?', 1000),
+                                          ('min_height', 'r.height >= ?', 1)):
+                if request.args.get(arg):
+                    conditions.append(condition)
+                    params.append(int(float(request.args[arg]) * scale))
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'error': 'Invalid duration or height filter'
+            }), 400
+        if after is not None:
+            # 键集分页: 从上一页最后一条之后继续, 不用OFFSET
+            conditions.append('(r.start_time, r.id) < (?, ?)')
+            params.extend(after)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        
+        recordings = db.query_all(f'''
             SELECT r.id, r.room_id, r.file_path, r.start_time, r.end_time, 
-                   rm.room_name, r.status 
+                   rm.room_name, r.status, r.file_exists, r.file_size, 
+                   r.index_status, r.container, r.duration_ms, r.video_codec, r.audio_codec, 
+                   r.width, r.height, r.bitrate 
             FROM recordings r 
             LEFT JOIN rooms rm ON r.room_id = rm.id 
-            ORDER BY r.start_time DESC
-        ''')
-        recordings = c.fetchall()
-        conn.close()
+            {where}
+            ORDER BY r.start_time DESC, r.id DESC
+            LIMIT ?
+        ''', (*params, limit + 1))
+        
+        has_more = len(recordings) > limit
+        recordings = recordings[:limit]
         
         recording_list = []
+        backfill = []
         for rec in recordings:
-            file_exists = os.path.exists(rec[2]) if rec[2] else False
-            file_size = os.path.getsize(rec[2]) if file_exists else 0
+            file_exists, file_size = rec[7], rec[8]
+            if file_exists is None or file_size is None:
+                # 升级前的旧记录还没有文件信息, 补一次并写回
+                file_exists, file_size = stat_file(rec[2])
+                backfill.append((file_exists, file_size, rec[0]))
             
             recording_list.append({
                 'id': rec[0],
@@ -376,13 +983,22 @@ def list_recordings():
                 'end_time': rec[4],
                 'room_name': rec[5],
                 'status': rec[6],
-                'file_exists': file_exists,
-                'file_size': file_size
+                'file_exists': bool(file_exists),
+                'file_size': file_size,
+                'media': media_info(rec[9:17])
             })
         
+        if backfill:
+            with db.transaction() as conn:
+                conn.executemany('UPDATE recordings SET file_exists = ?, file_size = ? WHERE id = ?', backfill)
+        
+        next_cursor = encode_cursor(recordings[-1][3], recordings[-1][0]) if has_more else None
+        
         return jsonify({
             'success': True,
-            'recordings': recording_list
+            'recordings': recording_list,
+            'has_more': has_more,
+            'next_cursor': next_cursor
         })
     
     except Exception as e:
@@ -394,34 +1010,89 @@ def list_recordings():
     
 @app.route('/api/v1/recordings/<recording_id>', methods=['DELETE'])
 def delete_recording(recording_id):
-    """删除录制文件"""
+    """删除录制文件(只删除记录和减少文件引用, 磁盘空间由后台回收)"""
     try:
-        conn = sqlite3.connect(CONFIG['DATABASE'])
-        c = conn.cursor()
-        
-        # 获取文件路径
-        c.execute('SELECT file_path FROM recordings WHERE id = ?', (recording_id,))
-        recording = c.fetchone()
+        with db.transaction() as conn:
+            deleted = blob_store.drop_recordings(conn, [recording_id])
         
-        if not recording:
+        if not deleted:
             return jsonify({
                 'success': False,
                 'error': 'Recording not found'
             }), 404
+        sweeper.wakeup()
         
-        # 删除数据库记录
-        c.execute('DELETE FROM recordings WHERE id = ?', (recording_id,))
-        conn.commit()
-        conn.close()
+        return jsonify({
+            'success': True,
+            'message': 'Recording deleted successfully'
+        })
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+def bulk_selection(data):
+    """
+    批量操作的筛选条件: ids(录制id列表)、room_id、start/end(开始时间范围, ISO格式), 多个条件同时满足;
+    返回(where, params), 没有任何条件或格式错误时抛出ValueError
+    """
+    conditions, params = [], []
+    ids = data.get('ids')
+    if ids is not None:
+        if not isinstance(ids, list) or not all(isinstance(i, str) for i in ids):
+            raise ValueError('ids must be a list of recording ids')
+        if len(ids) > CONFIG['BULK_MAX_ROWS']:
+            raise ValueError(f"At most {CONFIG['BULK_MAX_ROWS']} ids per request")
+        # id列表作为一个JSON参数传入, 不受SQLite参数个数限制
+        conditions.append('id IN (SELECT value FROM json_each(?))')
+        params.append(json.dumps(ids))
+    if data.get('room_id'):
+        conditions.append('room_id = ?')
+        params.append(str(data['room_id']))
+    for key, condition in (('start', 'start_time >= ?'), ('end', 'start_time < ?')):
+        if data.get(key):
+            try:
+                params.append(datetime.fromisoformat(str(data[key])))
+            except ValueError:
+                raise ValueError(f'Invalid {key} time, expected ISO format')
+            conditions.append(condition)
+    if not conditions:
+        raise ValueError('ids, room_id or start/end is required')
+    # 录制中的记录还在写入分片, 批量操作不处理
+    conditions.append("status != 'recording'")
+    return ' AND '.join(conditions), params
+
+@app.route('/api/v1/recordings/bulk/delete', methods=['POST'])
+def bulk_delete_recordings():
+    """按id列表、房间或时间范围批量删除录制: 一个事务完成, 文件由后台回收"""
+    try:
+        data = request.get_json() or {}
+        try:
+            where, params = bulk_selection(data)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        limit = CONFIG['BULK_MAX_ROWS']
+        with db.transaction() as conn:
+            rows = conn.execute(
+                f'SELECT id FROM recordings WHERE {where} ORDER BY start_time, id LIMIT ?',
+                (*params, limit + 1)
+            ).fetchall()
+            deleted = blob_store.drop_recordings(conn, [row[0] for row in rows[:limit]])
         
-        # 删除物理文件
-        file_path = recording[0]
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        if deleted:
+            sweeper.wakeup()
         
         return jsonify({
             'success': True,
-            'message': 'Recording deleted successfully'
+            'deleted': deleted,
+            # 超过BULK_MAX_ROWS时只删除最早的一批, 客户端用同样的条件再次请求
+            'has_more': len(rows) > limit
         })
     
     except Exception as e:
@@ -430,6 +1101,69 @@ def delete_recording(recording_id):
             'error': str(e)
         }), 500
 
+@app.route('/api/v1/recordings/bulk/status', methods=['POST'])
+def bulk_update_recording_status():
+    """按id列表、房间或时间范围批量修改录制状态, 一条UPDATE完成"""
+    try:
+        data = request.get_json() or {}
+        status = data.get('status')
+        if not isinstance(status, str) or not status or status == 'recording':
+            return jsonify({
+                'success': False,
+                'error': 'A status other than recording is required'
+            }), 400
+        try:
+            where, params = bulk_selection(data)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        limit = CONFIG['BULK_MAX_ROWS']
+        with db.transaction() as conn:
+            updated = conn.execute(
+                f'''UPDATE recordings SET status = ? WHERE id IN (
+                        SELECT id FROM recordings WHERE {where} AND status != ? 
+                        ORDER BY start_time, id LIMIT ?
+                    )''',
+                (status, *params, status, limit)
+            ).rowcount
+            has_more = conn.execute(
+                f'SELECT 1 FROM recordings WHERE {where} AND status != ? LIMIT 1',
+                (*params, status)
+            ).fetchone() is not None
+        
+        return jsonify({
+            'success': True,
+            'updated': updated,
+            'has_more': has_more
+        })
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/v1/storage/stats', methods=['GET'])
+def storage_stats():
+    """录制存储的占用和后台回收统计"""
+    try:
+        return jsonify({
+            'success': True,
+            'storage': blob_store.stats(),
+            'sweeper': sweeper.stats()
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 if __name__ == '__main__':
-    init_db()
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    debug = True
+    # 开启重载器时父进程只监控文件变化, 不处理请求, 只在实际服务的子进程中初始化
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        init_app()
+    app.run(debug=debug, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,119 @@
+"""
+数据库访问微基准: 对比每个请求sqlite3.connect(默认回滚日志)和db.Database连接池(WAL)
+
+    python bench_db.py --threads 8 --ops 2000
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+
+from db import Database
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS rooms (
+        id TEXT PRIMARY KEY,
+        room_name TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        status TEXT DEFAULT 'active'
+    );
+'''
+
+
+def connect_per_request(path):
+    """
+    与改造前app.py相同的用法: 每次操作新建连接, 用完关闭
+    """
+    def insert(room_id):
+        conn = sqlite3.connect(path)
+        c = conn.cursor()
+        c.execute('INSERT INTO rooms (id, room_name) VALUES (?, ?)', (room_id, 'bench'))
+        conn.commit()
+        conn.close()
+
+    def select(room_id):
+        conn = sqlite3.connect(path)
+        c = conn.cursor()
+        c.execute('SELECT * FROM rooms WHERE id = ?', (room_id,))
+        row = c.fetchone()
+        conn.close()
+        return row
+
+    return insert, select
+
+
+def pooled(path):
+    db = Database(path)
+
+    def insert(room_id):
+        db.execute('INSERT INTO rooms (id, room_name) VALUES (?, ?)', (room_id, 'bench'))
+
+    def select(room_id):
+        return db.query_one('SELECT * FROM rooms WHERE id = ?', (room_id,))
+
+    return insert, select
+
+
+def run(name, factory, threads, ops, write_ratio):
+    path = os.path.join(tempfile.mkdtemp(prefix='bench-db-'), 'meeting.db')
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.close()
+
+    insert, select = factory(path)
+    seed_ids = [str(uuid.uuid4()) for _ in range(100)]
+    for room_id in seed_ids:
+        insert(room_id)
+
+    errors = []
+    latencies = []
+    lock = threading.Lock()
+    write_every = max(1, round(1 / write_ratio)) if write_ratio else 0
+
+    def worker(index):
+        local = []
+        for i in range(ops):
+            start = time.perf_counter()
+            try:
+                if write_every and i % write_every == 0:
+                    insert(str(uuid.uuid4()))
+                else:
+                    select(seed_ids[(index + i) % len(seed_ids)])
+            except sqlite3.Error as e:
+                errors.append(str(e))
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    print(f'{name:<20}{threads * ops / elapsed:>12.0f}{p50:>10.3f}{p99:>10.3f}{len(errors):>8}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='数据库访问微基准')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--ops', type=int, default=2000, help='每个线程的操作数')
+    parser.add_argument('--write-ratio', type=float, default=0.2, help='写操作比例')
+    args = parser.parse_args()
+
+    print(f'{args.threads}线程 x {args.ops}次, 写比例 {args.write_ratio}')
+    print(f'{"方式":<20}{"ops/s":>12}{"p50(ms)":>10}{"p99(ms)":>10}{"错误":>8}')
+    run('per-request connect', connect_per_request, args.threads, args.ops, args.write_ratio)
+    run('pooled + WAL', pooled, args.threads, args.ops, args.write_ratio)
+
+
+if __name__ == '__main__':
+    main()
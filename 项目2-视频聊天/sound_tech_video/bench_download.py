@@ -0,0 +1,172 @@
+"""
+录制文件下载基准: 多个客户端并发随机拖动(Range请求)、整文件下载和ETag复验(304)的吞吐
+
+    python bench_download.py --clients 16 --duration 10 --file-mb 64
+    python bench_download.py --server gunicorn  # 需安装gunicorn, 通过wsgi.file_wrapper使用sendfile
+"""
+import argparse
+import http.client
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+
+def serve(args):
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, here)
+    os.chdir(args.workdir)
+
+    if args.server == 'gunicorn':
+        os.execvp(sys.executable, [
+            sys.executable, '-m', 'gunicorn', '--chdir', args.workdir, '--pythonpath', here,
+            '-w', '4', '-k', 'gthread', '--threads', '16', '-b', f'127.0.0.1:{args.port}', 'app:app'
+        ])
+    import logging
+    import app as video_app
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    make_server('127.0.0.1', args.port, video_app.app, threaded=True).serve_forever()
+
+
+def prepare(workdir, file_mb):
+    """
+    在临时目录中建库并生成一个录制文件, 返回recording_id
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, here)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        import app as video_app
+        video_app.init_db()
+        os.makedirs('recordings', exist_ok=True)
+        recording_id = str(uuid.uuid4())
+        file_path = os.path.join('recordings', f'{recording_id}.webm')
+        with open(file_path, 'wb') as f:
+            block = os.urandom(1024 * 1024)
+            for _ in range(file_mb):
+                f.write(block)
+        video_app.db.execute(
+            '''INSERT INTO recordings (id, room_id, file_path, start_time, end_time, status, file_size, file_exists)
+               VALUES (?, 'bench', ?, datetime('now'), datetime('now'), 'completed', ?, 1)''',
+            (recording_id, file_path, file_mb * 1024 * 1024)
+        )
+        video_app.db.close()
+        return recording_id
+    finally:
+        os.chdir(cwd)
+
+
+def wait_ready(port, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/api/v1/recordings/list?limit=1')
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('服务未就绪')
+
+
+def run_scenario(name, port, path, clients, duration, make_headers, expect_status):
+    latencies, transferred, errors = [], [0], [0]
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def client(index):
+        rng = random.Random(index)
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        local, size = [], 0
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path, headers=make_headers(rng))
+                response = conn.getresponse()
+                body = response.read()
+                if response.status != expect_status:
+                    with lock:
+                        errors[0] += 1
+                size += len(body)
+            except (OSError, http.client.HTTPException):
+                with lock:
+                    errors[0] += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            local.append(time.perf_counter() - start)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            transferred[0] += size
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000 if latencies else 0
+    print(f'{name:<12}{len(latencies) / elapsed:>10.1f}{transferred[0] / elapsed / 1024 ** 2:>10.1f}'
+          f'{p50:>10.2f}{p99:>10.2f}{errors[0]:>8}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='录制文件下载基准')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0, help='每个场景的时长(秒)')
+    parser.add_argument('--file-mb', type=int, default=64)
+    parser.add_argument('--range-kb', type=int, default=512, help='每次拖动请求的字节数')
+    parser.add_argument('--server', choices=['werkzeug', 'gunicorn'], default='werkzeug')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    workdir = tempfile.mkdtemp(prefix='bench-download-')
+    recording_id = prepare(workdir, args.file_mb)
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', '--server', args.server,
+                               '--port', str(args.port), '--workdir', workdir])
+    try:
+        wait_ready(args.port)
+        path = f'/api/v1/recordings/{recording_id}/stream'
+        conn = http.client.HTTPConnection('127.0.0.1', args.port)
+        conn.request('HEAD', path)
+        etag = conn.getresponse().getheader('ETag')
+        conn.close()
+
+        file_size = args.file_mb * 1024 * 1024
+        range_size = args.range_kb * 1024
+
+        def seek_headers(rng):
+            offset = rng.randrange(0, file_size - range_size)
+            return {'Range': f'bytes={offset}-{offset + range_size - 1}'}
+
+        print(f'{args.server}, {args.clients}个客户端, 文件{args.file_mb}MB, 拖动请求{args.range_kb}KB')
+        print(f'{"场景":<12}{"req/s":>10}{"MB/s":>10}{"p50(ms)":>10}{"p99(ms)":>10}{"错误":>8}')
+        run_scenario('seek(206)', args.port, path, args.clients, args.duration, seek_headers, 206)
+        run_scenario('full(200)', args.port, path, args.clients, args.duration, lambda rng: {}, 200)
+        run_scenario('etag(304)', args.port, path, args.clients, args.duration,
+                     lambda rng: {'If-None-Match': etag}, 304)
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
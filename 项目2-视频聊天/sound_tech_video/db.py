@@ -0,0 +1,132 @@
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Database:
+    """
+    SQLite数据访问层: 连接池复用连接(每个连接自带预编译语句缓存), WAL日志, 锁冲突时退避重试
+
+    Flask开发服务器每个请求一个新线程, 线程局部连接每次都会重新打开, 所以用跨线程共享的连接池;
+    同一时刻一个连接只被一个线程使用
+    """
+
+    def __init__(self, path, pool_size=16, busy_timeout=5.0, retries=5,
+                 cache_size_kb=16384, mmap_size=256 * 1024 * 1024, statement_cache=256):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.retries = retries
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.statement_cache = statement_cache
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self.created = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout,
+            isolation_level=None,  # 自动提交, 写事务用transaction()显式开启
+            check_same_thread=False,
+            cached_statements=self.statement_cache
+        )
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size=-{int(self.cache_size_kb)}')
+        conn.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        with self._lock:
+            self.created += 1
+        return conn
+
+    def _reset_after_fork(self):
+        # fork出的子进程不能使用父进程打开的连接
+        if self._pid != os.getpid():
+            self._pool = queue.LifoQueue(maxsize=self._pool.maxsize)
+            self._pid = os.getpid()
+
+    @contextmanager
+    def connection(self):
+        """
+        从池中借出一个连接, 用完归还
+        """
+        self._reset_after_fork()
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                self._pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def _retry(self, fn):
+        """
+        database is locked/busy时指数退避重试(busy_timeout之外的兜底)
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                return fn()
+            except sqlite3.OperationalError as e:
+                message = str(e).lower()
+                if attempt == self.retries or ('locked' not in message and 'busy' not in message):
+                    raise
+                time.sleep(min(1.0, 0.01 * 2 ** attempt) * (0.5 + random.random()))
+
+    def query_one(self, sql, params=()):
+        with self.connection() as conn:
+            return self._retry(lambda: conn.execute(sql, params).fetchone())
+
+    def query_all(self, sql, params=()):
+        with self.connection() as conn:
+            return self._retry(lambda: conn.execute(sql, params).fetchall())
+
+    @contextmanager
+    def transaction(self):
+        """
+        写事务: BEGIN IMMEDIATE提前拿写锁, 避免读升级写时的死锁; 异常时回滚
+        """
+        with self.connection() as conn:
+            self._retry(lambda: conn.execute('BEGIN IMMEDIATE'))
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            self._retry(conn.commit)
+
+    def execute(self, sql, params=()):
+        """
+        单条写语句, 返回影响的行数
+        """
+        with self.transaction() as conn:
+            return conn.execute(sql, params).rowcount
+
+    def executescript(self, script):
+        with self.connection() as conn:
+            self._retry(lambda: conn.executescript(script))
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def stats(self):
+        return {
+            'pool_size': self._pool.maxsize,
+            'idle_connections': self._pool.qsize(),
+            'connections_created': self.created
+        }
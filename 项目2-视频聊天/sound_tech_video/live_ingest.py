@@ -0,0 +1,96 @@
+import os
+import threading
+
+
+class IngestError(Exception):
+    def __init__(self, message, status_code=400, expected_seq=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.expected_seq = expected_seq
+
+
+class LiveIngest:
+    """
+    录制过程中实时追加MediaRecorder分片: 客户端按序号依次发送, 服务端写到录制文件末尾
+
+    recordings.chunk_seq记录最后写入的序号, file_size即下一个分片的写入位置;
+    重发已写入的分片直接确认, 中途失败的写入会在同一位置被重写, 不会产生重复数据
+    """
+
+    COPY_BUFFER = 1024 * 1024
+
+    def __init__(self, db, max_chunk_size=16 * 1024 * 1024, lock_stripes=64):
+        self.db = db
+        self.max_chunk_size = max_chunk_size
+        # 同一录制的分片串行写入; 按id分段加锁, 不为每个录制单独保存锁
+        self._locks = [threading.Lock() for _ in range(lock_stripes)]
+        self.chunks = 0
+        self.bytes = 0
+
+    def _lock(self, recording_id):
+        return self._locks[hash(recording_id) % len(self._locks)]
+
+    def locked(self, recording_id):
+        """
+        停止录制时持有, 等待正在写入的分片完成
+        """
+        return self._lock(recording_id)
+
+    def append(self, room_id, recording_id, seq, stream, length):
+        """
+        追加序号为seq(从1开始)的分片, 返回(file_size, chunk_seq, duplicate)
+        """
+        if length is None or length <= 0 or length > self.max_chunk_size:
+            raise IngestError(f'Chunk size must be between 1 and {self.max_chunk_size} bytes', 413)
+
+        with self._lock(recording_id):
+            row = self.db.query_one(
+                'SELECT room_id, file_path, status, file_size, chunk_seq FROM recordings WHERE id = ?',
+                (recording_id,)
+            )
+            if row is None or row[0] != room_id:
+                raise IngestError('Recording not found', 404)
+            _, file_path, status, file_size, chunk_seq = row
+            file_size, chunk_seq = file_size or 0, chunk_seq or 0
+            if seq <= chunk_seq:
+                return file_size, chunk_seq, True
+            if status != 'recording':
+                raise IngestError('Recording is not in progress', 409)
+            if seq != chunk_seq + 1:
+                raise IngestError(f'Expected chunk {chunk_seq + 1}', 409, chunk_seq + 1)
+
+            fd = os.open(file_path, os.O_WRONLY | os.O_CREAT, 0o644)
+            try:
+                position, remaining = file_size, length
+                while remaining > 0:
+                    data = stream.read(min(self.COPY_BUFFER, remaining))
+                    if not data:
+                        break
+                    os.pwrite(fd, data, position)
+                    position += len(data)
+                    remaining -= len(data)
+                if remaining:
+                    raise IngestError(f'Incomplete chunk: expected {length} bytes, got {length - remaining}')
+                # 去掉上次失败写入残留在末尾的数据
+                os.ftruncate(fd, position)
+            finally:
+                os.close(fd)
+
+            updated = self.db.execute(
+                '''UPDATE recordings SET file_size = ?, file_exists = 1, chunk_seq = ?
+                   WHERE id = ? AND chunk_seq IS ?''',
+                (position, seq, recording_id, row[4])
+            )
+            if not updated:
+                # 其他进程同时写入了同一录制
+                raise IngestError('Concurrent write to the same recording', 409)
+
+        self.chunks += 1
+        self.bytes += length
+        return position, seq, False
+
+    def stats(self):
+        return {
+            'chunks': self.chunks,
+            'bytes': self.bytes
+        }
@@ -0,0 +1,743 @@
+import os
+import queue
+import struct
+import threading
+import time
+
+
+class MediaParseError(Exception):
+    pass
+
+
+# 统一的编码名称, 列表和搜索按这些值筛选
+WEBM_CODECS = {
+    'V_VP8': 'vp8',
+    'V_VP9': 'vp9',
+    'V_AV1': 'av1',
+    'V_MPEG4/ISO/AVC': 'h264',
+    'V_MPEGH/ISO/HEVC': 'h265',
+    'A_OPUS': 'opus',
+    'A_VORBIS': 'vorbis',
+    'A_AAC': 'aac',
+    'A_PCM/INT/LIT': 'pcm'
+}
+MP4_CODECS = {
+    'avc1': 'h264',
+    'avc3': 'h264',
+    'hvc1': 'h265',
+    'hev1': 'h265',
+    'vp08': 'vp8',
+    'vp09': 'vp9',
+    'av01': 'av1',
+    'mp4a': 'aac',
+    'Opus': 'opus',
+    'opus': 'opus'
+}
+
+# 关键帧索引最多每CUE_MIN_INTERVAL_MS保留一条, 全是关键帧的文件也不会产生过多记录
+CUE_MIN_INTERVAL_MS = 500
+
+
+def thin_cues(cues, min_interval=CUE_MIN_INTERVAL_MS):
+    """
+    [(time_ms, byte_offset), ...]按时间排序去重, 相邻两条至少间隔min_interval
+    """
+    result = []
+    for time_ms, offset in sorted(cues):
+        if not result or time_ms - result[-1][0] >= min_interval:
+            result.append((time_ms, offset))
+    return result
+
+
+class Reader:
+    """
+    按偏移读取文件头部结构, 只读需要的字节, 不解码音视频数据
+    """
+
+    def __init__(self, f, size):
+        self.f = f
+        self.size = size
+
+    def read(self, offset, length):
+        if offset < 0 or offset + length > self.size:
+            raise EOFError
+        self.f.seek(offset)
+        data = self.f.read(length)
+        if len(data) != length:
+            raise EOFError
+        return data
+
+
+# ---------- WebM / Matroska (EBML) ----------
+
+EBML_HEADER = 0x1A45DFA3
+DOC_TYPE = 0x4282
+SEGMENT = 0x18538067
+SEEK_HEAD = 0x114D9B74
+SEEK = 0x4DBB
+SEEK_ID = 0x53AB
+SEEK_POSITION = 0x53AC
+INFO = 0x1549A966
+TIMECODE_SCALE = 0x2AD7B1
+DURATION = 0x4489
+TRACKS = 0x1654AE6B
+TRACK_ENTRY = 0xAE
+TRACK_NUMBER = 0xD7
+TRACK_TYPE = 0x83
+CODEC_ID = 0x86
+VIDEO = 0xE0
+PIXEL_WIDTH = 0xB0
+PIXEL_HEIGHT = 0xBA
+CUES = 0x1C53BB6B
+CUE_POINT = 0xBB
+CUE_TIME = 0xB3
+CUE_TRACK_POSITIONS = 0xB7
+CUE_TRACK = 0xF7
+CUE_CLUSTER_POSITION = 0xF1
+CLUSTER = 0x1F43B675
+CLUSTER_TIMECODE = 0xE7
+SIMPLE_BLOCK = 0xA3
+BLOCK_GROUP = 0xA0
+BLOCK = 0xA1
+REFERENCE_BLOCK = 0xFB
+# Segment的直接子元素; 未知长度的Cluster遇到这些ID即结束
+LEVEL1_IDS = {SEEK_HEAD, INFO, TRACKS, CUES, CLUSTER, 0x1043A770, 0x1254C367, 0x1941A469}
+
+UNKNOWN_SIZE = -1
+
+
+def read_vint(reader, offset, keep_marker=False):
+    """
+    读取EBML变长整数, 返回(value, 长度); 长度字段全为1表示未知长度
+    """
+    first = reader.read(offset, 1)[0]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not first & mask:
+        length += 1
+        mask >>= 1
+    if length > 8:
+        raise MediaParseError(f'Invalid EBML vint at {offset}')
+    value = first if keep_marker else first & (mask - 1)
+    if length > 1:
+        value = (value << (8 * (length - 1))) | int.from_bytes(reader.read(offset + 1, length - 1), 'big')
+    if not keep_marker and value == (1 << (7 * length)) - 1:
+        value = UNKNOWN_SIZE
+    return value, length
+
+
+def read_element(reader, offset):
+    """
+    返回(element_id, data_offset, data_size)
+    """
+    element_id, id_length = read_vint(reader, offset, keep_marker=True)
+    size, size_length = read_vint(reader, offset + id_length)
+    return element_id, offset + id_length + size_length, size
+
+
+def iter_children(reader, start, end):
+    offset = start
+    while offset < end:
+        element_id, data_offset, size = read_element(reader, offset)
+        if size == UNKNOWN_SIZE:
+            return
+        yield element_id, data_offset, size
+        offset = data_offset + size
+
+
+def read_uint(reader, offset, size):
+    return int.from_bytes(reader.read(offset, size), 'big') if size else 0
+
+
+def read_float(reader, offset, size):
+    if size == 4:
+        return struct.unpack('>f', reader.read(offset, 4))[0]
+    if size == 8:
+        return struct.unpack('>d', reader.read(offset, 8))[0]
+    return 0.0
+
+
+def read_string(reader, offset, size):
+    return reader.read(offset, size).rstrip(b'\x00').decode('ascii', 'replace')
+
+
+def parse_webm(reader):
+    element_id, data_offset, size = read_element(reader, 0)
+    if element_id != EBML_HEADER:
+        raise MediaParseError('Not an EBML file')
+    doc_type = 'webm'
+    for child_id, child_offset, child_size in iter_children(reader, data_offset, data_offset + size):
+        if child_id == DOC_TYPE:
+            doc_type = read_string(reader, child_offset, child_size)
+
+    segment_id, segment_start, segment_size = read_element(reader, data_offset + size)
+    if segment_id != SEGMENT:
+        raise MediaParseError('Missing Segment')
+    segment_end = reader.size if segment_size == UNKNOWN_SIZE else min(reader.size, segment_start + segment_size)
+
+    result = {'container': 'webm' if doc_type == 'webm' else 'mkv'}
+    timecode_scale = 1000000  # 纳秒
+    duration = None
+    tracks = {}  # track_number -> (type, codec, width, height)
+    cues = None
+    cues_offset = None
+
+    # 录制中断的文件可能在任意位置截断, 解析到哪里算哪里
+    offset = segment_start
+    scan = None  # 扫描Cluster得到的(最大时间戳, 关键帧列表)
+    try:
+        while offset < segment_end:
+            element_id, data_offset, size = read_element(reader, offset)
+
+            if element_id == CLUSTER:
+                if cues is None and cues_offset is not None:
+                    # SeekHead指出Cues在文件末尾, 直接跳过去读, 不必扫描所有Cluster
+                    try:
+                        cues = parse_webm_cues(reader, cues_offset, segment_start) or []
+                    except (EOFError, MediaParseError):
+                        cues = []
+                if cues and duration is not None:
+                    break
+                if scan is None:
+                    scan = [0, []]
+                offset = scan_webm_cluster(reader, offset, data_offset, size, segment_end, tracks, scan)
+                continue
+
+            if size == UNKNOWN_SIZE:
+                break
+            if element_id == SEEK_HEAD:
+                for seek_id, seek_offset, seek_size in iter_children(reader, data_offset, data_offset + size):
+                    if seek_id != SEEK:
+                        continue
+                    target, position = None, None
+                    for entry_id, entry_offset, entry_size in iter_children(reader, seek_offset, seek_offset + seek_size):
+                        if entry_id == SEEK_ID:
+                            target = read_uint(reader, entry_offset, entry_size)
+                        elif entry_id == SEEK_POSITION:
+                            position = read_uint(reader, entry_offset, entry_size)
+                    if target == CUES and position is not None:
+                        cues_offset = segment_start + position
+            elif element_id == INFO:
+                for child_id, child_offset, child_size in iter_children(reader, data_offset, data_offset + size):
+                    if child_id == TIMECODE_SCALE:
+                        timecode_scale = read_uint(reader, child_offset, child_size)
+                    elif child_id == DURATION:
+                        duration = read_float(reader, child_offset, child_size)
+            elif element_id == TRACKS:
+                for entry_id, entry_offset, entry_size in iter_children(reader, data_offset, data_offset + size):
+                    if entry_id == TRACK_ENTRY:
+                        number, track = parse_webm_track(reader, entry_offset, entry_size)
+                        tracks[number] = track
+            elif element_id == CUES:
+                cues = parse_webm_cues(reader, offset, segment_start)
+            offset = data_offset + size
+    except EOFError:
+        pass
+
+    ms_per_tick = timecode_scale / 1000000.0
+    if duration:
+        result['duration_ms'] = int(duration * ms_per_tick)
+    elif scan is not None:
+        result['duration_ms'] = int(scan[0] * ms_per_tick)
+
+    for track_type, codec, width, height in tracks.values():
+        if track_type == 1 and 'video_codec' not in result:
+            result['video_codec'] = WEBM_CODECS.get(codec, codec.lower())
+            result['width'], result['height'] = width, height
+        elif track_type == 2 and 'audio_codec' not in result:
+            result['audio_codec'] = WEBM_CODECS.get(codec, codec.lower())
+
+    if cues:
+        result['cues'] = [(int(t * ms_per_tick), position) for t, position in cues]
+    elif scan is not None:
+        result['cues'] = [(int(t * ms_per_tick), position) for t, position in scan[1]]
+    return result
+
+
+def parse_webm_track(reader, offset, size):
+    number, track_type, codec, width, height = 0, 0, '', None, None
+    for child_id, child_offset, child_size in iter_children(reader, offset, offset + size):
+        if child_id == TRACK_NUMBER:
+            number = read_uint(reader, child_offset, child_size)
+        elif child_id == TRACK_TYPE:
+            track_type = read_uint(reader, child_offset, child_size)
+        elif child_id == CODEC_ID:
+            codec = read_string(reader, child_offset, child_size)
+        elif child_id == VIDEO:
+            for video_id, video_offset, video_size in iter_children(reader, child_offset, child_offset + child_size):
+                if video_id == PIXEL_WIDTH:
+                    width = read_uint(reader, video_offset, video_size)
+                elif video_id == PIXEL_HEIGHT:
+                    height = read_uint(reader, video_offset, video_size)
+    return number, (track_type, codec, width, height)
+
+
+def parse_webm_cues(reader, offset, segment_start):
+    """
+    返回[(cue_time, Cluster的绝对偏移), ...]; CueClusterPosition相对于Segment数据起点
+    """
+    element_id, data_offset, size = read_element(reader, offset)
+    if element_id != CUES or size == UNKNOWN_SIZE:
+        return None
+    cues = []
+    for point_id, point_offset, point_size in iter_children(reader, data_offset, data_offset + size):
+        if point_id != CUE_POINT:
+            continue
+        cue_time, position = None, None
+        for child_id, child_offset, child_size in iter_children(reader, point_offset, point_offset + point_size):
+            if child_id == CUE_TIME:
+                cue_time = read_uint(reader, child_offset, child_size)
+            elif child_id == CUE_TRACK_POSITIONS and position is None:
+                for pos_id, pos_offset, pos_size in iter_children(reader, child_offset, child_offset + child_size):
+                    if pos_id == CUE_CLUSTER_POSITION:
+                        position = read_uint(reader, pos_offset, pos_size)
+        if cue_time is not None and position is not None:
+            cues.append((cue_time, segment_start + position))
+    return cues
+
+
+def scan_webm_cluster(reader, offset, data_offset, size, segment_end, tracks, scan):
+    """
+    没有Cues(如MediaRecorder生成的文件)时逐个读取Cluster里的块头: 只读轨道号、相对时间戳和关键帧标志,
+    跳过块数据; 每个含视频关键帧的Cluster记一条索引(纯音频文件每个Cluster都可以定位)。返回下一个元素的偏移
+    """
+    end = segment_end if size == UNKNOWN_SIZE else min(segment_end, data_offset + size)
+    video_tracks = {number for number, track in tracks.items() if track[0] == 1}
+    cluster_time = 0
+    keyframe = None
+    position = data_offset
+    while position < end:
+        element_id, child_offset, child_size = read_element(reader, position)
+        if size == UNKNOWN_SIZE and element_id in LEVEL1_IDS:
+            break
+        if child_size == UNKNOWN_SIZE:
+            raise EOFError
+        if element_id == CLUSTER_TIMECODE:
+            cluster_time = read_uint(reader, child_offset, child_size)
+        elif element_id in (SIMPLE_BLOCK, BLOCK_GROUP):
+            if element_id == SIMPLE_BLOCK:
+                block_offset, is_key = child_offset, None
+            else:
+                block_offset, is_key = None, True
+                for group_id, group_offset, _ in iter_children(reader, child_offset, child_offset + child_size):
+                    if group_id == BLOCK:
+                        block_offset = group_offset
+                    elif group_id == REFERENCE_BLOCK:
+                        is_key = False
+            if block_offset is not None:
+                track, track_length = read_vint(reader, block_offset)
+                relative, flags = struct.unpack('>hB', reader.read(block_offset + track_length, 3))
+                if is_key is None:
+                    is_key = bool(flags & 0x80)
+                block_time = cluster_time + relative
+                scan[0] = max(scan[0], block_time)
+                if keyframe is None and (track in video_tracks if video_tracks else True) and is_key:
+                    keyframe = block_time
+        position = child_offset + child_size
+    if keyframe is not None:
+        scan[1].append((keyframe, offset))
+    return position
+
+
+# ---------- MP4 (ISO BMFF) ----------
+
+def iter_boxes(reader, start, end):
+    """
+    返回(box_type, 数据偏移, 数据结束偏移)
+    """
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack('>I4s', reader.read(offset, 8))
+        header = 8
+        if size == 1:
+            size = struct.unpack('>Q', reader.read(offset + 8, 8))[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header:
+            raise MediaParseError(f'Invalid box size at {offset}')
+        yield box_type.decode('latin-1'), offset + header, min(end, offset + size)
+        offset += size
+
+
+def find_box(reader, start, end, path):
+    for box_type, data_offset, data_end in iter_boxes(reader, start, end):
+        if box_type == path[0]:
+            if len(path) == 1:
+                return data_offset, data_end
+            return find_box(reader, data_offset, data_end, path[1:])
+    return None
+
+
+def read_full_box_times(reader, offset):
+    """
+    mvhd/mdhd: 返回(timescale, duration)
+    """
+    version = reader.read(offset, 1)[0]
+    if version == 1:
+        return struct.unpack('>IQ', reader.read(offset + 20, 12))
+    return struct.unpack('>II', reader.read(offset + 12, 8))
+
+
+def read_table(reader, box, entry_format, header=8):
+    """
+    读取stts/stsc/stco等表: 跳过version/flags和entry_count(stsz还有sample_size), 返回展开后的整数元组
+    """
+    data_offset, data_end = box
+    count = struct.unpack('>I', reader.read(data_offset + header - 4, 4))[0]
+    entry_size = struct.calcsize('>' + entry_format)
+    count = min(count, (data_end - data_offset - header) // entry_size)
+    return struct.unpack(f'>{entry_format * count}', reader.read(data_offset + header, entry_size * count))
+
+
+def parse_mp4_sample_entry(reader, stsd, handler):
+    """
+    stsd的第一个条目: 返回(codec, width, height)
+    """
+    data_offset, data_end = stsd
+    entry = data_offset + 8
+    if entry + 8 > data_end:
+        return None, None, None
+    entry_size, fourcc = struct.unpack('>I4s', reader.read(entry, 8))
+    fourcc = fourcc.decode('latin-1')
+    codec = MP4_CODECS.get(fourcc, fourcc.strip().lower())
+    if handler != 'vide':
+        return codec, None, None
+    width, height = struct.unpack('>HH', reader.read(entry + 32, 4))
+    return codec, width, height
+
+
+def mp4_keyframes(reader, stbl):
+    """
+    由stss(关键帧序号)、stts(时长)、stsc/stco/co64(块偏移)和stsz(样本大小)计算关键帧的(时间, 字节偏移)
+    """
+    boxes = {}
+    for box_type, data_offset, data_end in iter_boxes(reader, *stbl):
+        boxes[box_type] = (data_offset, data_end)
+    if 'stts' not in boxes or 'stsc' not in boxes or 'stsz' not in boxes:
+        return []
+    chunk_box = boxes.get('stco') or boxes.get('co64')
+    if chunk_box is None:
+        return []
+
+    stts = read_table(reader, boxes['stts'], 'II')
+    stsc = read_table(reader, boxes['stsc'], 'III')
+    chunk_offsets = read_table(reader, chunk_box, 'I' if 'stco' in boxes else 'Q')
+    sample_size, sample_count = struct.unpack('>II', reader.read(boxes['stsz'][0] + 4, 8))
+    sizes = read_table(reader, boxes['stsz'], 'I', header=12) if sample_size == 0 else None
+    if sizes is not None:
+        sample_count = len(sizes)
+    # 没有stss表示所有样本都是关键帧
+    sync = read_table(reader, boxes['stss'], 'I') if 'stss' in boxes else range(1, sample_count + 1)
+
+    # 每个样本的起始时间(只展开到需要的关键帧)
+    times = {}
+    wanted = iter(sync)
+    target = next(wanted, None)
+    sample, current = 1, 0
+    for i in range(0, len(stts), 2):
+        count, delta = stts[i], stts[i + 1]
+        while target is not None and target < sample + count:
+            if target >= sample:
+                times[target] = current + (target - sample) * delta
+            target = next(wanted, None)
+        sample += count
+        current += count * delta
+        if target is None:
+            break
+
+    # 每个关键帧所在的块和块内偏移
+    offsets = {}
+    wanted = iter(sync)
+    target = next(wanted, None)
+    sample = 1
+    runs = [stsc[i:i + 3] for i in range(0, len(stsc), 3)]
+    for index, (first_chunk, per_chunk, _) in enumerate(runs):
+        last_chunk = runs[index + 1][0] - 1 if index + 1 < len(runs) else len(chunk_offsets)
+        for chunk in range(first_chunk, last_chunk + 1):
+            if target is None or chunk > len(chunk_offsets):
+                break
+            if target >= sample + per_chunk:
+                sample += per_chunk
+                continue
+            position = chunk_offsets[chunk - 1]
+            for s in range(sample, sample + per_chunk):
+                if s == target:
+                    offsets[s] = position
+                    target = next(wanted, None)
+                    if target is None or target >= sample + per_chunk:
+                        break
+                position += sizes[s - 1] if sizes is not None else sample_size
+            sample += per_chunk
+
+    return [(times[s], offsets[s]) for s in sync if s in times and s in offsets]
+
+
+def parse_mp4(reader):
+    result = {'container': 'mp4'}
+    moov = None
+    fragments = []  # 分片MP4: (moof偏移, track_id, base_media_decode_time)
+    for box_type, data_offset, data_end in iter_boxes(reader, 0, reader.size):
+        if box_type == 'ftyp':
+            brand = reader.read(data_offset, 4).decode('latin-1')
+            if brand.startswith('qt'):
+                result['container'] = 'mov'
+        elif box_type == 'moov':
+            moov = (data_offset, data_end)
+        elif box_type == 'moof':
+            for traf_type, traf_offset, traf_end in iter_boxes(reader, data_offset, data_end):
+                if traf_type != 'traf':
+                    continue
+                tfhd = find_box(reader, traf_offset, traf_end, ['tfhd'])
+                tfdt = find_box(reader, traf_offset, traf_end, ['tfdt'])
+                if tfhd and tfdt:
+                    track_id = struct.unpack('>I', reader.read(tfhd[0] + 4, 4))[0]
+                    version = reader.read(tfdt[0], 1)[0]
+                    decode_time = struct.unpack('>Q' if version == 1 else '>I',
+                                                reader.read(tfdt[0] + 4, 8 if version == 1 else 4))[0]
+                    fragments.append((data_offset - 8, track_id, decode_time))
+    if moov is None:
+        raise MediaParseError('Missing moov box')
+
+    mvhd = find_box(reader, *moov, ['mvhd'])
+    if mvhd:
+        timescale, duration = read_full_box_times(reader, mvhd[0])
+        if not duration:
+            mehd = find_box(reader, *moov, ['mvex', 'mehd'])
+            if mehd:
+                version = reader.read(mehd[0], 1)[0]
+                duration = struct.unpack('>Q' if version == 1 else '>I',
+                                         reader.read(mehd[0] + 4, 8 if version == 1 else 4))[0]
+        if timescale and duration:
+            result['duration_ms'] = duration * 1000 // timescale
+
+    for box_type, trak_offset, trak_end in iter_boxes(reader, *moov):
+        if box_type != 'trak':
+            continue
+        hdlr = find_box(reader, trak_offset, trak_end, ['mdia', 'hdlr'])
+        mdhd = find_box(reader, trak_offset, trak_end, ['mdia', 'mdhd'])
+        stbl = find_box(reader, trak_offset, trak_end, ['mdia', 'minf', 'stbl'])
+        tkhd = find_box(reader, trak_offset, trak_end, ['tkhd'])
+        if not hdlr or not mdhd or not stbl:
+            continue
+        handler = reader.read(hdlr[0] + 8, 4).decode('latin-1')
+        timescale, _ = read_full_box_times(reader, mdhd[0])
+        stsd = find_box(reader, *stbl, ['stsd'])
+        codec, width, height = parse_mp4_sample_entry(reader, stsd, handler) if stsd else (None, None, None)
+
+        if handler == 'vide' and 'video_codec' not in result:
+            result['video_codec'] = codec
+            result['width'], result['height'] = width, height
+            if not timescale:
+                continue
+            keyframes = mp4_keyframes(reader, stbl)
+            if not keyframes and fragments and tkhd:
+                version = reader.read(tkhd[0], 1)[0]
+                track_id = struct.unpack('>I', reader.read(tkhd[0] + (20 if version == 1 else 12), 4))[0]
+                keyframes = [(t, offset) for offset, tid, t in fragments if tid == track_id]
+            result['cues'] = [(t * 1000 // timescale, offset) for t, offset in keyframes]
+        elif handler == 'soun' and 'audio_codec' not in result:
+            result['audio_codec'] = codec
+    return result
+
+
+def probe(file_path):
+    """
+    读取WebM/MP4文件头部信息: container, duration_ms, video_codec, audio_codec, width, height, bitrate, cues
+    """
+    file_size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        reader = Reader(f, file_size)
+        try:
+            magic = reader.read(0, 8)
+        except EOFError:
+            raise MediaParseError('File too small')
+        if magic[:4] == b'\x1a\x45\xdf\xa3':
+            result = parse_webm(reader)
+        elif magic[4:8] in (b'ftyp', b'moov', b'free', b'mdat', b'wide', b'skip'):
+            try:
+                result = parse_mp4(reader)
+            except EOFError:
+                raise MediaParseError('Truncated MP4 file')
+        else:
+            raise MediaParseError('Unsupported container')
+
+    duration_ms = result.get('duration_ms')
+    if duration_ms:
+        result['bitrate'] = file_size * 8 * 1000 // duration_ms
+    result['cues'] = thin_cues(result.get('cues') or [])
+    return result
+
+
+METADATA_COLUMNS = ('container', 'duration_ms', 'video_codec', 'audio_codec', 'width', 'height', 'bitrate')
+
+
+class MediaIndexer:
+    """
+    后台线程池: 解析录制文件的容器头部, 把时长、编码、分辨率、码率写入recordings, 关键帧位置写入recording_cues
+
+    上传完成和停止录制后立即入队; 另有一个扫描线程定期补齐index_status为空的记录(旧数据、文件被替换)
+    """
+
+    def __init__(self, db, workers=2, interval=60, batch=200):
+        self.db = db
+        self.workers = workers
+        self.interval = interval
+        self.batch = batch
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+        self.indexed = 0
+        self.failed = 0
+
+    def init_schema(self):
+        columns = {row[1] for row in self.db.query_all('PRAGMA table_info(recordings)')}
+        for column, column_type in (
+            ('container', 'TEXT'), ('duration_ms', 'INTEGER'), ('video_codec', 'TEXT'),
+            ('audio_codec', 'TEXT'), ('width', 'INTEGER'), ('height', 'INTEGER'),
+            ('bitrate', 'INTEGER'), ('index_status', 'TEXT')
+        ):
+            if column not in columns:
+                self.db.execute(f'ALTER TABLE recordings ADD COLUMN {column} {column_type}')
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS recording_cues (
+                recording_id TEXT NOT NULL,
+                time_ms INTEGER NOT NULL,
+                byte_offset INTEGER NOT NULL,
+                PRIMARY KEY (recording_id, time_ms)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_recordings_unindexed ON recordings (id) WHERE index_status IS NULL;
+            CREATE INDEX IF NOT EXISTS idx_recordings_duration ON recordings (duration_ms);
+            CREATE INDEX IF NOT EXISTS idx_recordings_video_codec ON recordings (video_codec, start_time DESC, id DESC);
+            CREATE INDEX IF NOT EXISTS idx_recordings_audio_codec ON recordings (audio_codec, start_time DESC, id DESC);
+            CREATE INDEX IF NOT EXISTS idx_recordings_container ON recordings (container, start_time DESC, id DESC);
+        ''')
+
+    def enqueue(self, recording_id):
+        with self._lock:
+            if recording_id in self._pending:
+                return
+            self._pending.add(recording_id)
+        self._queue.put(recording_id)
+
+    def index_recording(self, recording_id):
+        """
+        解析并保存一条录制的元数据, 返回index_status: ok / unsupported / error / missing
+        """
+        row = self.db.query_one('SELECT file_path, status FROM recordings WHERE id = ?', (recording_id,))
+        if row is None:
+            return None
+        file_path, status = row
+        if status == 'recording':
+            # 录制中的文件还在增长, 停止录制后再解析
+            return None
+
+        metadata, cues = {}, []
+        try:
+            metadata = probe(file_path)
+            cues = metadata.pop('cues')
+            index_status = 'ok'
+        except FileNotFoundError:
+            index_status = 'missing'
+        except MediaParseError:
+            index_status = 'unsupported'
+        except Exception as e:
+            print(f'解析录制文件失败 {recording_id}: {e}')
+            index_status = 'error'
+
+        values = [metadata.get(column) for column in METADATA_COLUMNS]
+        with self.db.transaction() as conn:
+            # 解析期间文件可能被换走(例如移入内容寻址存储), 只在路径未变时写入;
+            # 路径已变时不写入, index_status保持为空, 下一轮扫描按新路径重新解析
+            updated = conn.execute(
+                f'''UPDATE recordings SET {', '.join(f'{column} = ?' for column in METADATA_COLUMNS)}, index_status = ?
+                    WHERE id = ? AND file_path = ?''',
+                (*values, index_status, recording_id, file_path)
+            ).rowcount
+            if not updated:
+                return None
+            conn.execute('DELETE FROM recording_cues WHERE recording_id = ?', (recording_id,))
+            conn.executemany(
+                'INSERT OR REPLACE INTO recording_cues (recording_id, time_ms, byte_offset) VALUES (?, ?, ?)',
+                [(recording_id, time_ms, offset) for time_ms, offset in cues]
+            )
+        if index_status == 'ok':
+            self.indexed += 1
+        else:
+            self.failed += 1
+        return index_status
+
+    def run_once(self):
+        """
+        把没有索引的已结束录制放入队列, 返回入队数量
+        """
+        rows = self.db.query_all(
+            '''SELECT id FROM recordings
+               WHERE index_status IS NULL AND status != 'recording' LIMIT ?''',
+            (self.batch,)
+        )
+        for (recording_id,) in rows:
+            self.enqueue(recording_id)
+        return len(rows)
+
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                recording_id = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            try:
+                self.index_recording(recording_id)
+            except Exception as e:
+                print(f'保存录制文件信息失败 {recording_id}: {e}')
+            finally:
+                with self._lock:
+                    self._pending.discard(recording_id)
+
+    def _scan(self):
+        while not self._stop.is_set():
+            try:
+                # 队列清空后再补下一批, 避免重复入队
+                if self._queue.empty():
+                    self.run_once()
+            except Exception as e:
+                print(f'扫描待解析录制失败: {e}')
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._threads or self.workers <= 0:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'media-indexer-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        if self.interval > 0:
+            thread = threading.Thread(target=self._scan, name='media-indexer-scan', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+
+    def wait_idle(self, timeout=None):
+        """
+        等待队列中的录制都处理完, 返回是否已空闲
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                if not self._pending:
+                    return True
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'queued': self._queue.qsize(),
+            'indexed': self.indexed,
+            'failed': self.failed
+        }
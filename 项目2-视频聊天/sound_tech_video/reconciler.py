@@ -0,0 +1,87 @@
+import os
+import threading
+
+
+def stat_file(file_path):
+    """
+    返回(file_exists, file_size)
+    """
+    try:
+        return 1, os.stat(file_path).st_size
+    except (OSError, TypeError, ValueError):
+        return 0, 0
+
+
+class FileMetadataReconciler:
+    """
+    后台线程: 分批扫描recordings, 把数据库中的file_exists/file_size与磁盘上的实际文件同步
+    (文件被手工删除、替换或旧数据还没有这两列的值)
+
+    正在录制的行由LiveIngest维护: file_size是下一个分片的写入位置, 这里不能改写
+    """
+
+    def __init__(self, db, interval=300, batch=500):
+        self.db = db
+        self.interval = interval
+        self.batch = batch
+        self._stop = threading.Event()
+        self._thread = None
+        self.passes = 0
+        self.updated = 0
+
+    def run_once(self):
+        """
+        扫描一遍全表, 返回更新的行数; 按id分批, 每批一个短事务
+        """
+        updated = 0
+        last_id = ''
+        while not self._stop.is_set():
+            rows = self.db.query_all(
+                '''SELECT id, file_path, file_exists, file_size FROM recordings
+                   WHERE id > ? AND status != 'recording' ORDER BY id LIMIT ?''',
+                (last_id, self.batch)
+            )
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            changes = []
+            for recording_id, file_path, file_exists, file_size in rows:
+                exists, size = stat_file(file_path)
+                if (exists, size) != (file_exists, file_size):
+                    changes.append((exists, size, recording_id))
+            if changes:
+                # 文件有变化时清空index_status, 由MediaIndexer重新解析
+                with self.db.transaction() as conn:
+                    conn.executemany(
+                        'UPDATE recordings SET file_exists = ?, file_size = ?, index_status = NULL WHERE id = ?',
+                        changes
+                    )
+                updated += len(changes)
+
+        self.passes += 1
+        self.updated += updated
+        return updated
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f'同步录制文件信息失败: {e}')
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(target=self._loop, name='file-reconciler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {
+            'interval': self.interval,
+            'passes': self.passes,
+            'updated': self.updated
+        }
@@ -0,0 +1,438 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+
+# 已计算哈希、尚未入库的内容; temporary为True时temp_path是stage()写出的临时文件, 失败时删除
+StagedBlob = namedtuple('StagedBlob', ['sha256', 'size', 'temp_path', 'extension', 'temporary'])
+
+
+class BlobStore:
+    """
+    按内容寻址的录制文件存储: 文件以SHA-256命名, 放在root/ab/cd/<sha256>.<ext>分级目录中,
+    内容相同的上传只保存一份。blobs.refcount记录引用该文件的recordings行数, 与recordings的增删在同一事务中更新;
+    引用数为0的文件由RetentionSweeper在后台分批删除
+
+    入库分两步: commit()在调用方的写事务中更新引用, 事务提交后place()再把文件放到内容地址,
+    事务失败时不会留下没有blobs行的文件。删除在写事务中进行, 引用数在持锁时再确认, 不会删掉刚被重新引用的文件
+    """
+
+    COPY_BUFFER = 1024 * 1024
+
+    def __init__(self, db, root):
+        self.db = db
+        self.root = root
+
+    def init_schema(self):
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS blobs (
+                sha256 TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                refcount INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_blobs_unreferenced ON blobs (sha256) WHERE refcount <= 0;
+            CREATE TABLE IF NOT EXISTS file_deletions (
+                path TEXT PRIMARY KEY,
+                queued_at REAL NOT NULL
+            );
+        ''')
+        columns = {row[1] for row in self.db.query_all('PRAGMA table_info(recordings)')}
+        if 'blob_sha256' not in columns:
+            self.db.execute('ALTER TABLE recordings ADD COLUMN blob_sha256 TEXT')
+        self.db.executescript('''
+            CREATE INDEX IF NOT EXISTS idx_recordings_blob ON recordings (blob_sha256);
+            CREATE INDEX IF NOT EXISTS idx_recordings_unadopted ON recordings (id) WHERE blob_sha256 IS NULL;
+        ''')
+
+    def path_for(self, sha256, extension):
+        return os.path.join(self.root, sha256[:2], sha256[2:4], f'{sha256}.{extension}')
+
+    def stage(self, stream, extension):
+        """
+        把上传流写入临时文件, 同时计算SHA-256
+        """
+        temp_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(temp_dir, exist_ok=True)
+        temp_path = os.path.join(temp_dir, f'{uuid.uuid4().hex}.part')
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(temp_path, 'wb') as f:
+                for block in iter(lambda: stream.read(self.COPY_BUFFER), b''):
+                    digest.update(block)
+                    f.write(block)
+                    size += len(block)
+        except BaseException:
+            self.discard(StagedBlob(None, 0, temp_path, extension, True))
+            raise
+        return StagedBlob(digest.hexdigest(), size, temp_path, extension, True)
+
+    def stage_file(self, file_path, extension, sha256=None):
+        """
+        已在磁盘上的文件(分片上传完成、录制结束)直接作为待入库内容; 没有给出sha256时读一遍计算。
+        入库失败时原文件保留
+        """
+        size = os.path.getsize(file_path)
+        if sha256 is None:
+            digest = hashlib.sha256()
+            with open(file_path, 'rb') as f:
+                for block in iter(lambda: f.read(self.COPY_BUFFER), b''):
+                    digest.update(block)
+            sha256 = digest.hexdigest()
+        return StagedBlob(sha256, size, file_path, extension, False)
+
+    def discard(self, staged):
+        """
+        入库失败时调用: 删除stage()写出的临时文件, stage_file()的原文件保留
+        """
+        if not staged.temporary:
+            return
+        try:
+            os.remove(staged.temp_path)
+        except FileNotFoundError:
+            pass
+
+    def commit(self, conn, staged):
+        """
+        在调用方的写事务中增加引用, 返回(file_path, deduplicated); 只改数据库, 不动文件。
+        调用方在同一事务中写入引用它的recordings行(blob_sha256), 事务提交后调用place()
+        """
+        row = conn.execute('SELECT path FROM blobs WHERE sha256 = ?', (staged.sha256,)).fetchone()
+        if row:
+            conn.execute('UPDATE blobs SET refcount = refcount + 1 WHERE sha256 = ?', (staged.sha256,))
+            # 文件被手工删除过时由place()用这次的内容补回
+            return row[0], os.path.exists(row[0])
+        file_path = self.path_for(staged.sha256, staged.extension)
+        conn.execute(
+            'INSERT INTO blobs (sha256, path, size, refcount, created_at) VALUES (?, ?, ?, 1, ?)',
+            (staged.sha256, file_path, staged.size, time.time())
+        )
+        return file_path, False
+
+    def place(self, staged, file_path):
+        """
+        commit()所在事务提交后调用: 内容地址上已有文件时删除这份重复内容, 否则移动过去。
+        此时引用数至少为1, 后台回收不会删除该文件
+        """
+        if os.path.exists(file_path):
+            os.remove(staged.temp_path)
+            return
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        os.replace(staged.temp_path, file_path)
+
+    def drop_recordings(self, conn, recording_ids):
+        """
+        在调用方的写事务中删除录制记录: 内容寻址的文件只减少引用, 旧的独立文件登记到file_deletions,
+        磁盘空间都由后台回收。返回删除的行数
+        """
+        # id列表作为一个JSON参数传入, 不受SQLite参数个数限制
+        rows = conn.execute(
+            'SELECT id, blob_sha256, file_path FROM recordings WHERE id IN (SELECT value FROM json_each(?))',
+            (json.dumps(list(recording_ids)),)
+        ).fetchall()
+        if not rows:
+            return 0
+        ids = [(row[0],) for row in rows]
+        conn.executemany('DELETE FROM recordings WHERE id = ?', ids)
+        conn.executemany('DELETE FROM recording_cues WHERE recording_id = ?', ids)
+
+        released = {}
+        for _, blob_sha256, file_path in rows:
+            if blob_sha256:
+                released[blob_sha256] = released.get(blob_sha256, 0) + 1
+        now = time.time()
+        conn.executemany(
+            'INSERT OR IGNORE INTO file_deletions (path, queued_at) VALUES (?, ?)',
+            [(file_path, now) for _, blob_sha256, file_path in rows if not blob_sha256 and file_path]
+        )
+        if released:
+            conn.executemany(
+                'UPDATE blobs SET refcount = refcount - ? WHERE sha256 = ?',
+                [(count, sha256) for sha256, count in released.items()]
+            )
+        return len(rows)
+
+    def stats(self):
+        blobs, stored, referenced = self.db.query_one(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(size * refcount), 0) FROM blobs'
+        )
+        return {
+            'blobs': blobs,
+            'stored_bytes': stored,
+            'referenced_bytes': referenced
+        }
+
+
+class RetentionSweeper:
+    """
+    后台线程: 按保留策略淘汰录制, 回收没有引用的文件
+
+    每一轮依次执行:
+    1. 超过max_age_days的录制删除
+    2. 单个房间的录制总大小超过room_quota时从最早的开始删除
+    3. 全部文件总大小超过max_bytes时从最早的开始删除
+    4. 录制结束、还没有进入内容寻址存储的文件计算哈希后移入(相同内容只保留一份)
+    5. 删除引用数为0的文件和file_deletions中登记的文件
+    每批最多batch条, 一批一个短事务; 0表示不启用对应的限制。录制中的记录不会被淘汰
+    """
+
+    def __init__(self, db, store, interval=600, batch=200, max_age_days=0, room_quota=0, max_bytes=0):
+        self.db = db
+        self.store = store
+        self.interval = interval
+        self.batch = batch
+        self.max_age_days = max_age_days
+        self.room_quota = room_quota
+        self.max_bytes = max_bytes
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._reclaimer = None  # 没有后台线程时, wakeup()启动的一次性回收线程
+        self.passes = 0
+        self.evicted = 0
+        self.adopted = 0
+        self.reclaimed_files = 0
+        self.reclaimed_bytes = 0
+
+    def _evict(self, recording_ids):
+        with self.db.transaction() as conn:
+            evicted = self.store.drop_recordings(conn, recording_ids)
+        self.evicted += evicted
+        return evicted
+
+    def _oldest(self, where, params, limit):
+        return self.db.query_all(
+            f'''SELECT id, COALESCE(file_size, 0) FROM recordings
+                WHERE status != 'recording' AND {where}
+                ORDER BY start_time, id LIMIT ?''',
+            (*params, limit)
+        )
+
+    def _evict_until(self, where, params, excess):
+        """
+        从最早的录制开始删除, 直到释放的大小达到excess(共享的文件按各自大小估算)
+        """
+        evicted = 0
+        while excess > 0 and not self._stop.is_set():
+            rows = self._oldest(where, params, self.batch)
+            if not rows:
+                break
+            chosen = []
+            for recording_id, file_size in rows:
+                chosen.append(recording_id)
+                excess -= file_size
+                if excess <= 0:
+                    break
+            evicted += self._evict(chosen)
+        return evicted
+
+    def enforce_age(self):
+        if not self.max_age_days:
+            return 0
+        cutoff = datetime.now() - timedelta(days=self.max_age_days)
+        evicted = 0
+        while not self._stop.is_set():
+            rows = self._oldest('start_time < ?', (cutoff,), self.batch)
+            if not rows:
+                break
+            evicted += self._evict([row[0] for row in rows])
+        return evicted
+
+    def enforce_room_quota(self):
+        if not self.room_quota:
+            return 0
+        rooms = self.db.query_all(
+            '''SELECT room_id, SUM(file_size) FROM recordings
+               GROUP BY room_id HAVING SUM(file_size) > ?''',
+            (self.room_quota,)
+        )
+        evicted = 0
+        for room_id, total in rooms:
+            evicted += self._evict_until('room_id = ?', (room_id,), total - self.room_quota)
+        return evicted
+
+    def total_bytes(self):
+        """
+        内容寻址文件(去重后)加上旧的独立文件的总大小
+        """
+        stored = self.db.query_one('SELECT COALESCE(SUM(size), 0) FROM blobs WHERE refcount > 0')[0]
+        legacy = self.db.query_one(
+            'SELECT COALESCE(SUM(file_size), 0) FROM recordings WHERE blob_sha256 IS NULL'
+        )[0]
+        return stored + legacy
+
+    def enforce_global_cap(self):
+        if not self.max_bytes:
+            return 0
+        evicted = 0
+        while not self._stop.is_set():
+            excess = self.total_bytes() - self.max_bytes
+            if excess <= 0:
+                break
+            count = self._evict_until('1 = 1', (), excess)
+            if not count:
+                break
+            evicted += count
+        return evicted
+
+    def adopt_legacy(self):
+        """
+        把录制结束后的独立文件(实时录制、升级前的上传)移入内容寻址存储
+        """
+        adopted = 0
+        rows = self.db.query_all(
+            '''SELECT id, file_path FROM recordings
+               WHERE blob_sha256 IS NULL AND status != 'recording' AND file_exists = 1
+               LIMIT ?''',
+            (self.batch,)
+        )
+        for recording_id, file_path in rows:
+            if self._stop.is_set():
+                break
+            extension = file_path.rsplit('.', 1)[-1].lower() if '.' in file_path else 'bin'
+            try:
+                staged = self.store.stage_file(file_path, extension)
+            except FileNotFoundError:
+                self.db.execute('UPDATE recordings SET file_exists = 0 WHERE id = ?', (recording_id,))
+                continue
+            with self.db.transaction() as conn:
+                current = conn.execute(
+                    'SELECT file_path, blob_sha256, status FROM recordings WHERE id = ?', (recording_id,)
+                ).fetchone()
+                # 计算哈希期间记录被删除或修改过则跳过(文件仍归原来的流程处理)
+                if current is None or current[0] != file_path or current[1] is not None or current[2] == 'recording':
+                    continue
+                new_path, _ = self.store.commit(conn, staged)
+                conn.execute(
+                    'UPDATE recordings SET file_path = ?, blob_sha256 = ?, file_size = ? WHERE id = ?',
+                    (new_path, staged.sha256, staged.size, recording_id)
+                )
+            try:
+                self.store.place(staged, new_path)
+            except OSError:
+                # 移动失败时记录改回原文件, 引用也退回
+                with self.db.transaction() as conn:
+                    if conn.execute(
+                        'UPDATE recordings SET file_path = ?, blob_sha256 = NULL WHERE id = ? AND blob_sha256 = ?',
+                        (file_path, recording_id, staged.sha256)
+                    ).rowcount:
+                        conn.execute('UPDATE blobs SET refcount = refcount - 1 WHERE sha256 = ?', (staged.sha256,))
+                raise
+            adopted += 1
+        self.adopted += adopted
+        return adopted
+
+    def reclaim(self):
+        """
+        删除引用数为0的文件和登记待删除的文件, 返回释放的字节数
+        """
+        freed = 0
+        while not self._stop.is_set():
+            rows = self.db.query_all(
+                'SELECT sha256, path, size FROM blobs WHERE refcount <= 0 LIMIT ?', (self.batch,)
+            )
+            if not rows:
+                break
+            with self.db.transaction() as conn:
+                for sha256, path, size in rows:
+                    # 持有写锁时再确认一次, 期间没有新的引用才删除
+                    if conn.execute('DELETE FROM blobs WHERE sha256 = ? AND refcount <= 0', (sha256,)).rowcount:
+                        freed += self._remove(path, size)
+
+        while not self._stop.is_set():
+            rows = self.db.query_all('SELECT path FROM file_deletions LIMIT ?', (self.batch,))
+            if not rows:
+                break
+            for (path,) in rows:
+                freed += self._remove(path)
+            with self.db.transaction() as conn:
+                conn.executemany('DELETE FROM file_deletions WHERE path = ?', rows)
+        return freed
+
+    def _remove(self, path, size=None):
+        try:
+            if size is None:
+                size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return 0
+        self.reclaimed_files += 1
+        self.reclaimed_bytes += size
+        return size
+
+    def run_once(self):
+        self.enforce_age()
+        self.enforce_room_quota()
+        self.enforce_global_cap()
+        self.adopt_legacy()
+        freed = self.reclaim()
+        self.passes += 1
+        return freed
+
+    def wakeup(self):
+        """
+        删除录制后调用: 不等下一轮, 立即在后台删除已无引用的文件;
+        interval为0(不启动后台线程)时由一次性线程回收, 同一时刻最多一个
+        """
+        self._wakeup.set()
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._reclaimer is None:
+                self._reclaimer = threading.Thread(target=self._reclaim_pending, name='retention-reclaim', daemon=True)
+                self._reclaimer.start()
+
+    def _reclaim_pending(self):
+        while True:
+            # 持锁检查并退出, 退出前到达的wakeup()会在下一次循环中处理, 之后到达的会启动新线程
+            with self._lock:
+                if not self._wakeup.is_set() or self._stop.is_set():
+                    self._reclaimer = None
+                    return
+                self._wakeup.clear()
+            try:
+                self.reclaim()
+            except Exception as e:
+                print(f'回收录制存储失败: {e}')
+
+    def _loop(self):
+        next_pass = 0.0
+        while not self._stop.is_set():
+            try:
+                if time.monotonic() >= next_pass:
+                    next_pass = time.monotonic() + self.interval
+                    self.run_once()
+                else:
+                    # 两轮之间被唤醒时只回收空间, 不执行保留策略和哈希计算
+                    self.reclaim()
+            except Exception as e:
+                print(f'回收录制存储失败: {e}')
+            self._wakeup.wait(max(0.0, next_pass - time.monotonic()))
+            self._wakeup.clear()
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(target=self._loop, name='retention-sweeper', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def stats(self):
+        return {
+            'interval': self.interval,
+            'passes': self.passes,
+            'evicted': self.evicted,
+            'adopted': self.adopted,
+            'reclaimed_files': self.reclaimed_files,
+            'reclaimed_bytes': self.reclaimed_bytes
+        }
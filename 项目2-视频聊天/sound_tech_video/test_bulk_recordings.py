@@ -0,0 +1,192 @@
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+import uuid
+from datetime import datetime, timedelta
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db import Database
+from storage import BlobStore, RetentionSweeper
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+class TestSweeperWakeup(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db = Database(os.path.join(self.tmp, 'test.db'))
+        self.db.executescript('''
+            CREATE TABLE recordings (
+                id TEXT PRIMARY KEY,
+                room_id TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                start_time TIMESTAMP,
+                status TEXT DEFAULT 'stopped',
+                file_size INTEGER,
+                file_exists INTEGER
+            );
+            CREATE TABLE recording_cues (recording_id TEXT NOT NULL, time_ms INTEGER, byte_offset INTEGER);
+        ''')
+        self.store = BlobStore(self.db, os.path.join(self.tmp, 'objects'))
+        self.store.init_schema()
+        # SWEEP_INTERVAL为0: 不启动后台线程
+        self.sweeper = RetentionSweeper(self.db, self.store, interval=0)
+        self.sweeper.start()
+
+    def tearDown(self):
+        self.sweeper.stop()
+        self.db.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_wakeup_without_thread(self):
+        """测试没有后台线程时删除录制后文件仍被回收"""
+        staged = self.store.stage(io.BytesIO(b'x' * 100), 'webm')
+        with self.db.transaction() as conn:
+            file_path, _ = self.store.commit(conn, staged)
+            conn.execute(
+                "INSERT INTO recordings (id, room_id, file_path, blob_sha256) VALUES ('r1', 'room', ?, ?)",
+                (file_path, staged.sha256)
+            )
+        self.store.place(staged, file_path)
+
+        with self.db.transaction() as conn:
+            self.assertEqual(self.store.drop_recordings(conn, ['r1']), 1)
+        self.sweeper.wakeup()
+        self.assertTrue(wait_until(lambda: not os.path.exists(file_path)))
+        self.assertTrue(wait_until(lambda: self.sweeper._reclaimer is None))
+        self.assertEqual(self.db.query_one('SELECT COUNT(*) FROM blobs')[0], 0)
+        self.assertEqual(self.sweeper.stats()['reclaimed_files'], 1)
+
+
+class TestBulkEndpoints(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # app在导入时按相对路径打开数据库, 先切到临时目录
+        cls.cwd = os.getcwd()
+        cls.app_dir = tempfile.mkdtemp()
+        os.chdir(cls.app_dir)
+        import app
+        cls.app = app
+        app.init_db()
+        cls.client = app.app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        os.chdir(cls.cwd)
+        cls.app.db.close()
+        shutil.rmtree(cls.app_dir, ignore_errors=True)
+
+    def setUp(self):
+        self.room = uuid.uuid4().hex
+        self.start = datetime.now()
+
+    def add_recording(self, data, room=None, minutes=0):
+        recording_id, file_path, _ = self.app.save_recording(
+            room or self.room, self.app.blob_store.stage(io.BytesIO(data), 'webm')
+        )
+        self.app.db.execute(
+            'UPDATE recordings SET start_time = ? WHERE id = ?',
+            (self.start + timedelta(minutes=minutes), recording_id)
+        )
+        return recording_id, file_path
+
+    def add_legacy(self, status='stopped'):
+        """升级前的独立文件(file_exists为0, 不会被后台移入内容寻址存储)"""
+        recording_id = str(uuid.uuid4())
+        file_path = os.path.join(self.app_dir, f'{recording_id}.webm')
+        with open(file_path, 'wb') as f:
+            f.write(b'legacy')
+        self.app.db.execute(
+            '''INSERT INTO recordings (id, room_id, file_path, start_time, status, file_size, file_exists)
+               VALUES (?, ?, ?, ?, ?, 6, 0)''',
+            (recording_id, self.room, file_path, self.start, status)
+        )
+        return recording_id, file_path
+
+    def post(self, path, **data):
+        return self.client.post(f'/api/v1/recordings/bulk/{path}', json=data)
+
+    def count(self, room=None):
+        return self.app.db.query_one('SELECT COUNT(*) FROM recordings WHERE room_id = ?', (room or self.room,))[0]
+
+    def test_delete_in_batches(self):
+        """测试超过BULK_MAX_ROWS时分批删除, 共享和独立的文件都被回收"""
+        shared = os.urandom(100)
+        _, shared_path = self.add_recording(shared, minutes=1)
+        self.add_recording(shared, minutes=2)
+        _, own_path = self.add_recording(os.urandom(100), minutes=3)
+        _, legacy_path = self.add_legacy()
+        other_room = uuid.uuid4().hex
+        _, other_path = self.add_recording(os.urandom(100), room=other_room)
+
+        with mock.patch.dict(self.app.CONFIG, {'BULK_MAX_ROWS': 2}):
+            response = self.post('delete', room_id=self.room)
+            self.assertEqual(response.get_json(), {'success': True, 'deleted': 2, 'has_more': True})
+            response = self.post('delete', room_id=self.room)
+            self.assertEqual(response.get_json(), {'success': True, 'deleted': 2, 'has_more': False})
+            response = self.post('delete', room_id=self.room)
+            self.assertEqual(response.get_json(), {'success': True, 'deleted': 0, 'has_more': False})
+
+        self.assertEqual(self.count(), 0)
+        self.assertEqual(self.count(other_room), 1)
+        for path in (shared_path, own_path, legacy_path):
+            self.assertTrue(wait_until(lambda: not os.path.exists(path)), path)
+        self.assertTrue(os.path.exists(other_path))
+
+    def test_delete_selection(self):
+        """测试按id和时间范围筛选, 录制中的记录不删除"""
+        first, _ = self.add_recording(os.urandom(10), minutes=1)
+        second, _ = self.add_recording(os.urandom(10), minutes=2)
+        recording, _ = self.add_legacy(status='recording')
+
+        response = self.post('delete', ids=[first, recording, 'missing'])
+        self.assertEqual(response.get_json()['deleted'], 1)
+        response = self.post('delete', room_id=self.room, start=(self.start + timedelta(minutes=3)).isoformat())
+        self.assertEqual(response.get_json()['deleted'], 0)
+        response = self.post('delete', room_id=self.room, end=(self.start + timedelta(minutes=3)).isoformat())
+        self.assertEqual(response.get_json()['deleted'], 1)
+        self.assertIsNotNone(self.app.db.query_one('SELECT 1 FROM recordings WHERE id = ?', (recording,)))
+        self.assertIsNone(self.app.db.query_one('SELECT 1 FROM recordings WHERE id = ?', (second,)))
+
+    def test_invalid_selection(self):
+        """测试没有筛选条件或格式错误时返回400"""
+        for data in ({}, {'ids': 'abc'}, {'ids': [1, 2]}, {'room_id': self.room, 'start': 'yesterday'}):
+            self.assertEqual(self.post('delete', **data).status_code, 400, data)
+            self.assertEqual(self.post('status', status='archived', **data).status_code, 400, data)
+        with mock.patch.dict(self.app.CONFIG, {'BULK_MAX_ROWS': 2}):
+            self.assertEqual(self.post('delete', ids=['a', 'b', 'c']).status_code, 400)
+
+    def test_update_status(self):
+        """测试批量修改状态分批进行, 录制中的记录不修改"""
+        ids = [self.add_recording(os.urandom(10), minutes=i)[0] for i in range(3)]
+        recording, _ = self.add_legacy(status='recording')
+
+        with mock.patch.dict(self.app.CONFIG, {'BULK_MAX_ROWS': 2}):
+            response = self.post('status', room_id=self.room, status='archived')
+            self.assertEqual(response.get_json(), {'success': True, 'updated': 2, 'has_more': True})
+            response = self.post('status', room_id=self.room, status='archived')
+            self.assertEqual(response.get_json(), {'success': True, 'updated': 1, 'has_more': False})
+        statuses = dict(self.app.db.query_all('SELECT id, status FROM recordings WHERE room_id = ?', (self.room,)))
+        self.assertEqual(statuses, {**{i: 'archived' for i in ids}, recording: 'recording'})
+
+        for status in (None, '', 'recording', 5):
+            self.assertEqual(self.post('status', room_id=self.room, status=status).status_code, 400, status)
+
+
+if __name__ == '__main__':
+    unittest.main()
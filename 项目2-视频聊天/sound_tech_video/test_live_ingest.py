@@ -0,0 +1,131 @@
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db import Database
+from live_ingest import IngestError, LiveIngest
+from reconciler import FileMetadataReconciler
+
+
+class TruncatedStream(io.BytesIO):
+    """客户端中途断开: 只能读到部分数据"""
+
+    def __init__(self, data, available):
+        super().__init__(data[:available])
+
+
+class TestLiveIngest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db = Database(os.path.join(self.tmp, 'test.db'))
+        self.db.executescript('''
+            CREATE TABLE recordings (
+                id TEXT PRIMARY KEY,
+                room_id TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                start_time TIMESTAMP,
+                status TEXT DEFAULT 'stopped',
+                file_size INTEGER,
+                file_exists INTEGER,
+                chunk_seq INTEGER,
+                index_status TEXT
+            )
+        ''')
+        self.path = os.path.join(self.tmp, 'r1.webm')
+        self.db.execute(
+            '''INSERT INTO recordings (id, room_id, file_path, status, file_size, file_exists, chunk_seq)
+               VALUES ('r1', 'room', ?, 'recording', 0, 0, 0)''',
+            (self.path,)
+        )
+        self.ingest = LiveIngest(self.db, max_chunk_size=1024)
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def append(self, seq, data, room_id='room'):
+        return self.ingest.append(room_id, 'r1', seq, io.BytesIO(data), len(data))
+
+    def content(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def test_append_in_order(self):
+        """测试分片按序号追加到文件末尾"""
+        self.assertEqual(self.append(1, b'a' * 10), (10, 1, False))
+        self.assertEqual(self.append(2, b'b' * 5), (15, 2, False))
+        self.assertEqual(self.content(), b'a' * 10 + b'b' * 5)
+        row = self.db.query_one('SELECT file_size, file_exists, chunk_seq FROM recordings WHERE id = ?', ('r1',))
+        self.assertEqual(row, (15, 1, 2))
+
+    def test_duplicate(self):
+        """测试重发已写入的分片直接确认, 不重复写入"""
+        self.append(1, b'a' * 10)
+        self.append(2, b'b' * 10)
+        self.assertEqual(self.append(1, b'x' * 10), (20, 2, True))
+        self.assertEqual(self.content(), b'a' * 10 + b'b' * 10)
+
+    def test_gap(self):
+        """测试跳过序号时返回409和期望的序号"""
+        self.append(1, b'a' * 10)
+        with self.assertRaises(IngestError) as ctx:
+            self.append(3, b'c' * 10)
+        self.assertEqual((ctx.exception.status_code, ctx.exception.expected_seq), (409, 2))
+        self.assertEqual(self.content(), b'a' * 10)
+
+    def test_rejected(self):
+        """测试分片大小、房间不匹配和已停止的录制"""
+        with self.assertRaises(IngestError) as ctx:
+            self.append(1, b'a' * 2048)
+        self.assertEqual(ctx.exception.status_code, 413)
+        with self.assertRaises(IngestError) as ctx:
+            self.append(1, b'a', room_id='other')
+        self.assertEqual(ctx.exception.status_code, 404)
+
+        self.append(1, b'a' * 10)
+        self.db.execute("UPDATE recordings SET status = 'stopped' WHERE id = 'r1'")
+        with self.assertRaises(IngestError) as ctx:
+            self.append(2, b'b')
+        self.assertEqual(ctx.exception.status_code, 409)
+        # 停止后重发已写入的分片仍然确认
+        self.assertEqual(self.append(1, b'a' * 10), (10, 1, True))
+
+    def test_failed_chunk_rewritten(self):
+        """测试中途失败的分片在同一位置重写, 残留数据被截掉"""
+        self.append(1, b'a' * 10)
+        with self.assertRaises(IngestError):
+            self.ingest.append('room', 'r1', 2, TruncatedStream(b'b' * 100, 60), 100)
+        self.assertEqual(len(self.content()), 70)
+        self.assertEqual(self.append(2, b'c' * 20), (30, 2, False))
+        self.assertEqual(self.content(), b'a' * 10 + b'c' * 20)
+
+    def test_reconcile_between_appends(self):
+        """测试两次追加之间同步文件信息不会改写录制中的写入位置"""
+        reconciler = FileMetadataReconciler(self.db, interval=0)
+        self.append(1, b'a' * 10)
+        with self.assertRaises(IngestError):
+            self.ingest.append('room', 'r1', 2, TruncatedStream(b'b' * 100, 60), 100)
+        reconciler.run_once()
+        self.assertEqual(self.db.query_one('SELECT file_size FROM recordings WHERE id = ?', ('r1',))[0], 10)
+
+        self.assertEqual(self.append(2, b'c' * 20), (30, 2, False))
+        reconciler.run_once()
+        self.assertEqual(self.append(3, b'd' * 5), (35, 3, False))
+        self.assertEqual(self.content(), b'a' * 10 + b'c' * 20 + b'd' * 5)
+
+        # 停止后由reconciler同步
+        self.db.execute("UPDATE recordings SET status = 'stopped' WHERE id = 'r1'")
+        os.remove(self.path)
+        self.assertEqual(reconciler.run_once(), 1)
+        row = self.db.query_one('SELECT file_exists, file_size FROM recordings WHERE id = ?', ('r1',))
+        self.assertEqual(row, (0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
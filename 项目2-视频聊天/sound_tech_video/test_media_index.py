@@ -0,0 +1,265 @@
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import media_index
+from db import Database
+from media_index import MediaIndexer, MediaParseError, probe
+
+CLUSTER_ID = b'\x1f\x43\xb6\x75'
+
+
+# ---- 合成WebM: 每个Cluster 1秒, 第一个块是视频关键帧 ----
+
+def ebml_id(element_id):
+    return element_id.to_bytes((element_id.bit_length() + 7) // 8, 'big')
+
+def ebml_size(size, unknown=False):
+    if unknown:
+        return b'\x01\xff\xff\xff\xff\xff\xff\xff'
+    length = 1
+    while size >= (1 << (7 * length)) - 1:
+        length += 1
+    return ((1 << (7 * length)) | size).to_bytes(length, 'big')
+
+def element(element_id, data, unknown=False):
+    return ebml_id(element_id) + ebml_size(len(data), unknown) + data
+
+def uint_element(element_id, value, width=None):
+    return element(element_id, value.to_bytes(width or max(1, (value.bit_length() + 7) // 8), 'big'))
+
+def build_webm(clusters=5, cues=True):
+    header = element(0x1A45DFA3, element(0x4282, b'webm'))
+    info = element(0x1549A966, uint_element(0x2AD7B1, 1000000) + element(0x4489, struct.pack('>d', clusters * 1000.0)))
+    video = element(0xAE, uint_element(0xD7, 1) + uint_element(0x83, 1) + element(0x86, b'V_VP8')
+                    + element(0xE0, uint_element(0xB0, 640) + uint_element(0xBA, 480)))
+    audio = element(0xAE, uint_element(0xD7, 2) + uint_element(0x83, 2) + element(0x86, b'A_OPUS'))
+    tracks = element(0x1654AE6B, video + audio)
+
+    def seek_head(cues_position):
+        return element(0x114D9B74, element(0x4DBB, element(0x53AB, ebml_id(0x1C53BB6B))
+                                                    + uint_element(0x53AC, cues_position, 8)))
+
+    # SeekHead长度固定(位置用8字节), 先用0占位算出各Cluster在Segment内的位置
+    prefix = (seek_head(0) if cues else b'') + info + tracks
+    body, positions = b'', []
+    for i in range(clusters):
+        positions.append(len(prefix) + len(body))
+        blocks = b''
+        for j in range(10):
+            track = 2 if j % 2 else 1
+            flags = 0x80 if j == 0 else 0
+            blocks += element(0xA3, bytes([0x80 | track]) + struct.pack('>hB', j * 100, flags) + b'x' * 300)
+        body += element(0x1F43B675, uint_element(0xE7, i * 1000, 4) + blocks, unknown=not cues)
+    if not cues:
+        return header + element(0x18538067, prefix + body, unknown=True)
+    cue_points = b''.join(
+        element(0xBB, uint_element(0xB3, i * 1000) + element(0xB7, uint_element(0xF7, 1) + uint_element(0xF1, position, 8)))
+        for i, position in enumerate(positions)
+    )
+    segment = seek_head(len(prefix) + len(body)) + info + tracks + body + element(0x1C53BB6B, cue_points)
+    return header + element(0x18538067, segment)
+
+
+# ---- 合成MP4: 30fps, 每30帧一个关键帧, 每个chunk 10帧 ----
+
+def box(box_type, data):
+    return struct.pack('>I4s', 8 + len(data), box_type.encode()) + data
+
+def full_box(box_type, data):
+    return box(box_type, b'\0\0\0\0' + data)
+
+def build_mp4(samples=300, gop=30, per_chunk=10):
+    """返回(文件内容, 各关键帧所在chunk的偏移)"""
+    sizes = [1000 + i % 7 for i in range(samples)]
+    ftyp = box('ftyp', b'isom\0\0\0\1isomavc1')
+    offsets, position = [], len(ftyp) + 8
+    for chunk in range(samples // per_chunk):
+        offsets.append(position)
+        position += sum(sizes[chunk * per_chunk:(chunk + 1) * per_chunk])
+    mdat = box('mdat', b''.join(b'v' * size for size in sizes))
+
+    avc1 = box('avc1', b'\0' * 6 + b'\0\1' + b'\0' * 16 + struct.pack('>HH', 1280, 720) + b'\0' * 50)
+    keyframes = range(1, samples + 1, gop)
+    stbl = box('stbl',
+               full_box('stsd', struct.pack('>I', 1) + avc1)
+               + full_box('stts', struct.pack('>III', 1, samples, 1000))
+               + full_box('stss', struct.pack('>I', len(keyframes)) + b''.join(struct.pack('>I', k) for k in keyframes))
+               + full_box('stsc', struct.pack('>IIII', 1, 1, per_chunk, 1))
+               + full_box('stsz', struct.pack('>II', 0, samples) + b''.join(struct.pack('>I', s) for s in sizes))
+               + full_box('stco', struct.pack('>I', len(offsets)) + b''.join(struct.pack('>I', o) for o in offsets)))
+    video = box('trak', full_box('tkhd', b'\0' * 8 + struct.pack('>I', 1) + b'\0' * 68)
+                + box('mdia', full_box('mdhd', b'\0' * 8 + struct.pack('>II', 30000, samples * 1000) + b'\0' * 4)
+                      + full_box('hdlr', b'\0' * 4 + b'vide' + b'\0' * 13) + box('minf', stbl)))
+    audio_stbl = box('stbl', full_box('stsd', struct.pack('>I', 1) + box('mp4a', b'\0' * 28)))
+    audio = box('trak', full_box('tkhd', b'\0' * 8 + struct.pack('>I', 2) + b'\0' * 68)
+                + box('mdia', full_box('mdhd', b'\0' * 8 + struct.pack('>II', 48000, 480000) + b'\0' * 4)
+                      + full_box('hdlr', b'\0' * 4 + b'soun' + b'\0' * 13) + box('minf', audio_stbl)))
+    moov = box('moov', full_box('mvhd', b'\0' * 8 + struct.pack('>II', 1000, samples * 1000 // 30) + b'\0' * 80)
+               + video + audio)
+    return ftyp + mdat + moov, [offsets[(k - 1) // per_chunk] for k in keyframes]
+
+
+class MediaTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def write(self, name, data):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+
+class TestProbe(MediaTestCase):
+
+    def test_webm_with_cues(self):
+        """测试按Cues索引解析WebM"""
+        path = self.write('a.webm', build_webm(clusters=5))
+        result = probe(path)
+        self.assertEqual(result['container'], 'webm')
+        self.assertEqual(result['duration_ms'], 5000)
+        self.assertEqual((result['video_codec'], result['audio_codec']), ('vp8', 'opus'))
+        self.assertEqual((result['width'], result['height']), (640, 480))
+        self.assertEqual([t for t, _ in result['cues']], [0, 1000, 2000, 3000, 4000])
+        with open(path, 'rb') as f:
+            data = f.read()
+        for _, offset in result['cues']:
+            self.assertEqual(data[offset:offset + 4], CLUSTER_ID)
+
+    def test_webm_without_cues(self):
+        """测试没有Cues、Cluster大小未知(录制中断)时扫描Cluster生成索引"""
+        path = self.write('b.webm', build_webm(clusters=5, cues=False))
+        result = probe(path)
+        self.assertEqual([t for t, _ in result['cues']], [0, 1000, 2000, 3000, 4000])
+        with open(path, 'rb') as f:
+            data = f.read()
+        for _, offset in result['cues']:
+            self.assertEqual(data[offset:offset + 4], CLUSTER_ID)
+
+    def test_mp4_keyframes(self):
+        """测试MP4关键帧的时间和字节偏移"""
+        data, keyframe_offsets = build_mp4()
+        result = probe(self.write('c.mp4', data))
+        self.assertEqual(result['container'], 'mp4')
+        self.assertEqual(result['duration_ms'], 10000)
+        self.assertEqual((result['video_codec'], result['audio_codec']), ('h264', 'aac'))
+        self.assertEqual((result['width'], result['height']), (1280, 720))
+        self.assertEqual(result['cues'], [(i * 1000, offset) for i, offset in enumerate(keyframe_offsets)])
+
+    def test_unsupported(self):
+        """测试无法解析的文件"""
+        with self.assertRaises(MediaParseError):
+            probe(self.write('d.avi', b'RIFF' + b'\0' * 100))
+        with self.assertRaises(MediaParseError):
+            probe(self.write('e.mp4', build_mp4()[0][:200]))
+
+
+class TestMediaIndexer(MediaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.db = Database(os.path.join(self.tmp, 'test.db'))
+        self.db.executescript('''
+            CREATE TABLE recordings (
+                id TEXT PRIMARY KEY,
+                room_id TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                start_time TIMESTAMP,
+                status TEXT DEFAULT 'stopped'
+            )
+        ''')
+        self.indexer = MediaIndexer(self.db, workers=0)
+        self.indexer.init_schema()
+
+    def tearDown(self):
+        self.db.close()
+        super().tearDown()
+
+    def add_recording(self, recording_id, path):
+        self.db.execute(
+            "INSERT INTO recordings (id, room_id, file_path, status) VALUES (?, 'room', ?, 'completed')",
+            (recording_id, path)
+        )
+
+    def test_index_recording(self):
+        """测试解析结果和关键帧写入数据库"""
+        self.add_recording('r1', self.write('a.webm', build_webm(clusters=3)))
+        self.assertEqual(self.indexer.index_recording('r1'), 'ok')
+        row = self.db.query_one('SELECT container, duration_ms, index_status FROM recordings WHERE id = ?', ('r1',))
+        self.assertEqual(row, ('webm', 3000, 'ok'))
+        cues = self.db.query_all('SELECT time_ms FROM recording_cues WHERE recording_id = ? ORDER BY time_ms', ('r1',))
+        self.assertEqual([c[0] for c in cues], [0, 1000, 2000])
+
+    def test_path_changed_during_probe(self):
+        """测试解析期间文件路径被改写时不写入旧文件的结果"""
+        old_path = self.write('a.webm', build_webm(clusters=3))
+        new_path = self.write('b.webm', build_webm(clusters=3))
+        self.add_recording('r1', old_path)
+
+        def probe_and_move(file_path):
+            self.db.execute('UPDATE recordings SET file_path = ? WHERE id = ?', (new_path, 'r1'))
+            return probe(file_path)
+
+        with mock.patch.object(media_index, 'probe', probe_and_move):
+            self.assertIsNone(self.indexer.index_recording('r1'))
+        row = self.db.query_one('SELECT index_status FROM recordings WHERE id = ?', ('r1',))
+        self.assertIsNone(row[0])
+        self.assertEqual(self.db.query_one('SELECT COUNT(*) FROM recording_cues')[0], 0)
+        self.assertEqual(self.indexer.index_recording('r1'), 'ok')
+
+
+class TestSeekEndpoint(MediaTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # app在导入时按相对路径打开数据库, 先切到临时目录
+        cls.cwd = os.getcwd()
+        cls.app_dir = tempfile.mkdtemp()
+        os.chdir(cls.app_dir)
+        import app
+        cls.app = app
+        app.init_db()
+        cls.client = app.app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        os.chdir(cls.cwd)
+        cls.app.db.close()
+        shutil.rmtree(cls.app_dir, ignore_errors=True)
+
+    def test_seek(self):
+        """测试按时间查询关键帧偏移, 以及非法的t参数"""
+        data, keyframe_offsets = build_mp4()
+        path = self.write('c.mp4', data)
+        self.app.db.execute(
+            "INSERT INTO recordings (id, room_id, file_path, status) VALUES ('seek', 'room', ?, 'completed')",
+            (path,)
+        )
+        self.assertEqual(self.app.media_indexer.index_recording('seek'), 'ok')
+
+        response = self.client.get('/api/v1/recordings/seek/seek?t=2.5')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['byte_offset'], keyframe_offsets[2])
+
+        response = self.client.get('/api/v1/recordings/seek/seek?t=1e300')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['byte_offset'], keyframe_offsets[-1])
+
+        for t in ('inf', '-inf', 'nan', '-1', 'abc'):
+            response = self.client.get(f'/api/v1/recordings/seek/seek?t={t}')
+            self.assertEqual(response.status_code, 400, t)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,201 @@
+import hashlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db import Database
+from storage import BlobStore, RetentionSweeper
+
+
+class StorageTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db = Database(os.path.join(self.tmp, 'test.db'))
+        self.db.executescript('''
+            CREATE TABLE recordings (
+                id TEXT PRIMARY KEY,
+                room_id TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                start_time TIMESTAMP,
+                status TEXT DEFAULT 'stopped',
+                file_size INTEGER,
+                file_exists INTEGER
+            );
+            CREATE TABLE recording_cues (recording_id TEXT NOT NULL, time_ms INTEGER, byte_offset INTEGER);
+        ''')
+        self.store = BlobStore(self.db, os.path.join(self.tmp, 'objects'))
+        self.store.init_schema()
+        self.sweeper = RetentionSweeper(self.db, self.store, interval=0, batch=2)
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def add(self, recording_id, data, room_id='room', days_ago=0):
+        """按save_recording的顺序入库: 事务中更新引用和写记录, 提交后放置文件"""
+        staged = self.store.stage(io.BytesIO(data), 'webm')
+        with self.db.transaction() as conn:
+            file_path, deduplicated = self.store.commit(conn, staged)
+            conn.execute(
+                '''INSERT INTO recordings (id, room_id, file_path, start_time, file_size, file_exists, blob_sha256)
+                   VALUES (?, ?, ?, ?, ?, 1, ?)''',
+                (recording_id, room_id, file_path, datetime.now() - timedelta(days=days_ago), staged.size, staged.sha256)
+            )
+        self.store.place(staged, file_path)
+        return file_path, deduplicated
+
+    def add_legacy(self, recording_id, data, status='stopped'):
+        file_path = os.path.join(self.tmp, f'{recording_id}.webm')
+        with open(file_path, 'wb') as f:
+            f.write(data)
+        self.db.execute(
+            '''INSERT INTO recordings (id, room_id, file_path, start_time, status, file_size, file_exists)
+               VALUES (?, 'room', ?, ?, ?, ?, 1)''',
+            (recording_id, file_path, datetime.now(), status, len(data))
+        )
+        return file_path
+
+    def drop(self, *recording_ids):
+        with self.db.transaction() as conn:
+            return self.store.drop_recordings(conn, recording_ids)
+
+    def refcount(self, data):
+        row = self.db.query_one('SELECT refcount FROM blobs WHERE sha256 = ?', (hashlib.sha256(data).hexdigest(),))
+        return row[0] if row else None
+
+    def temp_files(self):
+        temp_dir = os.path.join(self.store.root, 'tmp')
+        return os.listdir(temp_dir) if os.path.isdir(temp_dir) else []
+
+
+class TestBlobStore(StorageTestCase):
+
+    def test_dedup_and_refcount(self):
+        """测试相同内容只保存一份, 引用数随录制增删变化"""
+        data = os.urandom(1000)
+        path, deduplicated = self.add('r1', data)
+        self.assertFalse(deduplicated)
+        self.assertEqual(path, self.store.path_for(hashlib.sha256(data).hexdigest(), 'webm'))
+        self.assertEqual(self.add('r2', data), (path, True))
+        self.assertEqual(self.refcount(data), 2)
+        self.assertEqual(self.temp_files(), [])
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+        self.assertEqual(self.drop('r1', 'missing'), 1)
+        self.assertEqual(self.refcount(data), 1)
+        self.assertEqual(self.sweeper.reclaim(), 0)
+        self.assertTrue(os.path.exists(path))
+
+        self.assertEqual(self.drop('r2'), 1)
+        self.assertEqual(self.sweeper.reclaim(), 1000)
+        self.assertFalse(os.path.exists(path))
+        self.assertIsNone(self.refcount(data))
+
+    def test_failed_commit(self):
+        """测试写记录失败时事务回滚, 不留下引用和文件"""
+        data = os.urandom(100)
+        self.add('r1', os.urandom(10))
+        staged = self.store.stage(io.BytesIO(data), 'webm')
+        with self.assertRaises(Exception):
+            with self.db.transaction() as conn:
+                self.store.commit(conn, staged)
+                conn.execute("INSERT INTO recordings (id, room_id, file_path) VALUES ('r1', 'room', 'x')")
+        self.store.discard(staged)
+        self.assertIsNone(self.refcount(data))
+        self.assertEqual(self.temp_files(), [])
+
+    def test_missing_file_restored(self):
+        """测试内容地址上的文件被手工删除后, 相同内容的上传把它补回"""
+        data = os.urandom(100)
+        path, _ = self.add('r1', data)
+        os.remove(path)
+        self.assertEqual(self.add('r2', data), (path, False))
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(self.refcount(data), 2)
+
+    def test_rereferenced_before_reclaim(self):
+        """测试引用数为0的文件在回收前被重新引用时不删除"""
+        data = os.urandom(100)
+        path, _ = self.add('r1', data)
+        self.drop('r1')
+        self.add('r2', data)
+        self.sweeper.reclaim()
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(self.refcount(data), 1)
+
+    def test_legacy_file_deleted(self):
+        """测试删除独立文件的录制时登记到file_deletions并由回收删除"""
+        path = self.add_legacy('r1', b'legacy')
+        self.drop('r1')
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(self.sweeper.reclaim(), 6)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(self.db.query_one('SELECT COUNT(*) FROM file_deletions')[0], 0)
+
+
+class TestRetentionSweeper(StorageTestCase):
+
+    def test_adopt_legacy(self):
+        """测试独立文件移入内容寻址存储, 相同内容合并, 录制中的文件不处理"""
+        data = os.urandom(100)
+        first = self.add_legacy('r1', data)
+        second = self.add_legacy('r2', data)
+        live = self.add_legacy('r3', data, status='recording')
+        self.assertEqual(self.sweeper.adopt_legacy(), 2)
+
+        path = self.store.path_for(hashlib.sha256(data).hexdigest(), 'webm')
+        rows = self.db.query_all('SELECT id, file_path, blob_sha256 FROM recordings ORDER BY id')
+        self.assertEqual([row[1] for row in rows], [path, path, live])
+        self.assertIsNone(rows[2][2])
+        self.assertEqual(self.refcount(data), 2)
+        self.assertFalse(os.path.exists(first) or os.path.exists(second))
+        self.assertTrue(os.path.exists(live))
+
+    def test_adopt_place_failure(self):
+        """测试移动文件失败时记录改回原文件, 引用退回"""
+        data = os.urandom(100)
+        path = self.add_legacy('r1', data)
+        with mock.patch.object(self.store, 'place', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                self.sweeper.adopt_legacy()
+        row = self.db.query_one('SELECT file_path, blob_sha256 FROM recordings WHERE id = ?', ('r1',))
+        self.assertEqual(row, (path, None))
+        self.assertEqual(self.refcount(data), 0)
+        self.sweeper.reclaim()
+        self.assertTrue(os.path.exists(path))
+
+    def test_age_and_quotas(self):
+        """测试按保留天数、房间配额和总大小淘汰最早的录制"""
+        self.add('old', os.urandom(100), days_ago=10)
+        self.add('a1', os.urandom(100), room_id='a', days_ago=3)
+        self.add('a2', os.urandom(100), room_id='a', days_ago=2)
+        self.add('a3', os.urandom(100), room_id='a', days_ago=1)
+        self.add('b1', os.urandom(100), room_id='b', days_ago=1.5)
+        self.add_legacy('live', os.urandom(100), status='recording')
+
+        self.sweeper.max_age_days = 7
+        self.assertEqual(self.sweeper.enforce_age(), 1)
+        self.sweeper.room_quota = 250
+        self.assertEqual(self.sweeper.enforce_room_quota(), 1)
+        # 录制中的文件计入总大小但不淘汰
+        self.sweeper.max_bytes = 350
+        self.assertEqual(self.sweeper.enforce_global_cap(), 1)
+
+        remaining = [row[0] for row in self.db.query_all('SELECT id FROM recordings ORDER BY id')]
+        self.assertEqual(remaining, ['a3', 'b1', 'live'])
+        self.sweeper.reclaim()
+        self.assertEqual(self.db.query_one('SELECT COUNT(*) FROM blobs')[0], 2)
+        self.assertEqual(self.sweeper.stats()['evicted'], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,234 @@
+import hashlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db import Database
+from uploads import ChunkedUploads, UploadCompleted, UploadError, merge_ranges, missing_ranges
+
+
+class CallbackStream(io.BytesIO):
+    """读到第一块数据后执行callback, 模拟分片写入过程中到达的其他请求"""
+
+    def __init__(self, data, callback):
+        super().__init__(data)
+        self.callback = callback
+
+    def read(self, size=-1):
+        data = super().read(size)
+        if self.callback is not None:
+            callback, self.callback = self.callback, None
+            callback()
+        return data
+
+
+class TestRanges(unittest.TestCase):
+
+    def test_merge(self):
+        """测试重叠、相邻和乱序的分片区间合并"""
+        self.assertEqual(merge_ranges([(10, 5), (0, 5), (5, 5), (30, 10), (32, 3)]), [[0, 15], [30, 40]])
+        self.assertEqual(merge_ranges([]), [])
+
+    def test_missing(self):
+        """测试缺失区间"""
+        self.assertEqual(missing_ranges([[0, 15], [30, 40]], 50), [[15, 30], [40, 50]])
+        self.assertEqual(missing_ranges([], 10), [[0, 10]])
+        self.assertEqual(missing_ranges([[0, 10]], 10), [])
+
+
+class TestChunkedUploads(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db = Database(os.path.join(self.tmp, 'test.db'))
+        self.uploads = ChunkedUploads(self.db, os.path.join(self.tmp, 'uploads'), complete_wait=0.2)
+        self.uploads.init_schema()
+        self.data = os.urandom(1000)
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def initiate(self, sha256=None):
+        return self.uploads.initiate('webm', len(self.data), 'room', '1', sha256)['upload_id']
+
+    def write(self, upload_id, offset, length, **kwargs):
+        chunk = self.data[offset:offset + length]
+        return self.uploads.write_chunk(upload_id, offset, length, io.BytesIO(chunk), **kwargs)
+
+    def assert_upload_error(self, status_code, fn, *args, **kwargs):
+        with self.assertRaises(UploadError) as ctx:
+            fn(*args, **kwargs)
+        self.assertEqual(ctx.exception.status_code, status_code)
+
+    def test_out_of_order_chunks(self):
+        """测试乱序、重复和重叠的分片, 以及完成后的文件内容"""
+        upload_id = self.initiate(hashlib.sha256(self.data).hexdigest())
+        self.write(upload_id, 500, 500)
+        status = self.write(upload_id, 0, 300)
+        self.assertEqual(status['received'], [[0, 300], [500, 1000]])
+        self.assertEqual(status['missing'], [[300, 500]])
+        self.write(upload_id, 0, 300)
+        status = self.write(upload_id, 200, 400)
+        self.assertEqual((status['bytes_received'], status['missing']), (1000, []))
+
+        upload = self.uploads.complete(upload_id)
+        self.assertEqual(upload.sha256, hashlib.sha256(self.data).hexdigest())
+        with open(upload.file_path, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_out_of_range(self):
+        """测试超出文件范围的分片返回416"""
+        upload_id = self.initiate()
+        self.assert_upload_error(416, self.write, upload_id, 900, 200)
+        self.assert_upload_error(416, self.write, upload_id, -1, 10)
+        self.assert_upload_error(416, self.write, upload_id, 0, 0)
+        self.assert_upload_error(404, self.write, 'missing', 0, 10)
+
+    def test_chunk_checksum_mismatch(self):
+        """测试分片校验和不一致时返回422且不登记该分片"""
+        upload_id = self.initiate()
+        self.assert_upload_error(422, self.write, upload_id, 0, 100, chunk_sha256='0' * 64)
+        self.assertEqual(self.uploads.status(upload_id)['bytes_received'], 0)
+        good = hashlib.sha256(self.data[:100]).hexdigest().upper()
+        self.assertEqual(self.write(upload_id, 0, 100, chunk_sha256=good)['bytes_received'], 100)
+
+    def test_incomplete_chunk(self):
+        """测试请求体比声明的长度短时不登记该分片"""
+        upload_id = self.initiate()
+        self.assert_upload_error(400, self.uploads.write_chunk, upload_id, 0, 100, io.BytesIO(self.data[:50]))
+        self.assertEqual(self.uploads.status(upload_id)['bytes_received'], 0)
+        self.assertEqual(self.db.query_one('SELECT COUNT(*) FROM upload_writes')[0], 0)
+
+    def test_complete_with_missing_ranges(self):
+        """测试分片没有到齐时不能完成"""
+        upload_id = self.initiate()
+        self.write(upload_id, 0, 600)
+        self.assert_upload_error(409, self.uploads.complete, upload_id)
+        self.write(upload_id, 600, 400)
+        self.uploads.complete(upload_id)
+
+    def test_file_checksum_mismatch(self):
+        """测试文件校验和不一致时返回422, 上传退回pending可以重试"""
+        upload_id = self.initiate()
+        self.write(upload_id, 0, 1000)
+        self.assert_upload_error(422, self.uploads.complete, upload_id, 'f' * 64)
+        self.assertEqual(self.db.query_one('SELECT status FROM uploads WHERE id = ?', (upload_id,))[0], 'pending')
+        self.uploads.complete(upload_id, hashlib.sha256(self.data).hexdigest())
+
+    def test_double_complete(self):
+        """测试重复完成返回同一个录制, 完成后不再接收分片"""
+        upload_id = self.initiate()
+        self.write(upload_id, 0, 1000)
+        upload = self.uploads.complete(upload_id)
+        with self.db.transaction() as conn:
+            self.uploads.finish(conn, upload_id)
+        with self.assertRaises(UploadCompleted) as ctx:
+            self.uploads.complete(upload_id)
+        self.assertEqual(ctx.exception.recording_id, upload.recording_id)
+        self.assert_upload_error(409, self.write, upload_id, 0, 100)
+
+    def test_complete_while_writing(self):
+        """测试有分片正在写入(客户端重发已收到的分片)时拒绝完成"""
+        upload_id = self.initiate()
+        self.write(upload_id, 0, 1000)
+        errors = []
+
+        def complete():
+            try:
+                self.uploads.complete(upload_id)
+            except UploadError as e:
+                errors.append(e.status_code)
+
+        self.uploads.write_chunk(upload_id, 0, 100, CallbackStream(self.data[:100], complete))
+        self.assertEqual(errors, [409])
+        self.uploads.complete(upload_id)
+
+    def test_write_after_claim(self):
+        """测试写入登记过期后被认领的上传, 分片写完也不再登记"""
+        self.uploads.write_timeout = 0
+        upload_id = self.initiate()
+        self.write(upload_id, 100, 900)
+        self.write(upload_id, 0, 100)
+        claimed = []
+        stream = CallbackStream(self.data[:100], lambda: claimed.append(self.uploads.complete(upload_id)))
+        self.assert_upload_error(409, self.uploads.write_chunk, upload_id, 0, 100, stream)
+        self.assertEqual(len(claimed), 1)
+        self.assertEqual(self.db.query_one('SELECT COUNT(*) FROM upload_writes')[0], 0)
+
+    def test_abort(self):
+        """测试放弃上传删除记录和文件, 正在完成时拒绝"""
+        upload_id = self.initiate()
+        self.write(upload_id, 0, 1000)
+        upload = self.uploads.complete(upload_id)
+        self.assert_upload_error(409, self.uploads.abort, upload_id)
+        self.uploads.release(upload_id)
+        self.uploads.abort(upload_id)
+        self.assertFalse(os.path.exists(upload.file_path))
+        self.assert_upload_error(404, self.uploads.status, upload_id)
+
+
+class TestUploadEndpoints(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # app在导入时按相对路径打开数据库, 先切到临时目录
+        cls.cwd = os.getcwd()
+        cls.app_dir = tempfile.mkdtemp()
+        os.chdir(cls.app_dir)
+        import app
+        cls.app = app
+        app.init_db()
+        cls.client = app.app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        os.chdir(cls.cwd)
+        cls.app.db.close()
+        shutil.rmtree(cls.app_dir, ignore_errors=True)
+
+    def initiate(self, data):
+        response = self.client.post('/api/v1/recordings/uploads', json={
+            'filename': 'a.webm', 'size': len(data), 'room_id': 'room'
+        })
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()['upload_id']
+
+    def put(self, upload_id, data, start, end, total):
+        return self.client.put(
+            f'/api/v1/recordings/uploads/{upload_id}', data=data[start:end + 1],
+            headers={'Content-Range': f'bytes {start}-{end}/{total}'}
+        )
+
+    def test_content_range(self):
+        """测试Content-Range格式错误时返回400"""
+        data = os.urandom(100)
+        upload_id = self.initiate(data)
+        self.assertEqual(self.put(upload_id, data, 0, 49, 'abc').status_code, 400)
+        self.assertEqual(self.put(upload_id, data, 0, 49, 200).status_code, 400)
+        self.assertEqual(self.put(upload_id, data + data, 90, 109, 100).status_code, 416)
+        self.assertEqual(self.put(upload_id, data, 0, 49, '*').status_code, 200)
+        self.assertEqual(self.put(upload_id, data, 50, 99, 100).get_json()['missing'], [])
+
+    def test_double_complete(self):
+        """测试重复完成返回同一个录制"""
+        data = os.urandom(100)
+        upload_id = self.initiate(data)
+        self.put(upload_id, data, 0, 99, 100)
+        first = self.client.post(f'/api/v1/recordings/uploads/{upload_id}/complete', json={})
+        second = self.client.post(f'/api/v1/recordings/uploads/{upload_id}/complete', json={})
+        self.assertEqual((first.status_code, second.status_code), (200, 200))
+        self.assertEqual(first.get_json()['recording_id'], second.get_json()['recording_id'])
+        self.assertEqual(second.get_json()['sha256'], hashlib.sha256(data).hexdigest())
+        with open(first.get_json()['file_path'], 'rb') as f:
+            self.assertEqual(f.read(), data)
+        self.assertEqual(self.put(upload_id, data, 0, 99, 100).status_code, 409)
+
+
+if __name__ == '__main__':
+    unittest.main()
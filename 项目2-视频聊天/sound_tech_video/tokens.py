@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict
+
+from agora_token_builder import RtcTokenBuilder
+
+ROLE_PUBLISHER = 1  # 主播
+ROLE_SUBSCRIBER = 2  # 观众
+
+
+class TokenCache:
+    """
+    Agora token缓存: 按(channel, uid, role)复用还在有效期内的token, 剩余有效期不足refresh_margin时重新签发
+    """
+
+    def __init__(self, app_id, app_certificate, ttl=3600, refresh_margin=300, max_entries=10000):
+        self.app_id = app_id
+        self.app_certificate = app_certificate
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.max_entries = max_entries
+        self._tokens = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.issued = 0
+
+    def get(self, channel_name, uid, role=ROLE_PUBLISHER):
+        """
+        返回(token, 过期时间戳)
+        """
+        key = (str(channel_name), int(uid or 0), int(role))
+        now = int(time.time())
+        with self._lock:
+            entry = self._tokens.get(key)
+            if entry is not None and entry[1] - now > self.refresh_margin:
+                self._tokens.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        # 签发(HMAC)不持锁, 不阻塞其他用户的命中; 同一key并发未命中时各自签发, 后写入的覆盖先写入的
+        expires_at = now + self.ttl
+        token = RtcTokenBuilder.buildTokenWithUid(
+            self.app_id, self.app_certificate, key[0], key[1], key[2], expires_at
+        )
+        with self._lock:
+            self._tokens[key] = (token, expires_at)
+            self._tokens.move_to_end(key)
+            while len(self._tokens) > self.max_entries:
+                self._tokens.popitem(last=False)
+            self.issued += 1
+            return token, expires_at
+
+    def stats(self):
+        return {
+            'entries': len(self._tokens),
+            'hits': self.hits,
+            'issued': self.issued
+        }
+
+
+class RoomCache:
+    """
+    房间是否存在(且未关闭)的缓存: 存在的结果缓存positive_ttl秒, 不存在的只缓存negative_ttl秒,
+    其他worker新建的房间很快就能查到。本进程修改房间时调用invalidate立即生效,
+    其他worker最多在positive_ttl秒后看到房间关闭
+    """
+
+    def __init__(self, db, positive_ttl=60.0, negative_ttl=5.0, max_entries=100000):
+        self.db = db
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._rooms = OrderedDict()  # room_id -> (是否存在, 过期时间)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def exists(self, room_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._rooms.get(room_id)
+            if entry is not None and entry[1] > now:
+                self._rooms.move_to_end(room_id)
+                self.hits += 1
+                return entry[0]
+        self.misses += 1
+
+        found = self.db.query_one(
+            "SELECT 1 FROM rooms WHERE id = ? AND status = 'active'", (room_id,)
+        ) is not None
+        self._store(room_id, found, now + (self.positive_ttl if found else self.negative_ttl))
+        return found
+
+    def add(self, room_id):
+        self._store(room_id, True, time.monotonic() + self.positive_ttl)
+
+    def invalidate(self, room_id):
+        with self._lock:
+            self._rooms.pop(room_id, None)
+
+    def _store(self, room_id, found, expires_at):
+        with self._lock:
+            self._rooms[room_id] = (found, expires_at)
+            self._rooms.move_to_end(room_id)
+            while len(self._rooms) > self.max_entries:
+                self._rooms.popitem(last=False)
+
+    def stats(self):
+        return {
+            'entries': len(self._rooms),
+            'hits': self.hits,
+            'misses': self.misses
+        }
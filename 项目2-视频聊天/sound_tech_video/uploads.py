@@ -0,0 +1,322 @@
+import hashlib
+import os
+import time
+import uuid
+from collections import namedtuple
+
+
+# complete()认领成功的上传, recording_id是预先分配的录制ID
+ClaimedUpload = namedtuple('ClaimedUpload', ['upload_id', 'room_id', 'file_path', 'extension', 'size', 'sha256', 'recording_id'])
+
+
+class UploadError(Exception):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class UploadCompleted(Exception):
+    """上传已由另一个请求完成, recording_id为生成的录制"""
+
+    def __init__(self, recording_id):
+        super().__init__(f'Upload already completed as recording {recording_id}')
+        self.recording_id = recording_id
+
+
+def merge_ranges(ranges):
+    """
+    [(offset, length), ...] -> 合并后的[[start, end), ...]
+    """
+    merged = []
+    for offset, length in sorted(ranges):
+        end = offset + length
+        if merged and offset <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([offset, end])
+    return merged
+
+
+def missing_ranges(merged, size):
+    missing, position = [], 0
+    for start, end in merged:
+        if start > position:
+            missing.append([position, start])
+        position = max(position, end)
+    if position < size:
+        missing.append([position, size])
+    return missing
+
+
+class ChunkedUploads:
+    """
+    可续传的分片上传: 创建时预分配目标文件, 各分片按偏移直接写入(可并行), 完成时校验完整性
+
+    分片数据从请求流直接pwrite到目标文件, 不经过临时文件; 写入期间在upload_writes登记,
+    complete()只在没有进行中的写入时认领, 避免校验和移动文件时还有分片在写
+    """
+
+    COPY_BUFFER = 1024 * 1024
+
+    def __init__(self, db, folder, chunk_size=8 * 1024 * 1024, max_size=4 * 1024 ** 3, expiry=24 * 3600,
+                 complete_wait=30.0, write_timeout=600.0):
+        self.db = db
+        self.folder = folder
+        self.chunk_size = chunk_size
+        self.max_size = max_size
+        self.expiry = expiry
+        self.complete_wait = complete_wait  # 并发完成同一上传时, 后到的请求等待先到的请求结束的秒数
+        self.write_timeout = write_timeout  # 超过该秒数的写入登记视为已中断(进程退出), 不再阻止完成
+        self._last_cleanup = 0.0
+
+    def init_schema(self):
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS uploads (
+                id TEXT PRIMARY KEY,
+                room_id TEXT NOT NULL,
+                user_id TEXT,
+                file_path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                sha256 TEXT,
+                created_at REAL NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                recording_id TEXT
+            );
+            CREATE TABLE IF NOT EXISTS upload_chunks (
+                upload_id TEXT NOT NULL,
+                chunk_offset INTEGER NOT NULL,
+                chunk_length INTEGER NOT NULL,
+                PRIMARY KEY (upload_id, chunk_offset)
+            );
+            CREATE TABLE IF NOT EXISTS upload_writes (
+                id INTEGER PRIMARY KEY,
+                upload_id TEXT NOT NULL,
+                started_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_uploads_created ON uploads (created_at);
+            CREATE INDEX IF NOT EXISTS idx_upload_writes_upload ON upload_writes (upload_id);
+        ''')
+        # 旧库补充完成状态列: pending(接收分片) / completing(某个请求正在完成) / completed
+        columns = {row[1] for row in self.db.query_all('PRAGMA table_info(uploads)')}
+        if 'status' not in columns:
+            self.db.execute("ALTER TABLE uploads ADD COLUMN status TEXT NOT NULL DEFAULT 'pending'")
+        if 'recording_id' not in columns:
+            self.db.execute('ALTER TABLE uploads ADD COLUMN recording_id TEXT')
+
+    def _get(self, upload_id):
+        row = self.db.query_one(
+            'SELECT id, room_id, user_id, file_path, size, sha256, created_at, status FROM uploads WHERE id = ?',
+            (upload_id,)
+        )
+        if row is None:
+            raise UploadError('Upload not found', 404)
+        return row
+
+    def initiate(self, extension, size, room_id, user_id=None, sha256=None):
+        # 顺带清理过期的未完成上传, 最多每小时一次
+        if time.time() - self._last_cleanup > 3600:
+            self._last_cleanup = time.time()
+            self.cleanup_expired()
+        if size < 0 or size > self.max_size:
+            raise UploadError(f'Invalid size, maximum is {self.max_size} bytes')
+        upload_id = uuid.uuid4().hex
+        os.makedirs(self.folder, exist_ok=True)
+        file_path = os.path.join(self.folder, f'{upload_id}.{extension}.part')
+
+        # 预分配空间, 分片可以按任意顺序写入; 不支持fallocate的文件系统退化为稀疏文件
+        fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            if size and hasattr(os, 'posix_fallocate'):
+                try:
+                    os.posix_fallocate(fd, 0, size)
+                except OSError:
+                    os.ftruncate(fd, size)
+            else:
+                os.ftruncate(fd, size)
+        finally:
+            os.close(fd)
+
+        self.db.execute(
+            'INSERT INTO uploads (id, room_id, user_id, file_path, size, sha256, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (upload_id, room_id, user_id, file_path, size, sha256.lower() if sha256 else None, time.time())
+        )
+        return {'upload_id': upload_id, 'size': size, 'chunk_size': self.chunk_size}
+
+    def write_chunk(self, upload_id, offset, length, stream, chunk_sha256=None):
+        """
+        把请求流中的length字节写到offset处; 给出chunk_sha256时边写边校验, 不一致则不登记该分片
+        """
+        _, _, _, file_path, size, _, _, _ = self._get(upload_id)
+        if offset < 0 or length <= 0 or offset + length > size:
+            raise UploadError(f'Chunk [{offset}, {offset + length}) is outside the file (size {size})', 416)
+
+        write_id = self._begin_write(upload_id)
+        try:
+            digest = hashlib.sha256() if chunk_sha256 else None
+            fd = os.open(file_path, os.O_WRONLY)
+            try:
+                position, remaining = offset, length
+                while remaining > 0:
+                    data = stream.read(min(self.COPY_BUFFER, remaining))
+                    if not data:
+                        break
+                    os.pwrite(fd, data, position)
+                    if digest is not None:
+                        digest.update(data)
+                    position += len(data)
+                    remaining -= len(data)
+            finally:
+                os.close(fd)
+
+            if remaining:
+                raise UploadError(f'Incomplete chunk: expected {length} bytes, got {length - remaining}')
+            if digest is not None and digest.hexdigest() != chunk_sha256.lower():
+                raise UploadError('Chunk checksum mismatch', 422)
+
+            # 只给仍在接收分片的上传登记, 和注销写入在同一事务中; 同一偏移重发较短的分片时保留较长的区间
+            with self.db.transaction() as conn:
+                recorded = conn.execute(
+                    '''INSERT INTO upload_chunks (upload_id, chunk_offset, chunk_length)
+                       SELECT ?, ?, ? WHERE EXISTS (SELECT 1 FROM uploads WHERE id = ? AND status = 'pending')
+                       ON CONFLICT (upload_id, chunk_offset) DO UPDATE
+                       SET chunk_length = max(chunk_length, excluded.chunk_length)''',
+                    (upload_id, offset, length, upload_id)
+                ).rowcount
+                conn.execute('DELETE FROM upload_writes WHERE id = ?', (write_id,))
+            write_id = None
+            if not recorded:
+                raise UploadError('Upload is already completed', 409)
+        finally:
+            if write_id is not None:
+                self.db.execute('DELETE FROM upload_writes WHERE id = ?', (write_id,))
+        return self.status(upload_id)
+
+    def _begin_write(self, upload_id):
+        """
+        登记一个进行中的分片写入, 返回登记id; 上传已不在pending状态时拒绝
+        """
+        with self.db.transaction() as conn:
+            row = conn.execute('SELECT status FROM uploads WHERE id = ?', (upload_id,)).fetchone()
+            if row is None:
+                raise UploadError('Upload not found', 404)
+            if row[0] != 'pending':
+                raise UploadError('Upload is already completed', 409)
+            return conn.execute(
+                'INSERT INTO upload_writes (upload_id, started_at) VALUES (?, ?)', (upload_id, time.time())
+            ).lastrowid
+
+    def status(self, upload_id):
+        _, room_id, _, _, size, _, _, _ = self._get(upload_id)
+        chunks = self.db.query_all('SELECT chunk_offset, chunk_length FROM upload_chunks WHERE upload_id = ?', (upload_id,))
+        received = merge_ranges(chunks)
+        return {
+            'upload_id': upload_id,
+            'room_id': room_id,
+            'size': size,
+            'bytes_received': sum(end - start for start, end in received),
+            'received': received,
+            'missing': missing_ranges(received, size)
+        }
+
+    def complete(self, upload_id, sha256=None):
+        """
+        所有区间都到齐后认领上传并校验SHA-256, 返回ClaimedUpload; 调用方用其中的recording_id生成录制,
+        在同一事务中调用finish(), 失败时调用release()退回。
+        认领是条件UPDATE, 并发完成同一上传时只有一个请求成功, 其余请求等它结束后抛出UploadCompleted
+        """
+        _, room_id, _, part_path, size, expected, _, state = self._get(upload_id)
+        if state != 'pending':
+            raise self._wait_completed(upload_id)
+        status = self.status(upload_id)
+        if status['missing']:
+            raise UploadError(f"Upload incomplete, missing {status['missing'][:10]}", 409)
+
+        recording_id = str(uuid.uuid4())
+        with self.db.transaction() as conn:
+            writing = conn.execute(
+                'SELECT 1 FROM upload_writes WHERE upload_id = ? AND started_at > ? LIMIT 1',
+                (upload_id, time.time() - self.write_timeout)
+            ).fetchone()
+            if writing:
+                raise UploadError('Chunks are still being written', 409)
+            claimed = conn.execute(
+                "UPDATE uploads SET status = 'completing', recording_id = ? WHERE id = ? AND status = 'pending'",
+                (recording_id, upload_id)
+            ).rowcount
+        if not claimed:
+            raise self._wait_completed(upload_id)
+
+        try:
+            digest = hashlib.sha256()
+            with open(part_path, 'rb') as f:
+                for block in iter(lambda: f.read(self.COPY_BUFFER), b''):
+                    digest.update(block)
+            actual = digest.hexdigest()
+            for claimed_sha256 in (expected, sha256):
+                if claimed_sha256 and claimed_sha256.lower() != actual:
+                    raise UploadError('File checksum mismatch', 422)
+        except BaseException:
+            self.release(upload_id)
+            raise
+
+        extension = part_path[:-len('.part')].rsplit('.', 1)[-1]
+        return ClaimedUpload(upload_id, room_id, part_path, extension, size, actual, recording_id)
+
+    def finish(self, conn, upload_id):
+        """
+        在调用方写入录制记录的事务中把上传标记为已完成; 记录保留到过期清理, 重复的完成请求返回同一个录制
+        """
+        conn.execute("UPDATE uploads SET status = 'completed' WHERE id = ?", (upload_id,))
+        conn.execute('DELETE FROM upload_chunks WHERE upload_id = ?', (upload_id,))
+
+    def release(self, upload_id):
+        """
+        完成失败(包括录制已写入但文件放置失败而被撤销)时退回pending, 客户端可以补传分片后重试
+        """
+        self.db.execute(
+            "UPDATE uploads SET status = 'pending', recording_id = NULL WHERE id = ? AND status != 'pending'",
+            (upload_id,)
+        )
+
+    def _wait_completed(self, upload_id):
+        """
+        等待正在完成该上传的请求结束, 返回要抛出的异常: 成功时为UploadCompleted
+        """
+        deadline = time.monotonic() + self.complete_wait
+        while True:
+            row = self.db.query_one('SELECT status, recording_id FROM uploads WHERE id = ?', (upload_id,))
+            if row is None:
+                return UploadError('Upload not found', 404)
+            state, recording_id = row
+            if state == 'completed':
+                return UploadCompleted(recording_id)
+            if state == 'pending':
+                return UploadError('Upload completion failed, please retry', 409)
+            if time.monotonic() >= deadline:
+                return UploadError('Upload is being completed by another request', 409)
+            time.sleep(0.1)
+
+    def abort(self, upload_id, force=False):
+        _, _, _, file_path, _, _, _, state = self._get(upload_id)
+        if state == 'completing' and not force:
+            raise UploadError('Upload is being completed', 409)
+        with self.db.transaction() as conn:
+            conn.execute('DELETE FROM upload_chunks WHERE upload_id = ?', (upload_id,))
+            conn.execute('DELETE FROM upload_writes WHERE upload_id = ?', (upload_id,))
+            conn.execute('DELETE FROM uploads WHERE id = ?', (upload_id,))
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+
+    def cleanup_expired(self):
+        """
+        删除超过expiry的上传记录(未完成的同时删除已写入的数据), 返回删除数量
+        """
+        rows = self.db.query_all('SELECT id FROM uploads WHERE created_at < ?', (time.time() - self.expiry,))
+        for (upload_id,) in rows:
+            try:
+                self.abort(upload_id, force=True)
+            except UploadError:
+                pass
+        return len(rows)